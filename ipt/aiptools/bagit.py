@@ -47,31 +47,356 @@ creates a manifest file manifest-md5.txt with lines:
     348a671d663cef32d44a49ed8485efa7 data/my_packge/images/other.txt
 """
 
+import hashlib
+import io
 import os
+import random
+import re
+import secrets
+import tarfile
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
 
-from file_scraper.utils import hexdigest
+from ipt.fixity.hashing import DEFAULT_BUFFER_SIZE, HashingReader, \
+    hexdigests, normalize_algorithm
+from ipt.utils import ensure_binary, ensure_text, ordered_map
 
-from ipt.utils import ensure_binary
+# Prefix of temporary files written to the bagit directory. These are not
+# included in manifests.
+TEMPORARY_PREFIX = b'.tmp-'
+
+# Names of payload manifests and tag manifests, e.g. manifest-sha512.txt,
+# and names of algorithms allowed in them
+MANIFEST_NAME = re.compile(rb'(tag)?manifest-[a-z0-9]+\.txt')
+MANIFEST_ALGORITHM = re.compile(r'[a-z0-9]+')
+
+# Manifests of exported tar archives are kept in memory up to this size
+MANIFEST_SPOOL_SIZE = 16 * 1024 * 1024
+
+BAGIT_TXT = b'BagIt-Version: 0.97\nTag-File-Character-Encoding: UTF-8\n'
 
 
 class BagitError(Exception):
     """Raised when plugin encounters unrecoverable error"""
 
 
-def make_manifest(bagit_dir):
+def make_manifest(bagit_dir, known_digests=None, workers=1):
     """This function creates bagit manifest.
-    :bagit_dir: base directory of bagit."""
-    manifest = []
+    :bagit_dir: base directory of bagit.
+    :known_digests: Dictionary of digests of files that have already been
+                    hashed, by path relative to bagit_dir (bytes). The
+                    digests are dictionaries of hex digests by algorithm.
+                    Files with known md5 digests are not read again.
+    :workers: Number of threads used for hashing files.
+    :returns: list of [digest, path] lists sorted by path, so that the
+              manifest is the same regardless of the number of threads."""
+    return list(iter_manifest(bagit_dir, known_digests=known_digests,
+                              workers=workers))
+
+
+def iter_manifest(bagit_dir, known_digests=None, workers=1):
+    """Iterate lines of bagit manifest as files are hashed.
+
+    Only a bounded number of files is hashed ahead, so memory use does not
+    depend on the number of files in the bag. Pass the result to
+    :func:`write_manifest` to write the manifest as it is created.
+
+    :returns: Iterable over [digest, path] lists sorted by path
+
+    See :func:`make_manifest` for the arguments.
+    """
+    for file_path_in_manifest, digests in iter_manifests(
+            bagit_dir, ['md5'], known_digests=known_digests,
+            workers=workers):
+        yield [digests['md5'], file_path_in_manifest]
+
+
+def iter_manifests(bagit_dir, algorithms, known_digests=None, workers=1):
+    """Iterate lines of bagit manifests of several algorithms.
+
+    Each file is read only once, and all its digests are computed from the
+    same read. Files whose digests are known for all algorithms are not
+    read.
+
+    :algorithms: List of algorithms, e.g. ['md5', 'sha512']
+    :returns: Iterable over tuples (path, digests) sorted by path, where
+              digests is a dictionary of hex digests (bytes) by algorithm
+
+    See :func:`make_manifest` for the other arguments.
+    """
+    algorithms = [normalize_algorithm(algorithm) for algorithm in algorithms]
+    if known_digests is None:
+        known_digests = {}
+
+    def _manifest_lines(item):
+        """Return manifest lines for a file"""
+        path, file_path_in_manifest = item
+        digests = {
+            normalize_algorithm(algorithm): digest for algorithm, digest
+            in known_digests.get(file_path_in_manifest, {}).items()}
+        missing = [algorithm for algorithm in algorithms
+                   if algorithm not in digests]
+        if missing:
+            digests.update(calculate_digests(path, missing))
+        return (file_path_in_manifest,
+                {algorithm: ensure_binary(digests[algorithm])
+                 for algorithm in algorithms})
+
+    return ordered_map(_manifest_lines, iter_bag_files(bagit_dir), workers)
+
+
+def update_manifest(bagit_dir, counts=None, known_digests=None, workers=1):
+    """Update existing bagit manifest incrementally.
+
+    Digests of files listed in manifest-md5.txt are reused for files which
+    have not been modified or replaced after the manifest was written.
+    Other files are hashed, and files no longer in the bag are dropped. As
+    the manifest does not record file sizes, a file is considered changed
+    if its modification or status change time is not older than the
+    manifest. The modification time of a manifest is the time when writing
+    it started, see :func:`write_manifest`, so files changed while the
+    manifest was being written are hashed again.
+
+    :bagit_dir: base directory of bagit.
+    :counts: Dictionary where the numbers of files that are 'new',
+             'changed', 'unchanged', 'deleted' and 'rehashed' compared to
+             the old manifest are stored. The counts are complete once all
+             lines have been iterated.
+    :known_digests: Dictionary of digests of files already hashed, see
+                    :func:`make_manifest`. These take precedence over the
+                    digests in manifest.
+    :workers: Number of threads used for hashing files.
+    :returns: Iterable over manifest lines, see :func:`iter_manifest`
+    """
+    if counts is None:
+        counts = {}
+    manifest_path = os.path.join(ensure_binary(bagit_dir),
+                                 b'manifest-md5.txt')
+    manifest_time = os.stat(manifest_path).st_mtime_ns
+    old_digests = read_manifest(bagit_dir)
+
+    digests = {}
+    rehashed = set()
+    for path, file_path_in_manifest in iter_bag_files(bagit_dir):
+        digest = old_digests.get(file_path_in_manifest)
+        if digest is None:
+            continue
+        stat_result = os.stat(path)
+        if max(stat_result.st_mtime_ns,
+               stat_result.st_ctime_ns) >= manifest_time:
+            rehashed.add(file_path_in_manifest)
+        else:
+            digests[file_path_in_manifest] = {'md5': digest}
+    digests.update(known_digests or {})
+
+    counts.update({'new': 0, 'changed': 0, 'unchanged': 0, 'deleted': 0,
+                   'rehashed': len(rehashed)})
+    for line in iter_manifest(bagit_dir, known_digests=digests,
+                              workers=workers):
+        digest, file_path_in_manifest = line
+        old_digest = old_digests.get(file_path_in_manifest)
+        if old_digest is None:
+            counts['new'] += 1
+        elif old_digest.lower() == digest.lower():
+            counts['unchanged'] += 1
+        else:
+            counts['changed'] += 1
+        yield line
+    counts['deleted'] = len(old_digests) - counts['changed'] - \
+        counts['unchanged']
+
+
+def read_manifest(bagit_dir, algorithm='md5'):
+    """Read bagit manifest.
+
+    :bagit_dir: base directory of bagit.
+    :algorithm: Algorithm in the name of the manifest file.
+    :returns: Dictionary of hex digests by path relative to bagit_dir, both
+              as bytes."""
+    manifest_path = os.path.join(ensure_binary(bagit_dir),
+                                 b'manifest-%s.txt' % ensure_binary(algorithm))
+    digests = {}
+    with open(manifest_path, 'rb') as infile:
+        for line in infile:
+            line = line.rstrip(b'\r\n')
+            if not line:
+                continue
+            try:
+                digest, path = line.split(None, 1)
+            except ValueError:
+                raise BagitError(
+                    f'Invalid line in manifest: {line!r}') from None
+            if path.startswith(b'*'):
+                # Binary mode marker of md5sum
+                path = path[1:]
+            digests[path] = digest
+    return digests
+
+
+def verify_bag(bagit_dir, workers=1, sample=1.0, random_source=None):
+    """Verify files of bagit against all its payload manifests.
+
+    Each file is read once for the digests of all manifests that list it.
+    All listed files are checked to exist and unlisted files are searched
+    for, but only a random sample of the listed files is hashed if sample
+    is less than one. Errors are yielded as soon as they are found, so
+    verification can be stopped at the first error by closing the
+    iterator.
+
+    :bagit_dir: base directory of bagit.
+    :workers: Number of threads used for hashing files.
+    :sample: Fraction of files hashed, between 0 and 1.
+    :random_source: random.Random instance used for sampling.
+    :returns: Iterable over tuples (error, path), where error is
+              'Invalid checksum', 'File does not exist', 'Unreadable file',
+              'Unsupported algorithm' or 'Nonlisted file' and path is
+              relative to bagit_dir as bytes. Files missing from any of the
+              manifests are reported as nonlisted.
+    :raises: BagitError if bagit has no payload manifests.
+    """
+    if not 0 <= sample <= 1:
+        raise ValueError(f'Sample must be between 0 and 1, not {sample}')
+    if random_source is None:
+        random_source = random.Random()
     bagit_dir_bytes = ensure_binary(bagit_dir)
-    for dir_name, _, file_list in os.walk(bagit_dir_bytes):
-        for file_name in file_list:
-            path = os.path.join(dir_name, file_name)
-            # Manifest should be updated, not re-icluded in new manifest
-            if file_name not in [b'manifest-md5.txt', b'bagit.txt']:
-                digest = ensure_binary(calculate_md5(path))
-                file_path_in_manifest = path.split(bagit_dir_bytes + b'/')[1]
-                manifest.append([digest, file_path_in_manifest])
-    return manifest
+    algorithms = manifest_algorithms(bagit_dir)
+    if not algorithms:
+        raise BagitError(f'No payload manifest in {ensure_text(bagit_dir)}')
+    digests = {}
+    for algorithm in algorithms:
+        for file_path_in_manifest, digest in \
+                read_manifest(bagit_dir, algorithm).items():
+            digests.setdefault(file_path_in_manifest, {})[algorithm] = digest
+
+    def _check(item):
+        """Return tuple (error, path) for a listed file, error being None
+        if the file is valid"""
+        file_path_in_manifest, expected, sampled = item
+        path = os.path.join(bagit_dir_bytes, file_path_in_manifest)
+        error = None
+        if not sampled:
+            if not os.path.isfile(path):
+                error = 'File does not exist'
+        else:
+            try:
+                actual = calculate_digests(path, list(expected))
+                if any(ensure_binary(actual[algorithm]).lower() !=
+                       digest.lower()
+                       for algorithm, digest in expected.items()):
+                    error = 'Invalid checksum'
+            except FileNotFoundError:
+                error = 'File does not exist'
+            except OSError:
+                # E.g. a directory or a file without read permission
+                error = 'Unreadable file'
+            except ValueError:
+                # Algorithm of a manifest is not supported by hashlib
+                error = 'Unsupported algorithm'
+        return error, file_path_in_manifest
+
+    items = ((file_path_in_manifest, expected,
+              sample == 1 or random_source.random() < sample)
+             for file_path_in_manifest, expected in digests.items())
+    for error, file_path_in_manifest in ordered_map(_check, items, workers):
+        if error is not None:
+            yield error, file_path_in_manifest
+
+    for _, file_path_in_manifest in iter_bag_files(bagit_dir):
+        if len(digests.get(file_path_in_manifest, ())) != len(algorithms):
+            yield 'Nonlisted file', file_path_in_manifest
+
+
+def manifest_algorithm(algorithm):
+    """Return name of an algorithm for manifest files.
+
+    :algorithm: Algorithm name, e.g. 'MD5' or 'SHA-512'
+    :returns: hashlib algorithm name, e.g. 'md5' or 'sha512'
+    :raises: ValueError if hashlib does not support the algorithm or its
+             name cannot be used in manifest file names
+    """
+    name = normalize_algorithm(algorithm)
+    if not MANIFEST_ALGORITHM.fullmatch(name):
+        raise ValueError(f'Algorithm name {algorithm} is not allowed in '
+                         f'manifest file names')
+    if name not in hashlib.algorithms_available:
+        raise ValueError(f'Unsupported algorithm: {algorithm}')
+    return name
+
+
+def manifest_algorithms(bagit_dir):
+    """Return algorithms of the payload manifests of bagit.
+
+    :bagit_dir: base directory of bagit.
+    :returns: Sorted list of algorithms, e.g. ['md5', 'sha512']
+    """
+    algorithms = []
+    for name in os.listdir(ensure_binary(bagit_dir)):
+        if MANIFEST_NAME.fullmatch(name) and not name.startswith(b'tag'):
+            algorithms.append(ensure_text(name[len(b'manifest-'):-4]))
+    return sorted(algorithms)
+
+
+def remove_manifests(bagit_dir, algorithms=(), manifest_type='manifest'):
+    """Remove manifest files of bagit other than those of given algorithms,
+    so that no stale manifest is left next to the ones written.
+
+    :bagit_dir: base directory of bagit.
+    :algorithms: list of algorithms whose manifest files are kept.
+    :manifest_type: 'manifest' for payload manifests or 'tagmanifest' for
+                    tag manifests.
+    :returns: None"""
+    keep = {ensure_binary(f'{manifest_type}-{normalize_algorithm(algorithm)}'
+                          '.txt') for algorithm in algorithms}
+    prefix = ensure_binary(f'{manifest_type}-')
+    bagit_dir = ensure_binary(bagit_dir)
+    for name in os.listdir(bagit_dir):
+        if MANIFEST_NAME.fullmatch(name) and name.startswith(prefix) and \
+                name not in keep:
+            os.remove(os.path.join(bagit_dir, name))
+
+
+def iter_bag_files(bagit_dir):
+    """Iterate files of bagit in sorted order of their paths.
+
+    The directory tree is traversed so that the files come out sorted by
+    their full paths without collecting all paths first. Manifest files, tag
+    manifest files, bagit.txt and bag-info.txt at the root of bagit are
+    skipped. Files with these names in subdirectories are payload.
+
+    :bagit_dir: base directory of bagit.
+    :returns: Iterable over tuples (path, path relative to bagit_dir) as
+              bytes
+    """
+    return _iter_sorted_files(ensure_binary(bagit_dir), b'')
+
+
+def _iter_sorted_files(directory, prefix):
+    """Recursive generator for iter_bag_files"""
+    entries = []
+    with os.scandir(directory) as scanned:
+        for entry in scanned:
+            if entry.is_dir():
+                # Symbolic links to directories are not followed
+                if not entry.is_symlink():
+                    entries.append((entry.name + b'/', entry))
+            elif not (prefix == b'' and _is_tag_file(entry.name)):
+                entries.append((entry.name, entry))
+    entries.sort(key=lambda item: item[0])
+
+    for name, entry in entries:
+        if name.endswith(b'/'):
+            yield from _iter_sorted_files(entry.path, prefix + name)
+        else:
+            yield entry.path, prefix + name
+
+
+def _is_tag_file(name):
+    """Return True if a file at the root of bagit is not payload: a tag
+    file, a manifest file or a temporary file."""
+    return name in (b'bagit.txt', b'bag-info.txt') or \
+        MANIFEST_NAME.fullmatch(name) is not None or \
+        name.startswith(TEMPORARY_PREFIX)
 
 
 def calculate_md5(file_path):
@@ -80,30 +405,238 @@ def calculate_md5(file_path):
     :file_path: path of file from which the md5sum is calculated.
     :returns: a string with md5-hexdigest.
     """
-    return hexdigest(file_path, algorithm='md5')
+    return calculate_digests(file_path, ['md5'])['md5']
 
 
-def write_manifest(manifest, path):
+def calculate_digests(file_path, algorithms):
+    """Calculate digests of several algorithms with a single read of a file.
+    :file_path: path of file from which the digests are calculated.
+    :algorithms: list of algorithms, e.g. ['md5', 'sha512'].
+    :returns: dictionary of hex digests by algorithm.
+    """
+    return hexdigests(file_path, algorithms)
+
+
+def write_manifest(manifest, path, algorithm='md5'):
     """Write mainfest data list to file.
-    :manifest: list of lists which each contain line in manifest as string.
+
+    Lines are written to a temporary file in the bagit directory as they
+    are iterated, and the file is renamed to manifest-ALG.txt when all lines
+    have been written. An existing manifest is replaced atomically, and
+    it is left untouched if creating the new manifest fails. The
+    modification time of the manifest is set to the time when writing
+    started, i.e. before any file was hashed if the manifest is an
+    iterator, so that :func:`update_manifest` rehashes files changed while
+    the manifest was being written.
+
+    :manifest: list of lists which each contain line in manifest as string,
+               or an iterable over such lists, see :func:`iter_manifest`.
     :path: bagit path where manifest file should be written.
+    :algorithm: algorithm of the digests in the manifest.
     :returns: None"""
-    manifest_path = os.path.join(path, 'manifest-md5.txt')
-    with open(manifest_path, 'wb') as outfile:
+    manifest_path = os.path.join(
+        path, f'manifest-{normalize_algorithm(algorithm)}.txt')
+    with _atomic_file(manifest_path, keep_start_time=True) as outfile:
         for line in manifest:
             outfile.write(
                 b"%s %s\n" % (ensure_binary(line[0]), ensure_binary(line[1])))
 
 
+def write_manifests(manifests, path, algorithms, manifest_type='manifest'):
+    """Write manifest files of several algorithms at once.
+
+    Each manifest file is replaced atomically as in :func:`write_manifest`,
+    once all lines have been written.
+
+    :manifests: iterable over tuples (path in manifest, digests), see
+                :func:`iter_manifests`.
+    :path: bagit path where manifest files should be written.
+    :algorithms: list of algorithms, one manifest file is written for each.
+    :manifest_type: 'manifest' for payload manifests or 'tagmanifest' for
+                    tag manifests.
+    :returns: None"""
+    algorithms = [normalize_algorithm(algorithm) for algorithm in algorithms]
+    with ExitStack() as stack:
+        outfiles = {
+            algorithm: stack.enter_context(_atomic_file(
+                os.path.join(ensure_text(path),
+                             f'{manifest_type}-{algorithm}.txt'),
+                keep_start_time=manifest_type == 'manifest'))
+            for algorithm in algorithms}
+        for file_path_in_manifest, digests in manifests:
+            for algorithm, outfile in outfiles.items():
+                outfile.write(b"%s %s\n" % (
+                    ensure_binary(digests[algorithm]),
+                    ensure_binary(file_path_in_manifest)))
+
+
+def write_tagmanifests(path, algorithms):
+    """Write tag manifest files listing bagit.txt, bag-info.txt and the
+    payload manifest files of bagit. Each tag file is read once for all
+    algorithms.
+
+    :path: bagit path where tag manifest files should be written.
+    :algorithms: list of algorithms, one tag manifest file is written for
+                 each.
+    :returns: None"""
+    path = ensure_binary(path)
+    tag_files = sorted(
+        name for name in os.listdir(path)
+        if name in (b'bagit.txt', b'bag-info.txt') or (
+            MANIFEST_NAME.fullmatch(name) and not name.startswith(b'tag')))
+    manifests = ((name, calculate_digests(os.path.join(path, name),
+                                          algorithms))
+                 for name in tag_files)
+    write_manifests(manifests, path, algorithms, manifest_type='tagmanifest')
+
+
+@contextmanager
+def _atomic_file(path, keep_start_time=False):
+    """Open a temporary file for writing, and rename it to path when the
+    context exits without errors. Otherwise the temporary file is removed.
+
+    :path: Path of the file to be written
+    :keep_start_time: Set modification time of the file to the time it was
+                      opened, as given by the file system clock
+    :returns: Binary file object
+    """
+    temp_path = os.path.join(
+        os.path.dirname(path),
+        ensure_text(TEMPORARY_PREFIX) + os.path.basename(path) + '.' +
+        secrets.token_hex(8))
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        start_time = os.fstat(fd).st_mtime_ns
+        with os.fdopen(fd, 'wb') as outfile:
+            yield outfile
+            outfile.flush()
+            if keep_start_time:
+                os.utime(outfile.fileno(), ns=(start_time, start_time))
+            os.fsync(outfile.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
 def write_bagit_txt(path):
     """Write bagit.txt
     :path: bagit path where bagit.txt file should be written.
     :returns: None
     """
     bagit_path = os.path.join(path, 'bagit.txt')
-    with open(bagit_path, 'w', encoding='utf-8') as outfile:
-        outfile.write(
-            'BagIt-Version: 0.97\nTag-File-Character-Encoding: UTF-8\n')
+    with open(bagit_path, 'wb') as outfile:
+        outfile.write(BAGIT_TXT)
+
+
+def export_tar(bagit_dir, outfile, algorithms=('md5',),
+               buffer_size=DEFAULT_BUFFER_SIZE):
+    """Write bagit as a tar archive, computing manifests on the fly.
+
+    Each payload file is read only once: it is hashed while it is copied
+    into the archive. The manifest files, bag-info.txt if it exists, and
+    bagit.txt are appended as the final members of the archive.
+    Payload-Digest-Source field of bag-info.txt is left out, since all
+    digests are computed from the files. The archive is written as a
+    stream, so outfile can be a pipe. The bagit directory itself is not
+    modified, and existing manifests in it are not used. Manifest lines are
+    collected in temporary files, which are kept in memory while they are
+    small.
+
+    Members are stored in a directory named after the bagit directory.
+
+    :bagit_dir: base directory of bagit.
+    :outfile: binary file object where the archive is written.
+    :algorithms: list of algorithms, one manifest is written for each.
+    :buffer_size: size of the copy buffer in bytes.
+    :returns: None"""
+    algorithms = [normalize_algorithm(algorithm) for algorithm in algorithms]
+    bag_name = os.path.basename(os.path.normpath(ensure_text(bagit_dir)))
+    with ExitStack() as stack:
+        manifests = {
+            algorithm: stack.enter_context(tempfile.SpooledTemporaryFile(
+                max_size=MANIFEST_SPOOL_SIZE))
+            for algorithm in algorithms}
+        tar = stack.enter_context(tarfile.open(
+            fileobj=outfile, mode='w|', copybufsize=buffer_size))
+        for path, file_path_in_manifest in iter_bag_files(bagit_dir):
+            with open(path, 'rb') as infile:
+                tarinfo = tar.gettarinfo(
+                    arcname=os.path.join(
+                        bag_name, os.fsdecode(file_path_in_manifest)),
+                    fileobj=infile)
+                reader = HashingReader(infile, algorithms)
+                tar.addfile(tarinfo, reader)
+            for algorithm, digest in reader.hexdigests().items():
+                manifests[algorithm].write(b'%s %s\n' % (
+                    ensure_binary(digest), file_path_in_manifest))
+
+        tag_files = [(f'manifest-{algorithm}.txt', manifest)
+                     for algorithm, manifest in manifests.items()]
+        bag_info_path = os.path.join(ensure_text(bagit_dir), 'bag-info.txt')
+        if os.path.isfile(bag_info_path):
+            # All files are hashed here, so a record of digests taken from
+            # elsewhere does not apply to the manifests of the archive
+            lines = _read_bag_info(bag_info_path, {'Payload-Digest-Source'})
+            if lines:
+                tag_files.append(('bag-info.txt', io.BytesIO(''.join(
+                    line + '\n' for line in lines).encode('utf-8'))))
+        tag_files.append(('bagit.txt', io.BytesIO(BAGIT_TXT)))
+        for name, tag_file in tag_files:
+            tarinfo = tarfile.TarInfo(os.path.join(bag_name, name))
+            tag_file.seek(0, os.SEEK_END)
+            tarinfo.size = tag_file.tell()
+            tarinfo.mtime = time.time()
+            tarinfo.mode = 0o644
+            tag_file.seek(0)
+            tar.addfile(tarinfo, tag_file)
+
+
+def update_bag_info(path, fields):
+    """Update fields of bag-info.txt, keeping other fields as they are.
+
+    The file is created if it does not exist and there are fields to write,
+    and removed if no fields are left.
+
+    :path: bagit path where bag-info.txt file should be written.
+    :fields: dictionary of field values by label. Fields whose value is
+             None are removed.
+    :returns: None
+    """
+    bag_info_path = os.path.join(path, 'bag-info.txt')
+    if os.path.isfile(bag_info_path):
+        lines = _read_bag_info(bag_info_path, fields)
+    elif all(value is None for value in fields.values()):
+        return
+    else:
+        lines = []
+    lines.extend(f'{label}: {value}' for label, value in fields.items()
+                 if value is not None)
+    if not lines:
+        os.remove(bag_info_path)
+        return
+    with _atomic_file(bag_info_path) as outfile:
+        outfile.write(''.join(line + '\n' for line in lines).encode('utf-8'))
+
+
+def _read_bag_info(bag_info_path, labels):
+    """Read lines of bag-info.txt, leaving out the given fields.
+
+    :bag_info_path: path of bag-info.txt file.
+    :labels: labels of the fields left out.
+    :returns: list of lines without line endings
+    """
+    lines = []
+    with open(bag_info_path, encoding='utf-8') as infile:
+        keep = True
+        for line in infile:
+            if not line[:1].isspace():
+                # Lines starting with whitespace continue the value of the
+                # previous field
+                keep = line.split(':', 1)[0].strip() not in labels
+            if keep:
+                lines.append(line.rstrip('\r\n'))
+    return lines
 
 
 def check_directory_is_bagit(bagit_dir):
@@ -119,12 +652,13 @@ def check_directory_is_bagit(bagit_dir):
 
 
 def check_bagit_mandatory_files(bagit_dir):
-    """Verify that mandatory bagit files exist.
+    """Verify that mandatory bagit files exist: bagit.txt and at least one
+    payload manifest file manifest-ALG.txt.
     :bagit_dir: Directory of bagit.
     :returns: 0 if ok, raise BagitError otherwise."""
-    dirs_list = os.listdir(bagit_dir)
-    if not {'manifest-md5.txt', 'bagit.txt'}.issubset(set(dirs_list)):
-        raise BagitError(f"Directory {bagit_dir} "
+    dirs_list = os.listdir(ensure_binary(bagit_dir))
+    if b'bagit.txt' not in dirs_list or not manifest_algorithms(bagit_dir):
+        raise BagitError(f"Directory {ensure_text(bagit_dir)} "
                          "is not bagit format compilant. "
-                         "manifest-md5.txt and bagit.txt should exist.")
+                         "manifest-ALG.txt and bagit.txt should exist.")
     return 0
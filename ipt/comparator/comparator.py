@@ -4,25 +4,41 @@ Module to compare metadata found in mets to metadata scraped by file-scraper.
 
 import json
 
+from ipt.comparator.rules import RULES
 from ipt.utils import (handle_div, synonymize_stream_keys,
                        pair_compatible_list_elements)
 
 
-_ETAL_ALLOWED_KEYS = ('display_aspect_ratio',)
-_AUDIOMD_INTEGER_VALUE_KEYS = ('data_rate',)
-_METS_UNAVAILABLE_VALUES = ('(:unav)', '0')
-_PDF_VERSION_SUBSETS = {'1.4': ('A-1a', 'A-1b'),
-                        '1.7': ('A-2a', 'A-2b', 'A-2u',
-                                'A-3a', 'A-3b', 'A-3u')}
-_KNOWN_UNAV_VERSIONS = {
-    "application/vnd.oasis.opendocument.text": ["1.0", "1.1", "1.2"],
-    "application/vnd.oasis.opendocument.spreadsheet": [
-        "1.0", "1.1", "1.2"],
-    "application/vnd.oasis.opendocument.presentation": [
-        "1.0", "1.1", "1.2"],
-    "application/vnd.oasis.opendocument.graphics": ["1.0", "1.1", "1.2"],
-    "application/vnd.oasis.opendocument.formula": ["1.0", "1.2"],
-}
+class ComparisonError:
+    """
+    Error found in comparison. The compared values are stored as they are,
+    and they are serialized only when the error is rendered as text or in
+    machine-readable form.
+    """
+
+    __slots__ = ('info', 'mets_value', 'scraper_value')
+
+    def __init__(self, info, mets_value, scraper_value):
+        """
+        :info: Description of what failed.
+        :mets_value: Value from mets, may contain metadata_info records.
+        :scraper_value: Value from scraper.
+        """
+        self.info = info
+        self.mets_value = mets_value
+        self.scraper_value = scraper_value
+
+    def __str__(self):
+        """Render error with the compared values as indented JSON."""
+        return self.info + '\nMETS: {},\nScraper: {}\n'.format(
+            json.dumps(self.mets_value, indent=4, default=dict),
+            json.dumps(self.scraper_value, indent=4, default=dict))
+
+    def as_dict(self):
+        """Return error as a dictionary for machine-readable output."""
+        return {'error': self.info,
+                'mets': self.mets_value,
+                'scraper': self.scraper_value}
 
 
 class MetadataComparator:
@@ -41,14 +57,17 @@ class MetadataComparator:
            'audio', 'audio_streams', 'video', 'video_streams')
     """
 
-    def __init__(self, metadata_info, scraper_streams):
+    def __init__(self, metadata_info, scraper_streams, rules=None):
         """Setup the metadata comparator object
 
         :metadata_info: A dictionary containing metadata info parsed from mets.
         :scraper: A scraper object which has conducted file scraping.
+        :rules: ComparisonRules, see :mod:`ipt.comparator.rules`. The
+                default rules are used by default.
         """
         self._metadata_info = metadata_info
         self._scraper_streams = scraper_streams
+        self._rules = rules or RULES
         self._messages = []
         self._errors = []
 
@@ -66,7 +85,11 @@ class MetadataComparator:
 
     def errors(self):
         """Return comparison error messages"""
-        return ['ERROR: ' + err for err in self._errors]
+        return ['ERROR: ' + str(err) for err in self._errors]
+
+    def error_records(self):
+        """Return comparison errors as a list of ComparisonError records"""
+        return list(self._errors)
 
     def result(self):
         """Perform comparison if not already done and return the result."""
@@ -88,11 +111,10 @@ class MetadataComparator:
     def _add_error(self, info, mets_value, scraper_value):
         """
         Add an error describing what failed and which values were
-        compared.
+        compared. The values may contain metadata_info records, which are
+        serialized as dictionaries when the error is rendered.
         """
-        self._errors.append(info + '\nMETS: {},\nScraper: {}\n'.format(
-                            json.dumps(mets_value, indent=4),
-                            json.dumps(scraper_value, indent=4)))
+        self._errors.append(ComparisonError(info, mets_value, scraper_value))
 
     def _get_stream_format(self, stream_index):
         """
@@ -134,7 +156,7 @@ class MetadataComparator:
         if is_textfile:
             self._check_charset()
         if not _compare_mimetype_version(
-                mets_format, scraper_format, is_textfile):
+                mets_format, scraper_format, is_textfile, self._rules):
             self._add_error('Missing or incorrect mimetype/version.',
                             mets_format, scraper_format)
 
@@ -163,7 +185,7 @@ class MetadataComparator:
         scraper_streams = self._prepare_scraper_av_streams(stream_type)
 
         is_match, notes = _match_streams(mets_streams, scraper_streams,
-                                         stream_type)
+                                         stream_type, self._rules)
         if is_match:
             self._messages += notes
         else:
@@ -191,12 +213,12 @@ class MetadataComparator:
             md_info_style_dict = {}
             md_info_style_dict['format'] = \
                 self._get_stream_format(stream['index'])
+            integer_keys = self._rules.lookup(stream['mimetype'],
+                                              stream_type).integer_keys
             _stream = {}
             for key, value in stream.items():
-                decimals = 2  # Round values to two decimals by default
-                if stream_type == 'audio' and \
-                        key in _AUDIOMD_INTEGER_VALUE_KEYS:
-                    decimals = 0
+                # Round values to two decimals by default
+                decimals = 0 if key in integer_keys else 2
                 _stream[key] = handle_div(value, decimals)
             _stream = synonymize_stream_keys(_stream)
             md_info_style_dict[stream_type] = _stream
@@ -221,50 +243,30 @@ class MetadataComparator:
         raise ValueError(f'Invalid stream type {stream_type}')
 
 
-def _harmonized_versions(scraper_format):
+def _harmonized_versions(scraper_format, rules=None):
     """
     Harmonize the set of file format versions found by file-scraper according
     to the specifications of the preservation service, i.e., the values that
     can be found in the METS document.
 
     :scraper_format: Dict with keys 'mimetype' and 'version' (from scraper).
+    :rules: ComparisonRules, the default rules if None.
     :returns: Set of harmonized versions.
     """
-    harmonized_versions = set()
-    # If scraper denotes version as unapplicable, empty string in METS is
-    # expected.
-    if scraper_format['version'] == '(:unap)':
-        harmonized_versions.add('')
-    # If scraper is unable to resolve version, we expect only values from
-    # some file formats in a list.
-    elif scraper_format['version'] in ['(:unav)', None]:
-        # We handle (:unav) version result from Scraper only in known cases.
-        # For other cases we leave harmonized_versions empty, which results
-        # error.
-        if _KNOWN_UNAV_VERSIONS.get(scraper_format['mimetype'], None):
-            harmonized_versions.update(
-                _KNOWN_UNAV_VERSIONS[scraper_format['mimetype']])
-    # In the normal case the version in METS should be the same as the
-    # version scraper found.
-    else:
-        harmonized_versions.add(scraper_format['version'])
-    # PDF file special case:
-    # If scraper finds a version which is a subset of the version given METS,
-    # the more general METS value is allowed (e.g, METS: 1.4, scraper: A-1b)
-    if scraper_format['mimetype'] == 'application/pdf':
-        for super_version, sub_versions in _PDF_VERSION_SUBSETS.items():
-            if scraper_format['version'] in sub_versions:
-                harmonized_versions.add(super_version)
-    return harmonized_versions
-
-
-def _compare_mimetype_version(mets_format, scraper_format, is_textfile=False):
+    rules = rules or RULES
+    return rules.lookup(scraper_format['mimetype']).harmonized_versions(
+        scraper_format['version'])
+
+
+def _compare_mimetype_version(mets_format, scraper_format, is_textfile=False,
+                              rules=None):
     """
     Helper to check if mimetype and version in mets match scraper.
 
     :mets_format: Dict with keys 'mimetype' and 'version' (from mets).
     :scraper_format: Dict with keys 'mimetype' and 'version' (from scraper).
     :is_textfile: True if checking a text file.
+    :rules: ComparisonRules, the default rules if None.
     :returns: True iff mets mimetype and version match what scraper found.
     """
     matching_mimetypes = {scraper_format['mimetype']}
@@ -273,18 +275,22 @@ def _compare_mimetype_version(mets_format, scraper_format, is_textfile=False):
         matching_mimetypes.add('text/plain')
     return all((mets_format['mimetype'] in matching_mimetypes,
                 mets_format['version'] in
-                _harmonized_versions(scraper_format)))
+                _harmonized_versions(scraper_format, rules)))
 
 
-def _match_streams(mets_streams, scraper_streams, stream_type):
+def _match_streams(mets_streams, scraper_streams, stream_type, rules=None):
     """
     Check that mets_streams can be paired perfectly with scraper_streams,
     so that each mets_stream and scraper_stream has a pair, and no stream
     is paired more than once.
 
+    Each pair of streams is compared only once into a compatibility matrix,
+    which is used both for pairing and for the notes of the paired streams.
+
     :mets_streams: List of prepared audio or video streams parsed from mets.
     :scraper_streams: List of prepared audio or video streams from scraper.
     :stream_type: Either 'audio' or 'video'.
+    :rules: ComparisonRules, the default rules if None.
     :returns: (is_match, notes); is_match = True iff all streams were paired
               successfully. Notes is a list of info about values listed as
               (:unav) or 0 in mets but for which scraper found actual values.
@@ -292,56 +298,74 @@ def _match_streams(mets_streams, scraper_streams, stream_type):
     if stream_type not in ('audio', 'video'):
         raise ValueError(f'Invalid stream type {stream_type}')
 
-    def _compare_stream_dicts(mets_stream, scraper_stream):
+    rules = rules or RULES
+    # Rules and versions allowed in mets depend only on the scraper stream
+    stream_rules = [rules.lookup(scraper_stream['format']['mimetype'],
+                                 stream_type)
+                    for scraper_stream in scraper_streams]
+    harmonized_versions = [_harmonized_versions(scraper_stream['format'],
+                                                rules)
+                           for scraper_stream in scraper_streams]
+
+    def _compare_stream_dicts(mets_stream, scraper_idx):
         """
         Helper to check if all key-value pairs in mets_stream can be found in
         scraper_stream, excluding some special cases.
 
         mets_stream: A prepared mets stream dictionary.
-        scraper_stream: A prepared scraper stream dictionary.
-        :returns: True iff mets_stream matches scraper_stream.
+        scraper_idx: Index of a prepared scraper stream dictionary.
+        :returns: None if mets_stream does not match scraper_stream,
+                  otherwise list of (key, mets_value, scraper_value) tuples
+                  of values unavailable in mets but found by scraper.
         """
-        if not _compare_mimetype_version(
-                mets_stream['format'], scraper_stream['format']):
-            return False
-
+        mets_format = mets_stream['format']
+        scraper_stream = scraper_streams[scraper_idx]
+        if mets_format['mimetype'] != \
+                scraper_stream['format']['mimetype'] or \
+                mets_format['version'] not in harmonized_versions[scraper_idx]:
+            return None
+
+        found_values = []
+        scraper_values = scraper_stream[stream_type]
+        comparison_rules = stream_rules[scraper_idx]
         for key, mets_value in mets_stream[stream_type].items():
             try:
-                scraper_value = scraper_stream[stream_type][key]
-                if mets_value == scraper_value:
-                    continue
-                # Check special cases where value mismatch is allowed
-                if mets_value in _METS_UNAVAILABLE_VALUES:
-                    continue
-                if scraper_value == '(:unav)':
-                    continue
-                if mets_value == '(:etal)' and key in _ETAL_ALLOWED_KEYS:
-                    continue
-                return False
+                scraper_value = scraper_values[key]
             except KeyError:
                 # Mets may contain keys that scraper does not find, this is ok
-                pass
-        return True
+                continue
+            if mets_value == scraper_value:
+                continue
+            # Check special cases where value mismatch is allowed
+            if mets_value in comparison_rules.unavailable_values:
+                found_values.append((key, mets_value, scraper_value))
+                continue
+            if scraper_value in comparison_rules.scraper_unavailable_values:
+                continue
+            if mets_value == '(:etal)' and \
+                    key in comparison_rules.etal_keys:
+                continue
+            return None
+        return found_values
+
+    matrix = [[_compare_stream_dicts(mets_stream, scraper_idx)
+               for scraper_idx in range(len(scraper_streams))]
+              for mets_stream in mets_streams]
 
-    index_pairs = pair_compatible_list_elements(mets_streams, scraper_streams,
-                                                _compare_stream_dicts)
+    index_pairs = pair_compatible_list_elements(
+        range(len(mets_streams)), range(len(scraper_streams)),
+        lambda mets_idx, scraper_idx:
+        matrix[mets_idx][scraper_idx] is not None)
 
     if index_pairs:
         # Streams were matched successfully; add message for all cases where
         # mets had an unavailable value, but scraper found an actual value
         notes = []
         for mets_idx, scraper_idx in index_pairs:
-            scraper_stream = scraper_streams[scraper_idx][stream_type]
-            for key, mets_value in \
-                    mets_streams[mets_idx][stream_type].items():
-                try:
-                    scraper_value = scraper_stream[key]
-                    if mets_value != scraper_value and \
-                            mets_value in _METS_UNAVAILABLE_VALUES:
-                        notes.append('Found value for {} -- {}.'.format(
-                            {key: mets_value}, {key: scraper_value}))
-                except KeyError:
-                    pass
+            for key, mets_value, scraper_value in \
+                    matrix[mets_idx][scraper_idx]:
+                notes.append('Found value for {} -- {}.'.format(
+                    {key: mets_value}, {key: scraper_value}))
         return (True, notes)
     # Streams could not be matched (or there were no streams, in which case
     # this function should not have been called at all)
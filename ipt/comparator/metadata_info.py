@@ -0,0 +1,231 @@
+"""
+Compact records for metadata_info.
+
+A metadata_info describes one digital object (or one bitstream inside it) as
+parsed from METS. Validation and fixity checking may keep hundreds of
+thousands of them in memory, so instead of nested dictionaries they are
+stored as slotted records. The records are mappings: they support the same
+dict-style access (``metadata_info['format']['mimetype']``,
+``'audio' in stream``, ``.get()``, ``.pop()``, ``.keys()``) as the plain
+dictionaries and compare equal to dictionaries with the same content.
+
+Memory is saved in three ways:
+
+* Keys every digital object has are stored in slots. Keys only some objects
+  have (e.g. ``'audio'`` or ``'addml'``) are stored in a small dictionary,
+  which is created only when such a key is first set.
+* :class:`Format` records are immutable and shared: all objects with the same
+  file format refer to the same record. To change the format of an object,
+  assign a new value to its ``'format'`` key.
+* Frequently repeated strings, such as checksum algorithms and USE
+  attributes, are interned.
+"""
+
+import sys
+import weakref
+from collections.abc import Mapping, MutableMapping
+
+_MISSING = object()
+
+
+class Format(Mapping):
+    """File format of a digital object or a bitstream.
+
+    Formats are immutable. Use :meth:`from_mapping` to get the shared record
+    for a format.
+    """
+
+    __slots__ = ('_data', '__weakref__')
+
+    _shared = weakref.WeakValueDictionary()
+
+    def __init__(self, *args, **kwargs):
+        self._data = {
+            key: sys.intern(value) if isinstance(value, str) else value
+            for key, value in dict(*args, **kwargs).items()}
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """Return the shared format record with contents of mapping."""
+        if isinstance(mapping, cls):
+            return mapping
+        try:
+            key = tuple(mapping.items())
+            return cls._shared[key]
+        except TypeError:
+            # Unhashable values, formats cannot be shared
+            return cls(mapping)
+        except KeyError:
+            pass
+        record = cls(mapping)
+        cls._shared[key] = record
+        return record
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'Format({self._data!r})'
+
+
+class _Record(MutableMapping):
+    """Base class for slotted metadata records.
+
+    Subclasses list their slotted dictionary keys in ``_keys``. Each key is
+    stored in a slot with the same name. A missing key is an unset slot. If
+    the subclass has an ``_extra`` slot, other keys are stored in a
+    dictionary in that slot.
+    """
+
+    __slots__ = ()
+
+    _keys = frozenset()
+    # Keys whose mapping values are converted to records when set
+    _record_keys = {}
+    # Keys whose values are lists of records
+    _record_list_keys = {}
+    # Keys whose string values are interned, as they are shared by
+    # many records
+    _interned_keys = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        self.update(*args, **kwargs)
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """Return mapping as record of this type, converting if needed."""
+        if isinstance(mapping, cls):
+            return mapping
+        return cls(mapping)
+
+    def _get_extra(self):
+        """Return dictionary of non-slotted keys or None."""
+        return getattr(self, '_extra', None)
+
+    def __getitem__(self, key):
+        if key in self._keys:
+            value = getattr(self, key, _MISSING)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        extra = self._get_extra()
+        if extra is None:
+            raise KeyError(key)
+        return extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self._record_keys and isinstance(value, Mapping):
+            value = self._record_keys[key].from_mapping(value)
+        elif key in self._record_list_keys and isinstance(value, list):
+            record_type = self._record_list_keys[key]
+            value = [record_type.from_mapping(item)
+                     if isinstance(item, Mapping) else item
+                     for item in value]
+        elif key in self._interned_keys and isinstance(value, str):
+            value = sys.intern(value)
+
+        if key in self._keys:
+            setattr(self, key, value)
+            return
+        extra = self._get_extra()
+        if extra is None:
+            try:
+                self._extra = extra = {}
+            except AttributeError:
+                raise KeyError(
+                    f'{type(self).__name__} has no key {key!r}') from None
+        extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._keys:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            return
+        extra = self._get_extra()
+        if extra is None:
+            raise KeyError(key)
+        del extra[key]
+        if not extra:
+            self._extra = None
+
+    def __contains__(self, key):
+        if key in self._keys:
+            return hasattr(self, key)
+        extra = self._get_extra()
+        return extra is not None and key in extra
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if key in self._keys and hasattr(self, key):
+                yield key
+        extra = self._get_extra()
+        if extra:
+            yield from extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+    def to_dict(self):
+        """Return record as nested plain dictionaries and lists."""
+        return _to_plain(self)
+
+
+def _to_plain(value):
+    """Convert records in value recursively to plain dictionaries."""
+    if isinstance(value, Mapping):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+class ObjectId(_Record):
+    """PREMIS object identifier."""
+
+    __slots__ = ('type', 'value')
+
+    _keys = frozenset(__slots__)
+    _interned_keys = frozenset(('type',))
+
+
+class Stream(_Record):
+    """Metadata of a bitstream inside a container file."""
+
+    __slots__ = ('format', 'object_id', '_extra')
+
+    _keys = frozenset(('format', 'object_id'))
+    _record_keys = {'format': Format, 'object_id': ObjectId}
+
+    def __init__(self, *args, **kwargs):
+        self._extra = None
+        super().__init__(*args, **kwargs)
+
+
+class MetadataInfo(_Record):
+    """Metadata of a digital object parsed from METS."""
+
+    __slots__ = ('filename', 'relpath', 'use', 'format', 'object_id',
+                 'algorithm', 'digest', 'size', 'errors', 'spec_version',
+                 '_extra')
+
+    _keys = frozenset(('filename', 'relpath', 'use', 'format', 'object_id',
+                       'algorithm', 'digest', 'size', 'errors',
+                       'spec_version'))
+    _record_keys = {'format': Format, 'object_id': ObjectId}
+    _record_list_keys = {'audio_streams': Stream, 'video_streams': Stream}
+    _interned_keys = frozenset(('use', 'algorithm', 'spec_version'))
+
+    def __init__(self, *args, **kwargs):
+        self._extra = None
+        super().__init__(*args, **kwargs)
@@ -0,0 +1,166 @@
+"""
+Comparison rules for MetadataComparator.
+
+METS metadata is expected to equal the metadata found by file-scraper, with
+exceptions listed in a declarative rule table, :data:`DEFAULT_RULES`. A rule
+applies to the file formats given by its ``mimetype`` key and to the streams
+given by its ``stream_type`` key; a rule without either applies to all of
+them. The table is compiled once into lookup structures for each
+(mimetype, stream_type), so that comparing a file takes only a few dictionary
+lookups. New format exceptions are added as new rules, without changing the
+comparison code.
+
+The other keys of a rule are:
+
+``unavailable_values``
+    Values in METS meaning that the value is unknown. Any value found by
+    scraper is accepted, and a note of it is given.
+``scraper_unavailable_values``
+    Values of scraper meaning that it could not resolve the value. Any value
+    in METS is accepted.
+``etal_keys``
+    Keys for which ``(:etal)`` in METS accepts any value found by scraper.
+``integer_keys``
+    Keys of scraper streams whose values are rounded to integers.
+``unav_versions``
+    Versions accepted in METS when scraper cannot resolve the version.
+``version_subsets``
+    Dictionary of versions accepted in METS by the more specific versions
+    found by scraper, e.g. PDF 1.4 when scraper finds PDF/A-1b.
+"""
+
+_ODF_VERSIONS = ['1.0', '1.1', '1.2']
+
+DEFAULT_RULES = [
+    {'unavailable_values': ['(:unav)', '0'],
+     'scraper_unavailable_values': ['(:unav)'],
+     'etal_keys': ['display_aspect_ratio']},
+    {'stream_type': 'audio',
+     'integer_keys': ['data_rate']},
+    {'mimetype': 'application/pdf',
+     'version_subsets': {'1.4': ['A-1a', 'A-1b'],
+                         '1.7': ['A-2a', 'A-2b', 'A-2u',
+                                 'A-3a', 'A-3b', 'A-3u']}},
+    {'mimetype': 'application/vnd.oasis.opendocument.text',
+     'unav_versions': _ODF_VERSIONS},
+    {'mimetype': 'application/vnd.oasis.opendocument.spreadsheet',
+     'unav_versions': _ODF_VERSIONS},
+    {'mimetype': 'application/vnd.oasis.opendocument.presentation',
+     'unav_versions': _ODF_VERSIONS},
+    {'mimetype': 'application/vnd.oasis.opendocument.graphics',
+     'unav_versions': _ODF_VERSIONS},
+    {'mimetype': 'application/vnd.oasis.opendocument.formula',
+     'unav_versions': ['1.0', '1.2']},
+]
+
+_SELECTOR_KEYS = ('mimetype', 'stream_type')
+# Compared values may be unhashable, so they are kept in tuples
+_VALUE_KEYS = ('unavailable_values', 'scraper_unavailable_values')
+_SET_KEYS = ('etal_keys', 'integer_keys', 'unav_versions')
+
+
+class FormatRules:
+    """Rules compiled for one (mimetype, stream_type)."""
+
+    __slots__ = ('unavailable_values', 'scraper_unavailable_values',
+                 'etal_keys', 'integer_keys', 'unav_versions',
+                 '_version_supersets', '_harmonized_versions')
+
+    def __init__(self, rules):
+        """Merge rules that apply to the same mimetype and stream type.
+
+        :rules: List of rule dictionaries, see :data:`DEFAULT_RULES`
+        """
+        for key in _VALUE_KEYS:
+            setattr(self, key, tuple(dict.fromkeys(
+                value for rule in rules for value in rule.get(key, ()))))
+        for key in _SET_KEYS:
+            setattr(self, key, frozenset(
+                value for rule in rules for value in rule.get(key, ())))
+        supersets = {}
+        for rule in rules:
+            for super_version, sub_versions in \
+                    rule.get('version_subsets', {}).items():
+                for sub_version in sub_versions:
+                    supersets.setdefault(sub_version, set()).add(
+                        super_version)
+        self._version_supersets = supersets
+        self._harmonized_versions = {}
+
+    def harmonized_versions(self, version):
+        """
+        Harmonize the file format version found by file-scraper according to
+        the specifications of the preservation service, i.e., the values that
+        can be found in the METS document.
+
+        :version: Version found by scraper
+        :returns: Frozen set of harmonized versions
+        """
+        try:
+            return self._harmonized_versions[version]
+        except KeyError:
+            pass
+        # If scraper denotes version as unapplicable, empty string in METS
+        # is expected.
+        if version == '(:unap)':
+            versions = {''}
+        # If scraper is unable to resolve version, we expect only values
+        # from some file formats in a list. For other formats no version is
+        # accepted.
+        elif version in ('(:unav)', None):
+            versions = set(self.unav_versions)
+        # In the normal case the version in METS should be the same as the
+        # version scraper found.
+        else:
+            versions = {version}
+        # If scraper finds a version which is a subset of the version given
+        # in METS, the more general METS value is allowed.
+        versions.update(self._version_supersets.get(version, ()))
+        return self._harmonized_versions.setdefault(version,
+                                                    frozenset(versions))
+
+
+class ComparisonRules:
+    """Rule table compiled into lookup structures by mimetype and stream
+    type."""
+
+    def __init__(self, rules):
+        """Compile rule table.
+
+        :rules: List of rule dictionaries, see :data:`DEFAULT_RULES`
+        :raises: ValueError if a rule has unknown keys
+        """
+        known_keys = set(_SELECTOR_KEYS + _VALUE_KEYS + _SET_KEYS +
+                         ('version_subsets',))
+        for rule in rules:
+            unknown_keys = set(rule) - known_keys
+            if unknown_keys:
+                raise ValueError('Unknown keys in comparison rule: {}'.format(
+                    ', '.join(sorted(unknown_keys))))
+        self._rules = list(rules)
+        self._compiled = {}
+        # Formats and streams named in the table are compiled up front, any
+        # others when they are first looked up
+        for rule in self._rules:
+            self.lookup(rule.get('mimetype'), rule.get('stream_type'))
+
+    def lookup(self, mimetype=None, stream_type=None):
+        """Return rules for a file format and stream type.
+
+        :mimetype: Mimetype of the file or stream
+        :stream_type: Stream type, e.g. 'audio' or 'video', or None for the
+                      rules of the file format only
+        :returns: FormatRules
+        """
+        key = (mimetype, stream_type)
+        try:
+            return self._compiled[key]
+        except KeyError:
+            pass
+        rules = [rule for rule in self._rules
+                 if rule.get('mimetype') in (None, mimetype) and
+                 rule.get('stream_type') in (None, stream_type)]
+        return self._compiled.setdefault(key, FormatRules(rules))
+
+
+RULES = ComparisonRules(DEFAULT_RULES)
@@ -5,7 +5,8 @@ import os
 import mets
 import premis
 
-from ipt.utils import merge_dicts, uri_to_path, parse_mimetype
+from ipt.utils import merge_into, uri_to_path, parse_mimetype
+from ipt.comparator.metadata_info import MetadataInfo, Stream
 import ipt.addml.addml
 import ipt.videomd.videomd
 import ipt.audiomd.audiomd
@@ -13,55 +14,68 @@ from ipt.xml.mets import parse_spec_version
 from ipt.utils import ensure_text
 
 
+# Parsers for mdWrap elements by their OTHERMDTYPE and MDTYPE attributes.
+# Parsers are registered with register_md_parser().
+_OTHER_MD_PARSERS = {}
+_MD_PARSERS = {}
+
+
+def register_md_parser(parser, mdtype=None, othermdtype=None):
+    """Register a metadata parser for mdWrap elements of given type.
+
+    The parser is called with the contents of the xmlData element of a
+    matching mdWrap and it must return a metadata_info dictionary. If the
+    mdWrap has the OTHERMDTYPE attribute, only parsers registered with
+    `othermdtype` are considered.
+
+    :parser: Parser function
+    :mdtype: Value of the MDTYPE attribute, e.g. 'PREMIS:OBJECT'
+    :othermdtype: Value of the OTHERMDTYPE attribute, e.g. 'ADDML'
+    :returns: parser
+    """
+    if othermdtype is not None:
+        _OTHER_MD_PARSERS[othermdtype] = parser
+    elif mdtype is not None:
+        _MD_PARSERS[mdtype] = parser
+    else:
+        raise ValueError('Either mdtype or othermdtype must be given')
+    return parser
+
+
+def md_parser(mdwrap_element):
+    """Return the registered metadata parser for mdWrap element.
+
+    Only the attributes of the mdWrap are read, so looking up metadata
+    types that are not used in validation costs next to nothing.
+
+    :mdwrap_element: mdWrap element as ElementTree object
+    :returns: Parser function or None if the metadata type is not supported
+    """
+    wraptype = mets.parse_wrap_mdtype(mdwrap_element)
+    if wraptype['othermdtype'] is not None:
+        return _OTHER_MD_PARSERS.get(wraptype['othermdtype'])
+    return _MD_PARSERS.get(wraptype['mdtype'])
+
+
 def mdwrap_to_metadata_info(mdwrap_element):
     """Extract metadata_info dict from mdwrap element.
 
-    TODO: This should be implemented in metadata-parser classes, similar
-    implementation is already working with digital object validators::
-
-        class MdParser:
-            def is_supported(mdwrap_object):
-                ...
-            def from_xmldata(elementtree_object):
-                ...
-            def to_json():
-                ...
-
-        def md_to_metadata_info():
-            parsers [ MdParser, ... ]
-            for parser in parsers:
-                if not MdParser.is_supported(mdwrap):
-                    continue
-                merge_dict(
-                    metadata_info,
-                    MdParser().from_xmldata(mdwrap.xmldata).to_json())
+    The contents of xmlData are extracted only for metadata types that have
+    a registered parser, see :func:`register_md_parser`.
 
     :mdwrap: mdWrap element as ElementTree object
-    :returns: Metadata parser function for the mdWrap element
+    :returns: metadata_info dict, empty if the metadata type is not
+              supported or the parser does not find the metadata it needs
 
     """
     if mdwrap_element is None:
         return {}
 
-    wraptype = mets.parse_wrap_mdtype(mdwrap_element)
-    mdtype = wraptype['mdtype']
-    othermdtype = wraptype['othermdtype']
-
-    standard_parsers = {
-        'PREMIS:OBJECT': premis_to_dict
-    }
-
-    other_parsers = {
-        'ADDML': ipt.addml.addml.to_dict,
-        'VideoMD': ipt.videomd.videomd.to_dict,
-        'AudioMD': ipt.audiomd.audiomd.to_dict
-    }
-
+    parser = md_parser(mdwrap_element)
+    if parser is None:
+        return {}
     try:
-        if othermdtype is not None:
-            return other_parsers[othermdtype](
-                mets.parse_xmldata(mdwrap_element))
-        return standard_parsers[mdtype](mets.parse_xmldata(mdwrap_element))
+        return parser(mets.parse_xmldata(mdwrap_element))
     except KeyError:
         return {}
 
@@ -81,12 +95,12 @@ def create_metadata_info(mets_tree, element, object_filename, relpath, use,
     :object_type: type of object, i.e. a 'file' or a 'bitstream'
     :spec_version: National specification version
 
-    :returns: metadata_info as a dict
+    :returns: metadata_info as a MetadataInfo record for files or a Stream
+              record for bitstreams
     """
 
-    metadata_info = {}
     if object_type == 'file':
-        metadata_info = {
+        metadata_info = MetadataInfo({
             'filename': object_filename,
             'relpath': relpath,
             'use': use,
@@ -96,24 +110,25 @@ def create_metadata_info(mets_tree, element, object_filename, relpath, use,
                           'value': None},
             'algorithm': None,
             'digest': None,
+            'size': None,
             'errors': None,
             'spec_version': spec_version
-        }
+        })
     elif object_type == 'bitstream':
-        metadata_info = {
+        metadata_info = Stream({
             'format': {'mimetype': None,
                        'version': None}
-        }
-    sections = ', '.join(mets.parse_admid(element))
-    for section in mets.iter_elements_with_id(mets_tree,
-                                              mets.parse_admid(element),
-                                              "amdSec"):
+        })
+    else:
+        metadata_info = Stream()
+    admids = mets.parse_admid(element)
+    for section in mets.iter_elements_with_id(mets_tree, admids, "amdSec"):
         if section is not None:
             try:
-                metadata_info = merge_dicts(
-                    metadata_info, mdwrap_to_metadata_info(
-                        mets.parse_mdwrap(section)))
+                merge_into(metadata_info, mdwrap_to_metadata_info(
+                    mets.parse_mdwrap(section)))
             except TypeError as exception:
+                sections = ', '.join(admids)
                 metadata_info["errors"] = (str(exception) + ' Duplicate or '
                                            'conflicting values detected when '
                                            'merging metadata from '
@@ -123,12 +138,13 @@ def create_metadata_info(mets_tree, element, object_filename, relpath, use,
 
 def iter_metadata_info(mets_tree, mets_path):
     """Iterate all files in given mets document and return metadata_info
-    dictionary for each file and bitstream.
+    record for each file. Bitstreams of the file are listed in the
+    'audio_streams' and 'video_streams' keys of the record.
 
     :mets_tree: metadata in mets xml format
     :mets_path: path to the mets document
 
-    :returns: Iterable on metadata_info dictionaries
+    :returns: Iterable on MetadataInfo records
 
     """
     spec_version = parse_spec_version(mets_tree.getroot())
@@ -151,8 +167,8 @@ def iter_metadata_info(mets_tree, mets_path):
             spec_version=spec_version
         )
 
-        metadata_info['audio_streams'] = []
-        metadata_info['video_streams'] = []
+        audio_streams = []
+        video_streams = []
         for stream_elem in mets.parse_streams(element):
 
             stream_info = create_metadata_info(
@@ -160,14 +176,14 @@ def iter_metadata_info(mets_tree, mets_path):
                 object_filename=object_filename, relpath=relpath, use=use,
                 object_type='bitstream', spec_version=spec_version)
             if 'audio' in stream_info:
-                metadata_info['audio_streams'].append(stream_info)
+                audio_streams.append(stream_info)
             elif 'video' in stream_info:
-                metadata_info['video_streams'].append(stream_info)
+                video_streams.append(stream_info)
 
-        if not metadata_info['audio_streams']:
-            metadata_info.pop('audio_streams')
-        if not metadata_info['video_streams']:
-            metadata_info.pop('video_streams')
+        if audio_streams:
+            metadata_info['audio_streams'] = audio_streams
+        if video_streams:
+            metadata_info['video_streams'] = video_streams
 
         yield metadata_info
 
@@ -200,6 +216,7 @@ def premis_to_dict(premis_xml):
     if object_type.endswith('file'):
         (premis_dict["algorithm"],
          premis_dict["digest"]) = premis.parse_fixity(premis_xml)
+        premis_dict["size"] = parse_premis_size(premis_xml)
     (format_name, format_version) = premis.parse_format(premis_xml)
     premis_dict.update(parse_mimetype(format_name))
     if format_version is None:
@@ -208,3 +225,23 @@ def premis_to_dict(premis_xml):
         premis_dict["format"]["version"] = format_version
 
     return premis_dict
+
+
+def parse_premis_size(premis_xml):
+    """Parse file size from PREMIS objectCharacteristics.
+
+    :premis_xml: lxml.etree object containing PREMIS object of a file
+    :returns: Size in bytes as integer, or None if size is not given
+    """
+    size = premis_xml.findtext('/'.join(
+        (premis.premis_ns('objectCharacteristics'), premis.premis_ns('size'))))
+    try:
+        return int(size)
+    except (TypeError, ValueError):
+        return None
+
+
+register_md_parser(premis_to_dict, mdtype='PREMIS:OBJECT')
+register_md_parser(ipt.addml.addml.to_dict, othermdtype='ADDML')
+register_md_parser(ipt.videomd.videomd.to_dict, othermdtype='VideoMD')
+register_md_parser(ipt.audiomd.audiomd.to_dict, othermdtype='AudioMD')
@@ -0,0 +1,4 @@
+"""
+Library for checking fixity of files in information packages
+
+"""
@@ -0,0 +1,169 @@
+"""
+Reading SIPs packaged as tar or zip archives without extracting them.
+
+The SIP may be at the root of the archive or inside a single directory. The
+directory containing the shallowest mets.xml is taken as the root of the SIP
+and the paths of the other members are given relative to it. Members outside
+the root are ignored.
+
+Members are listed before any of them is read, because the root of the SIP
+and mets.xml must be known before the files are hashed. For zip archives the
+list is read from the central directory and for uncompressed tar archives by
+seeking from header to header, so the content of each member is read only
+once. A compressed tar archive cannot be seeked in, so listing its members
+decompresses the whole archive and hashing decompresses it again. For a
+single read of compressed content, use a zip archive.
+"""
+
+import os
+import tarfile
+import zipfile
+
+
+class ArchiveError(Exception):
+    """Raised when an archive is not a valid SIP archive."""
+
+
+def is_archive(path):
+    """Return True if path is a tar or zip archive.
+
+    :path: Path to check
+    """
+    if not os.path.isfile(path):
+        return False
+    return tarfile.is_tarfile(path) or zipfile.is_zipfile(path)
+
+
+def open_archive(path):
+    """Open a SIP archive.
+
+    :path: Path to a tar or zip archive. Compressed tar archives are
+           supported.
+    :returns: TarSipArchive or ZipSipArchive
+    """
+    if zipfile.is_zipfile(path):
+        return ZipSipArchive(path)
+    if tarfile.is_tarfile(path):
+        return TarSipArchive(path)
+    raise ArchiveError(f'Not a tar or zip archive: {path}')
+
+
+class _SipArchive:
+    """Base class for SIP archives.
+
+    Subclasses set ``_members``, a list of tuples (name, size, member) of
+    regular files in the order they are stored in the archive, and
+    implement ``_open_member()`` and ``close()``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._members = []
+        self._root = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the archive."""
+
+    def _open_member(self, member):
+        """Return binary file object for reading a member."""
+        raise NotImplementedError
+
+    def _find_root(self):
+        """Find the root directory of the SIP in the archive. The archive
+        is closed if it does not contain a SIP."""
+        mets_names = [name for name, _, _ in self._members
+                      if os.path.basename(name) == 'mets.xml']
+        if not mets_names:
+            self.close()
+            raise ArchiveError(f'No mets.xml in archive: {self.path}')
+        mets_name = min(mets_names, key=lambda name: name.count('/'))
+        self._root = os.path.dirname(mets_name)
+        if self._root:
+            # Members outside the SIP, e.g. a README next to its directory,
+            # are not part of the SIP
+            prefix = self._root + '/'
+            self._members = [member for member in self._members
+                             if member[0].startswith(prefix)]
+
+    def relpath(self, name):
+        """Return path of a member relative to the root of the SIP."""
+        if not self._root:
+            return name
+        return os.path.relpath(name, self._root)
+
+    def sizes(self):
+        """Return sizes of the files in the SIP.
+
+        :returns: Dictionary of sizes in bytes by normalized relative path
+        """
+        return {self.relpath(name): size for name, size, _ in self._members}
+
+    def open_mets(self):
+        """Return binary file object for reading mets.xml of the SIP."""
+        mets_name = os.path.join(self._root, 'mets.xml')
+        for name, _, member in self._members:
+            if name == mets_name:
+                return self._open_member(member)
+        raise ArchiveError(f'No mets.xml in archive: {self.path}')
+
+    def iter_files(self, relpaths):
+        """Iterate files of the SIP in the order they are stored in the
+        archive, reading the archive in a single sequential pass.
+
+        :relpaths: Set of relative paths of the files to open
+        :returns: Iterable over tuples (relpath, file object)
+        """
+        for name, _, member in self._members:
+            relpath = self.relpath(name)
+            if relpath not in relpaths:
+                continue
+            with self._open_member(member) as stream:
+                yield relpath, stream
+
+
+class TarSipArchive(_SipArchive):
+    """SIP packaged as a tar archive.
+
+    Listing members of a compressed tar archive decompresses all of it, see
+    the module documentation.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._tar = tarfile.open(path)
+        self._members = [
+            (os.path.normpath(member.name), member.size, member)
+            for member in self._tar.getmembers() if member.isfile()]
+        self._find_root()
+
+    def _open_member(self, member):
+        return self._tar.extractfile(member)
+
+    def close(self):
+        self._tar.close()
+
+
+class ZipSipArchive(_SipArchive):
+    """SIP packaged as a zip archive."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._zip = zipfile.ZipFile(path)
+        infos = sorted((info for info in self._zip.infolist()
+                        if not info.is_dir()),
+                       key=lambda info: info.header_offset)
+        self._members = [(os.path.normpath(info.filename), info.file_size,
+                          info) for info in infos]
+        self._find_root()
+
+    def _open_member(self, member):
+        return self._zip.open(member)
+
+    def close(self):
+        self._zip.close()
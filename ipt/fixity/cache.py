@@ -0,0 +1,154 @@
+"""
+Persistent cache for file digests.
+
+Fixity of the same staged files is often checked several times, e.g. at
+ingest, after transfer and before AIP creation. The cache stores digests of
+files in an SQLite database, so that unchanged files do not need to be read
+again. A file is identified by its device, inode, size and modification time
+in nanoseconds. If any of these change, the cached digest is not used.
+
+How long cached digests are trusted is configurable, see
+:func:`parse_trust`.
+"""
+
+import sqlite3
+import threading
+import time
+
+from ipt.fixity.hashing import normalize_algorithm
+
+TRUST_ALWAYS = 'always'
+TRUST_NEVER = 'never'
+
+# Digests of files modified less than this many seconds before hashing are
+# not stored, as a later modification might not change the mtime.
+_RACY_SECONDS = 2
+
+# Number of stored digests between commits
+_COMMIT_INTERVAL = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fixity (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    verified REAL NOT NULL,
+    PRIMARY KEY (device, inode, size, mtime_ns, algorithm)
+)
+"""
+
+
+def parse_trust(value):
+    """Parse cache trust setting.
+
+    :value: 'always' to always trust cached digests, 'never' to never trust
+            them or the number of hours cached digests are trusted.
+    :returns: Maximum age of trusted digests in seconds, or None if digests
+              are always trusted
+    """
+    if value == TRUST_ALWAYS:
+        return None
+    if value == TRUST_NEVER:
+        return 0
+    try:
+        hours = float(value)
+    except ValueError:
+        raise ValueError(
+            f'Cache trust must be "{TRUST_ALWAYS}", "{TRUST_NEVER}" or '
+            f'a number of hours, not "{value}"') from None
+    if hours < 0:
+        raise ValueError('Cache trust hours must not be negative')
+    return hours * 3600
+
+
+class FixityCache:
+    """SQLite cache of file digests.
+
+    The cache can be shared by several threads. Use as a context manager or
+    call :meth:`close` to commit the stored digests.
+    """
+
+    def __init__(self, path, max_age=None):
+        """Open or create the cache database.
+
+        :path: Path to the SQLite database file
+        :max_age: Maximum age of trusted digests in seconds, None to always
+                  trust cached digests. See :func:`parse_trust`.
+        """
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def lookup(self, stat_result, algorithm):
+        """Return cached digest of a file.
+
+        :stat_result: os.stat() result of the file
+        :algorithm: Checksum algorithm
+        :returns: Hex digest, or None if there is no trusted digest for the
+                  file in its current state
+        """
+        if self.max_age == 0:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT digest, verified FROM fixity WHERE device = ? AND '
+                'inode = ? AND size = ? AND mtime_ns = ? AND algorithm = ?',
+                _key(stat_result, algorithm)).fetchone()
+        if row is None:
+            return None
+        digest, verified = row
+        if self.max_age is not None and time.time() - verified > self.max_age:
+            return None
+        return digest
+
+    def store(self, stat_result, algorithm, digest, hashing_started=None):
+        """Store digest of a file.
+
+        :stat_result: os.stat() result of the file, taken before hashing
+        :algorithm: Checksum algorithm
+        :digest: Hex digest
+        :hashing_started: Time when hashing of the file started. Digests of
+                          files modified right before hashing are not
+                          stored. Defaults to the current time.
+        """
+        if hashing_started is None:
+            hashing_started = time.time()
+        if stat_result.st_mtime_ns / 1e9 > hashing_started - _RACY_SECONDS:
+            return
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO fixity VALUES (?, ?, ?, ?, ?, ?, ?)',
+                _key(stat_result, algorithm) + (digest, time.time()))
+            self._uncommitted += 1
+            if self._uncommitted >= _COMMIT_INTERVAL:
+                self._connection.commit()
+                self._uncommitted = 0
+
+    def close(self):
+        """Commit stored digests and close the database."""
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+
+def _key(stat_result, algorithm):
+    """Return cache key of a file."""
+    return (stat_result.st_dev, stat_result.st_ino, stat_result.st_size,
+            stat_result.st_mtime_ns, normalize_algorithm(algorithm))
+
+
+def same_file_state(stat_before, stat_after):
+    """Return True if the file was not modified between the two stats."""
+    return _key(stat_before, '') == _key(stat_after, '')
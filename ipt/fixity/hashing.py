@@ -0,0 +1,195 @@
+"""
+Hashing engine for fixity checks.
+
+Files are read with ``readinto`` into a large buffer, which is reused by
+each thread. The kernel is advised that the file is read sequentially, and
+after hashing that its pages are no longer needed, so that hashing terabytes
+of data does not evict everything else from the page cache. Small files can
+optionally be hashed through ``mmap``. Digests with several algorithms can
+be computed from a single read of the file.
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+
+_LOCAL = threading.local()
+
+
+def normalize_algorithm(algorithm):
+    """Return hashlib name of a checksum algorithm.
+
+    :algorithm: Algorithm name as used in PREMIS, e.g. 'MD5' or 'SHA-256'
+    :returns: hashlib algorithm name, e.g. 'md5' or 'sha256'
+    """
+    name = algorithm.lower()
+    if name.startswith('sha-'):
+        name = 'sha' + name[4:]
+    return name
+
+
+def new_hash(algorithm):
+    """Return new hashlib object for a checksum algorithm.
+
+    :algorithm: Algorithm name, see :func:`normalize_algorithm`
+    :returns: hashlib hash object
+    """
+    return hashlib.new(normalize_algorithm(algorithm))
+
+
+def hexdigest(path, algorithm='md5', buffer_size=DEFAULT_BUFFER_SIZE,
+              mmap_threshold=0, drop_cache=True):
+    """Return hex digest of a file.
+
+    :path: Path to the file
+    :algorithm: Checksum algorithm, e.g. 'MD5' or 'SHA-256'
+    :buffer_size: Size of the read buffer in bytes
+    :mmap_threshold: Files up to this size in bytes are hashed using mmap.
+                     Zero disables mmap.
+    :drop_cache: Advise the kernel to drop the file from the page cache
+                 after hashing
+    :returns: Hex digest as string
+    """
+    return hexdigests(path, [algorithm], buffer_size=buffer_size,
+                      mmap_threshold=mmap_threshold,
+                      drop_cache=drop_cache)[algorithm]
+
+
+def hexdigests(path, algorithms, buffer_size=DEFAULT_BUFFER_SIZE,
+               mmap_threshold=0, drop_cache=True):
+    """Return hex digests of a file with several algorithms.
+
+    The file is read only once: each block read is fed to all hash objects.
+
+    :path: Path to the file
+    :algorithms: Iterable of checksum algorithms, e.g. ['SHA-256', 'MD5']
+    :returns: Dictionary of hex digests by the algorithm names given
+
+    See :func:`hexdigest` for the other arguments.
+    """
+    hashers = {algorithm: new_hash(algorithm) for algorithm in algorithms}
+    update_from_file(list(hashers.values()), path, buffer_size=buffer_size,
+                     mmap_threshold=mmap_threshold, drop_cache=drop_cache)
+    return {algorithm: hasher.hexdigest()
+            for algorithm, hasher in hashers.items()}
+
+
+def update_from_file(hashers, path, buffer_size=DEFAULT_BUFFER_SIZE,
+                     mmap_threshold=0, drop_cache=True):
+    """Feed contents of a file to hash objects.
+
+    :hashers: List of hashlib hash objects
+
+    See :func:`hexdigest` for the other arguments.
+    """
+    with open(path, 'rb', buffering=0) as infile:
+        fileno = infile.fileno()
+        _fadvise(fileno, 'POSIX_FADV_SEQUENTIAL')
+        try:
+            size = os.fstat(fileno).st_size
+            if 0 < size <= mmap_threshold:
+                with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+                    for hasher in hashers:
+                        hasher.update(mapped)
+            else:
+                update_from_stream(hashers, infile, buffer_size=buffer_size)
+        finally:
+            if drop_cache:
+                _fadvise(fileno, 'POSIX_FADV_DONTNEED')
+
+
+def stream_hexdigests(stream, algorithms, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Return hex digests of the contents of a binary file object.
+
+    :stream: Binary file object, e.g. a member of a tar or zip archive
+    :algorithms: Iterable of checksum algorithms
+    :buffer_size: Size of the read buffer in bytes
+    :returns: Tuple (digests, size), where digests is a dictionary of hex
+              digests by the algorithm names given and size is the number
+              of bytes read
+    """
+    hashers = {algorithm: new_hash(algorithm) for algorithm in algorithms}
+    size = update_from_stream(list(hashers.values()), stream,
+                              buffer_size=buffer_size)
+    return ({algorithm: hasher.hexdigest()
+             for algorithm, hasher in hashers.items()}, size)
+
+
+def update_from_stream(hashers, stream, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Feed contents of a binary file object to hash objects.
+
+    :hashers: List of hashlib hash objects
+    :stream: Binary file object supporting readinto
+    :buffer_size: Size of the read buffer in bytes
+    :returns: Number of bytes read
+    """
+    buffer = _read_buffer(buffer_size)
+    view = memoryview(buffer)
+    size = 0
+    while True:
+        length = stream.readinto(buffer)
+        if not length:
+            break
+        size += length
+        block = view[:length]
+        for hasher in hashers:
+            hasher.update(block)
+    return size
+
+
+class HashingReader:
+    """Binary file object wrapper that hashes the data as it is read.
+
+    Used for computing digests of data that is copied elsewhere, e.g. into
+    an archive, without reading it twice.
+    """
+
+    def __init__(self, stream, algorithms):
+        """Wrap a binary file object.
+
+        :stream: Binary file object
+        :algorithms: Iterable of checksum algorithms
+        """
+        self._stream = stream
+        self._hashers = {algorithm: new_hash(algorithm)
+                         for algorithm in algorithms}
+        self.size = 0
+
+    def read(self, size=-1):
+        """Read and hash at most size bytes."""
+        data = self._stream.read(size)
+        self.size += len(data)
+        for hasher in self._hashers.values():
+            hasher.update(data)
+        return data
+
+    def hexdigests(self):
+        """Return hex digests of the data read so far.
+
+        :returns: Dictionary of hex digests by the algorithm names given
+        """
+        return {algorithm: hasher.hexdigest()
+                for algorithm, hasher in self._hashers.items()}
+
+
+def _read_buffer(size):
+    """Return read buffer of the current thread, reusing it if possible."""
+    buffer = getattr(_LOCAL, 'buffer', None)
+    if buffer is None or len(buffer) != size:
+        buffer = bytearray(size)
+        _LOCAL.buffer = buffer
+    return buffer
+
+
+def _fadvise(fileno, advice):
+    """Give advice on the whole file to the kernel, if supported."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fileno, 0, 0, getattr(os, advice))
+    except OSError:
+        # Advice is optional, e.g. some file systems do not support it
+        pass
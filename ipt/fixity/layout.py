@@ -0,0 +1,67 @@
+"""
+Physical layout of files on disk.
+
+Reading files in the order they are stored on disk reduces seeking on
+rotational media. Files can be ordered by inode number, which on most file
+systems correlates with the location of the file, or by the physical offset
+of the first extent of the file, which is queried with the FIEMAP ioctl.
+"""
+
+import fcntl
+import os
+import struct
+
+READ_ORDER_METS = 'mets'
+READ_ORDER_INODE = 'inode'
+READ_ORDER_EXTENT = 'extent'
+READ_ORDERS = (READ_ORDER_METS, READ_ORDER_INODE, READ_ORDER_EXTENT)
+
+# _IOWR('f', 11, struct fiemap) from linux/fs.h
+_FS_IOC_FIEMAP = 0xC020660B
+# struct fiemap: fm_start, fm_length, fm_flags, fm_mapped_extents,
+# fm_extent_count, fm_reserved
+_FIEMAP = struct.Struct('=QQIIII')
+# struct fiemap_extent: fe_logical, fe_physical, fe_length,
+# fe_reserved64[2], fe_flags, fe_reserved[3]
+_FIEMAP_EXTENT = struct.Struct('=QQQ2QI3I')
+_FIEMAP_MAX_OFFSET = 0xFFFFFFFFFFFFFFFF
+
+
+def physical_offset(path):
+    """Return physical offset of the first extent of a file.
+
+    :path: Path to the file
+    :returns: Offset in bytes on the underlying device, or None if the file
+              has no extents or the file system does not support FIEMAP
+    """
+    request = bytearray(_FIEMAP.size + _FIEMAP_EXTENT.size)
+    _FIEMAP.pack_into(request, 0, 0, _FIEMAP_MAX_OFFSET, 0, 0, 1, 0)
+    try:
+        with open(path, 'rb') as infile:
+            fcntl.ioctl(infile.fileno(), _FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    mapped_extents = _FIEMAP.unpack_from(request, 0)[3]
+    if not mapped_extents:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP.size)[1]
+
+
+def read_order_key(path, read_order):
+    """Return sort key for reading files in given order.
+
+    Files that cannot be accessed are sorted last. With extent order, files
+    whose extents are unknown are sorted by inode number.
+
+    :path: Path to the file
+    :read_order: READ_ORDER_INODE or READ_ORDER_EXTENT
+    :returns: Sort key as tuple
+    """
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return (1,)
+    offset = None
+    if read_order == READ_ORDER_EXTENT:
+        offset = physical_offset(path)
+    return (0, stat_result.st_dev, offset or 0, stat_result.st_ino)
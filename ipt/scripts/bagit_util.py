@@ -1,12 +1,59 @@
 #!/usr/bin/python
 # vim:ft=python
-"""Command line utility to create bagit manifests for AIP packages.
+"""Command line utility to create and verify bagit manifests for AIP
+packages.
 
 Usage instructions::
 
-    bagit_util make_manifest <sip directory>
+    bagit_util make_manifest <sip directory> [--workers <N>]
+        [--check-fixity <sip path>] [--incremental]
+        [--algorithm <algorithm> ...] [--tagmanifests]
+        [--trust-mets <sip path>] [--verbose]
+    bagit_util verify <bagit directory> [--workers <N>] [--fail-fast]
+        [--sample <fraction>]
+    bagit_util export-tar <bagit directory> <tar file> [--algorithm ...]
+
+Files are hashed with the given number of threads. Lines of the manifest
+are sorted by path, so the manifest is the same for any number of threads.
+
+With ``--check-fixity``, the digests given in METS document of the SIP
+inside the bag are checked while hashing the files for the manifest, so
+that each file is read only once. The manifest is not written if fixity
+check fails.
+
+With ``--incremental``, an existing manifest is updated: only files that
+are new or have been modified after the manifest was written are hashed,
+and files that have been deleted are dropped. The numbers of new, changed,
+unchanged and deleted files are printed.
+
+With ``--algorithm``, given once for each algorithm, a manifest-ALG.txt file
+is written for every algorithm from a single read of each file. The default
+is md5 only. With ``--tagmanifests``, tagmanifest-ALG.txt files listing
+bagit.txt and the manifest files are also written. Manifests and tag
+manifests of other algorithms are removed, so that none of them is left
+stale. Incremental update supports only bags whose only manifest is md5.
+
+With ``--trust-mets``, digests given in METS document of the SIP inside the
+bag are used in the manifest without reading the files, for files whose
+digest algorithm in METS is one of the manifest algorithms. Only the other
+files are hashed. This relies on the files having been checked against
+METS earlier, e.g. with check-sip-file-checksums, and not changed since.
+The assumption is recorded in Payload-Digest-Source field of bag-info.txt.
+With ``--verbose``, the peak memory use after reading METS is written to
+standard error.
+
+``verify`` checks the files of a bag against its manifests, and reports
+invalid checksums, missing files and files not listed in the manifest.
+With ``--fail-fast``, verification stops at the first error. With
+``--sample``, only the given fraction of randomly chosen files is hashed.
+
+``export-tar`` writes the bag as a tar archive, reading each file only once:
+manifests are computed while the files are written into the archive, and
+they are appended with bagit.txt as the final members. Tar file ``-``
+writes the archive to standard output.
 
 On successful operation returns exit status 0.
+On fixity errors returns exit status 117.
 On system error returns exit status != 0.
 
 .. _Bagit: http://en.wikipedia.org/wiki/BagIt
@@ -17,11 +64,20 @@ For more information see the :mod:`aiptools.bagit` module.
 
 """
 
+import os
 import sys
 import argparse
 
-from ipt.aiptools.bagit import make_manifest, write_manifest, \
-    write_bagit_txt, check_directory_is_bagit, check_bagit_mandatory_files
+from ipt.aiptools.bagit import iter_manifests, update_manifest, \
+    write_manifest, write_manifests, write_tagmanifests, write_bagit_txt, \
+    update_bag_info, check_directory_is_bagit, check_bagit_mandatory_files, \
+    verify_bag, export_tar, manifest_algorithm, manifest_algorithms, \
+    remove_manifests
+from ipt.comparator.utils import iter_metadata_info
+from ipt.fixity.hashing import normalize_algorithm
+from ipt.scripts.check_sip_file_checksums import check_checksums
+from ipt.utils import configure_logging, ensure_binary, ensure_text
+from ipt.xml.mets import read_mets
 
 
 def main(arguments=None):
@@ -29,29 +85,240 @@ def main(arguments=None):
     :arguments: Commandline parameters.
     :returns: 0 if all ok, otherwise BagitError(or other exception) is risen"""
 
-    usage = "usage: bagit_util make_manifest <sip_path>"
-    parser = argparse.ArgumentParser(usage=usage)
+    args = parse_arguments(arguments)
 
-    parser.add_argument("make_manifest", help="Write manifest file for bagit")
-    parser.add_argument("sip_path", help="Path to SIP directory")
+    if args.command is None:
+        sys.stderr.write("Must provide make_manifest, verify or export-tar "
+                         "command and bagit directory name as parameter\n")
+        return 1
 
-    args = parser.parse_args(arguments)
+    if args.command == "verify":
+        return verify(args)
+    if args.command == "export-tar":
+        return export(args)
+    configure_logging(args.verbose)
+    return make_manifest(args)
 
-    if not args.make_manifest == "make_manifest":
-        sys.stderr.write("Must provide make_manifest command and SIP directory"
-                         " name as parameter\n")
-        parser.print_help()
-        return 1
 
+def make_manifest(args):
+    """Write manifest file for bagit.
+    :args: Parsed command line arguments
+    :returns: Exit status"""
     check_directory_is_bagit(args.sip_path)
-    manifest = make_manifest(args.sip_path)
-    write_manifest(manifest, args.sip_path)
+    algorithms = args.algorithm or ['md5']
+    manifest_path = os.path.join(args.sip_path, "manifest-md5.txt")
+    incremental = args.incremental and os.path.isfile(manifest_path)
+    if incremental and manifest_algorithms(args.sip_path) != ['md5']:
+        sys.stderr.write("--incremental supports only bags whose only "
+                         "manifest is manifest-md5.txt\n")
+        return 1
+    known_digests = None
+    if args.check_fixity:
+        known_digests = {}
+        if not check_fixity(args.sip_path, args.check_fixity,
+                            known_digests, workers=args.workers,
+                            algorithms=algorithms):
+            return 117
+    digest_source = None
+    if args.trust_mets:
+        known_digests = mets_digests(args.sip_path, args.trust_mets,
+                                     algorithms)
+        mets_relpath = os.path.relpath(
+            os.path.join(args.trust_mets, "mets.xml"), args.sip_path)
+        digest_source = (f"Digests of {len(known_digests)} files taken from "
+                         f"{mets_relpath} without rehashing, assuming the "
+                         f"files were verified against METS")
+    if incremental:
+        counts = {}
+        write_manifest(update_manifest(args.sip_path, counts,
+                                       known_digests=known_digests,
+                                       workers=args.workers),
+                       args.sip_path)
+        print("New: {new}, changed: {changed}, unchanged: {unchanged}, "
+              "deleted: {deleted}".format(**counts))
+    else:
+        write_manifests(iter_manifests(args.sip_path, algorithms,
+                                       known_digests=known_digests,
+                                       workers=args.workers),
+                        args.sip_path, algorithms)
+        remove_manifests(args.sip_path, algorithms)
     write_bagit_txt(args.sip_path)
+    if digest_source or not args.incremental:
+        update_bag_info(args.sip_path,
+                        {"Payload-Digest-Source": digest_source})
+    if args.tagmanifests:
+        write_tagmanifests(args.sip_path, algorithms)
+    remove_manifests(args.sip_path, algorithms if args.tagmanifests else (),
+                     manifest_type='tagmanifest')
     check_bagit_mandatory_files(args.sip_path)
 
     return 0
 
 
+def verify(args):
+    """Verify files of bagit against its manifest.
+    :args: Parsed command line arguments
+    :returns: Exit status"""
+    check_directory_is_bagit(args.bagit_path)
+    check_bagit_mandatory_files(args.bagit_path)
+
+    returncode = 0
+    for error, path in verify_bag(args.bagit_path, workers=args.workers,
+                                  sample=args.sample):
+        print(f"{error}: {ensure_text(path)}")
+        returncode = 117
+        if args.fail_fast:
+            break
+    return returncode
+
+
+def export(args):
+    """Write bagit as a tar archive with manifests computed on the fly.
+    :args: Parsed command line arguments
+    :returns: Exit status"""
+    check_directory_is_bagit(args.bagit_path)
+    algorithms = args.algorithm or ["md5"]
+    if args.tar_path == "-":
+        export_tar(args.bagit_path, sys.stdout.buffer, algorithms)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.tar_path, "wb") as outfile:
+            export_tar(args.bagit_path, outfile, algorithms)
+    return 0
+
+
+def _fraction(value):
+    """Convert a fraction between 0 and 1 to float."""
+    fraction = float(value)
+    if not 0 < fraction <= 1:
+        raise ValueError(f"Fraction must be between 0 and 1, not {value}")
+    return fraction
+
+
+def _algorithm(value):
+    """Convert algorithm name to the name used in manifest file names."""
+    try:
+        return manifest_algorithm(value)
+    except ValueError as exception:
+        raise argparse.ArgumentTypeError(str(exception)) from None
+
+
+def parse_arguments(arguments):
+    """Create arguments parser and return parsed command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Create and verify bagit manifests")
+    subparsers = parser.add_subparsers(dest="command")
+
+    make_parser = subparsers.add_parser(
+        "make_manifest", help="Write manifest file for bagit")
+    make_parser.add_argument("sip_path", help="Path to SIP directory")
+    make_parser.add_argument("-w", "--workers", type=int, default=1,
+                             help="Number of threads used for hashing files")
+    digest_group = make_parser.add_mutually_exclusive_group()
+    digest_group.add_argument("--check-fixity", metavar="SIP_PATH",
+                              help="Check digests given in METS of the SIP "
+                                   "in the bag while hashing files")
+    digest_group.add_argument("--trust-mets", metavar="SIP_PATH",
+                              help="Use digests given in METS of the SIP in "
+                                   "the bag without hashing the files")
+    make_parser.add_argument("--incremental", action="store_true",
+                             help="Update existing manifest, hashing only "
+                                  "new and modified files")
+    make_parser.add_argument("-a", "--algorithm", action="append",
+                             type=_algorithm,
+                             help="Algorithm of manifest, may be given "
+                                  "several times (default: md5)")
+    make_parser.add_argument("--tagmanifests", action="store_true",
+                             help="Write also tag manifests")
+    make_parser.add_argument("-v", "--verbose", action="store_true",
+                             help="Write debug messages, e.g. peak memory "
+                                  "use after reading METS, to standard "
+                                  "error")
+
+    verify_parser = subparsers.add_parser(
+        "verify", help="Verify files of bagit against its manifest")
+    verify_parser.add_argument("bagit_path", help="Path to bagit directory")
+    verify_parser.add_argument("-w", "--workers", type=int, default=1,
+                               help="Number of threads used for hashing "
+                                    "files")
+    verify_parser.add_argument("--fail-fast", action="store_true",
+                               help="Stop at the first error")
+    verify_parser.add_argument("--sample", type=_fraction, default=1.0,
+                               metavar="FRACTION",
+                               help="Fraction of files hashed, e.g. 0.01 "
+                                    "(default: 1)")
+
+    export_parser = subparsers.add_parser(
+        "export-tar", help="Write bagit as a tar archive with manifests")
+    export_parser.add_argument("bagit_path", help="Path to bagit directory")
+    export_parser.add_argument("tar_path",
+                               help="Path to tar file, - for standard output")
+    export_parser.add_argument("-a", "--algorithm", action="append",
+                               type=_algorithm,
+                               help="Algorithm of manifest, may be given "
+                                    "several times (default: md5)")
+
+    args = parser.parse_args(arguments)
+    if args.command == "make_manifest" and args.incremental and \
+            args.algorithm not in (None, ["md5"]):
+        make_parser.error("--incremental supports only md5 manifests")
+    return args
+
+
+def check_fixity(bagit_dir, sip_path, known_digests, workers=1,
+                 algorithms=("md5",)):
+    """Check digests given in METS and collect digests of the files.
+
+    :bagit_dir: Base directory of bagit
+    :sip_path: Path to the SIP directory containing mets.xml
+    :known_digests: Dictionary where digests are collected by path
+                    relative to bagit_dir, see
+                    :func:`ipt.aiptools.bagit.make_manifest`
+    :workers: Number of threads used for hashing files
+    :algorithms: Algorithms of the manifests, calculated from the same read
+                 as the digests given in METS
+    :returns: True if fixity of all files is ok, False otherwise
+    """
+    digests = {}
+    is_ok = True
+    for error_message in check_checksums(ensure_text(sip_path),
+                                         workers=workers,
+                                         extra_algorithms=list(algorithms),
+                                         digests=digests):
+        print(error_message)
+        is_ok = False
+
+    for path, file_digests in digests.items():
+        relpath = os.path.relpath(path, ensure_text(bagit_dir))
+        known_digests[ensure_binary(relpath)] = file_digests
+    return is_ok
+
+
+def mets_digests(bagit_dir, sip_path, algorithms):
+    """Collect digests given in METS without checking them.
+
+    :bagit_dir: Base directory of bagit
+    :sip_path: Path to the SIP directory containing mets.xml
+    :algorithms: Algorithms of the manifests. Digests of other algorithms
+                 are ignored.
+    :returns: Dictionary of digests by path relative to bagit_dir, see
+              :func:`ipt.aiptools.bagit.make_manifest`
+    """
+    algorithms = {normalize_algorithm(algorithm) for algorithm in algorithms}
+    mets_path = os.path.join(ensure_text(sip_path), "mets.xml")
+    known_digests = {}
+    for metadata_info in iter_metadata_info(read_mets(mets_path), mets_path):
+        algorithm = metadata_info["algorithm"]
+        if algorithm is None or \
+                normalize_algorithm(algorithm) not in algorithms:
+            continue
+        relpath = os.path.relpath(metadata_info["filename"],
+                                  ensure_text(bagit_dir))
+        known_digests[ensure_binary(relpath)] = {
+            algorithm: metadata_info["digest"].lower()}
+    return known_digests
+
+
 if __name__ == '__main__':
     RETVAL = main()
     sys.exit(RETVAL)
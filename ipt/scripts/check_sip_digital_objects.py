@@ -4,9 +4,11 @@
 
 import argparse
 import datetime
+import json
 import os
 import sys
 import uuid
+from contextlib import ExitStack
 
 import premis
 import xml_helpers.utils
@@ -30,8 +32,10 @@ from ipt.utils import (
     merge_dicts,
     create_scraper_params,
     get_scraper_info,
-    ensure_text
+    ensure_text,
+    configure_logging
 )
+from ipt.xml.mets import read_mets
 
 _UNAVAILABLE_VERSION_VALUES = ('', '(:unav)', '(:unap)')
 
@@ -40,11 +44,18 @@ def main(arguments=None):
     """The main method for check-sip-digital-objects script"""
 
     args = parse_arguments(arguments)
-    report = validation_report(
-        sip_path=args.sip_path,
-        catalog_path=args.catalog_path,
-        linking_sip_type=args.linking_sip_type,
-        linking_sip_id=args.linking_sip_id)
+    configure_logging(args.verbose)
+    with ExitStack() as stack:
+        comparison_errors = None
+        if args.comparison_errors:
+            comparison_errors = stack.enter_context(
+                open(args.comparison_errors, 'w', encoding='utf-8'))
+        report = validation_report(
+            sip_path=args.sip_path,
+            catalog_path=args.catalog_path,
+            linking_sip_type=args.linking_sip_type,
+            linking_sip_id=args.linking_sip_id,
+            comparison_errors=comparison_errors)
 
     print(ensure_text(xml_helpers.utils.serialize(report)))
 
@@ -67,6 +78,13 @@ def parse_arguments(arguments):
                         default=default_path,
                         help='Full path to XML catalog file',
                         metavar='FILE')
+    parser.add_argument('--comparison-errors', metavar='FILE',
+                        help='Write errors of comparing METS metadata to '
+                             'scraper metadata to FILE as JSON lines, one '
+                             'line for each file with errors')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Write debug messages, e.g. peak memory use '
+                             'after reading METS, to standard error')
 
     return parser.parse_args(arguments)
 
@@ -83,7 +101,8 @@ def contains_errors(report):
 
 
 def make_result_dict(is_valid, messages=None, errors=None,
-                     extensions=None, valid_only_messages=None):
+                     extensions=None, valid_only_messages=None,
+                     comparison_errors=None):
     """ Create a result dict from a validation component output.
 
     :is_valid: Boolean describing the validation result.
@@ -93,6 +112,8 @@ def make_result_dict(is_valid, messages=None, errors=None,
                  eventOutcomeDetailExtension element in the report
     :valid_only_messages: List of messages that should only be appended to
                           the end of the report if the final result is valid.
+    :comparison_errors: List of ComparisonError records of
+                        MetadataComparator.
     :returns: A result_dict created from the arguments.
     """
     if is_valid not in (True, False, None):
@@ -106,7 +127,8 @@ def make_result_dict(is_valid, messages=None, errors=None,
         'errors': errors if errors else [],
         'extensions': extensions if extensions else [],
         'valid_only_messages': (valid_only_messages
-                                if valid_only_messages else [])
+                                if valid_only_messages else []),
+        'comparison_errors': comparison_errors if comparison_errors else []
     }
 
 
@@ -224,7 +246,8 @@ def check_metadata_match(metadata_info, scraper_streams):
     result = comparator.result()
     messages = ['[MetadataComparator] ' + msg for msg in result['messages']]
     errors = ['[MetadataComparator] ' + err for err in result['errors']]
-    return make_result_dict(result['is_valid'], messages, errors)
+    return make_result_dict(result['is_valid'], messages, errors,
+                            comparison_errors=comparator.error_records())
 
 
 def check_grade(metadata_info, grade):
@@ -290,7 +313,8 @@ def join_validation_results(metadata_info, results):
         'is_valid': is_valid,
         'messages': '\n'.join(messages),
         'errors': '\n'.join(joined_result['errors']),
-        'extensions': joined_result['extensions']
+        'extensions': joined_result['extensions'],
+        'comparison_errors': joined_result['comparison_errors']
     }
 
 
@@ -309,6 +333,8 @@ def validation(mets_path, catalog_path):
                             validation components.
                 'errors': String containing joined errors from all validation
                           components.
+                'comparison_errors': List of ComparisonError records of
+                                     MetadataComparator.
             }
     """
 
@@ -389,7 +415,7 @@ def validation(mets_path, catalog_path):
 
         return join_validation_results(metadata_info, results)
 
-    mets_tree = xml_helpers.utils.readfile(mets_path)
+    mets_tree = read_mets(mets_path)
 
     for metadata_info in iter_metadata_info(mets_tree=mets_tree,
                                             mets_path=mets_path):
@@ -467,16 +493,41 @@ def create_report_event(result, report_object, report_agent):
     return report_event
 
 
+def write_comparison_errors(result, outfile):
+    """Write errors of comparing METS metadata to scraper metadata as a
+    JSON line with keys 'filename', 'relpath' and 'errors'. The errors are
+    objects with keys 'error', 'mets' and 'scraper', giving the compared
+    values as they are. Nothing is written for files without comparison
+    errors.
+
+    :result: Validation result, see :func:`validation`.
+    :outfile: Text file object
+    """
+    records = result.get('comparison_errors')
+    if not records:
+        return
+    metadata_info = result['metadata_info']
+    outfile.write(json.dumps({
+        'filename': metadata_info['filename'],
+        'relpath': metadata_info['relpath'],
+        'errors': [record.as_dict() for record in records]},
+        default=dict) + '\n')
+
+
 def validation_report(sip_path,
                       catalog_path,
                       linking_sip_type,
-                      linking_sip_id):
+                      linking_sip_id,
+                      comparison_errors=None):
     """Format validation results to PREMIS report
 
     :param sip_path: Path to the SIP package's content.
     :param catalog_path: Path to the XML catalog.
     :param linking_sip_type: PREMIS object identifier type.
     :param linking_sip_id: PREMIS object identifier value.
+    :param comparison_errors: Text file object where errors of comparing
+        METS metadata to scraper metadata are written as JSON lines, see
+        :func:`write_comparison_errors`, or None.
     :return: PREMIS XML element.
     """
 
@@ -496,6 +547,8 @@ def validation_report(sip_path,
             child_elements.append(report_object)
         report_event = create_report_event(result, report_object, report_agent)
         child_elements.append(report_event)
+        if comparison_errors is not None:
+            write_comparison_errors(result, comparison_errors)
 
     return premis.premis(child_elements=child_elements)
 
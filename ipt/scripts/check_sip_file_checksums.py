@@ -4,14 +4,49 @@
 
 import argparse
 import errno
+import json
 import sys
 import os
-
-import xml_helpers.utils as u
-from file_scraper.utils import hexdigest
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 from ipt.comparator.utils import iter_metadata_info
-from ipt.utils import ensure_text
+from ipt.fixity.archive import is_archive, open_archive
+from ipt.fixity.cache import (FixityCache, TRUST_ALWAYS, parse_trust,
+                              same_file_state)
+from ipt.fixity.hashing import (DEFAULT_BUFFER_SIZE, hexdigests,
+                                normalize_algorithm, stream_hexdigests)
+from ipt.fixity.layout import READ_ORDER_METS, READ_ORDERS, read_order_key
+from ipt.utils import configure_logging, ensure_text, ordered_map, \
+    sorted_map
+from ipt.xml.mets import read_mets
+
+
+IGNORED_FILES = ('mets.xml', 'varmiste.sig', 'signature.sig')
+
+STATUS_OK = 'ok'
+STATUS_INVALID_CHECKSUM = 'invalid_checksum'
+STATUS_INVALID_SIZE = 'invalid_size'
+STATUS_MISSING = 'missing'
+STATUS_NO_ALGORITHM = 'no_algorithm'
+STATUS_NONLISTED = 'nonlisted'
+STATUS_UNREADABLE = 'unreadable'
+
+# Messages of the text report. Files that could not be read for other
+# reasons than not existing are not included in the text report.
+STATUS_MESSAGES = {
+    STATUS_OK: 'Checksum OK',
+    STATUS_INVALID_CHECKSUM: 'Invalid Checksum',
+    STATUS_INVALID_SIZE: 'Invalid file size',
+    STATUS_MISSING: 'File does not exist',
+    STATUS_NO_ALGORITHM: 'Could not find checksum algorithm',
+    STATUS_NONLISTED: 'Nonlisted file'
+}
+ERROR_STATUSES = frozenset(STATUS_MESSAGES) - {STATUS_OK}
+
+REPORT_TEXT = 'text'
+REPORT_JSON = 'json'
 
 
 def iter_files(path):
@@ -22,79 +57,471 @@ def iter_files(path):
     :returns: Iterable over full paths to
 
     """
+    for relpath in iter_relpaths(path):
+        yield os.path.join(path, relpath)
+
+
+def iter_relpaths(path):
+    """Iterate paths of all files under path relative to path.
 
-    ignored_files = ['mets.xml', 'varmiste.sig', 'signature.sig']
+    Does not iterate files that are listed in signature.sig file. The tree
+    is scanned with os.scandir, so that file types are mostly known without
+    calling stat for each file. Symbolic links to directories are not
+    followed, and directories that cannot be read are skipped.
 
-    for root, _, files in os.walk(path):
-        for filename in files:
-            if root == path and filename in ignored_files:
-                continue
-            yield os.path.join(root, filename)
+    :returns: Iterable over normalized relative paths
+    """
+    directories = [('', path)]
+    while directories:
+        reldir, directory = directories.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relpath = os.path.join(reldir, entry.name)
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            directories.append((relpath, entry.path))
+                    elif not (reldir == '' and entry.name in IGNORED_FILES):
+                        yield relpath
+        except OSError:
+            continue
 
 
-def check_checksums(sip_path):
+def _file_hexdigests(filename, algorithms, fixity_cache=None, rehash=False,
+                     buffer_size=DEFAULT_BUFFER_SIZE):
+    """Return hex digests of a file with several algorithms, reading the
+    file at most once. A fixity cache is used if given.
+
+    :filename: Path to the file
+    :algorithms: List of checksum algorithms
+    :fixity_cache: FixityCache or None. Digests computed are stored in the
+                   cache.
+    :rehash: Compute the digests even if trusted digests are cached
+    :buffer_size: Size of the read buffer in bytes
+    :returns: Tuple (dictionary of hex digests by algorithm, True if all
+              digests were taken from the cache without reading the file)
+    """
+    if fixity_cache is None:
+        return hexdigests(filename, algorithms, buffer_size=buffer_size), False
+
+    stat_before = os.stat(filename)
+    digests = {}
+    if not rehash:
+        for algorithm in algorithms:
+            digest = fixity_cache.lookup(stat_before, algorithm)
+            if digest is not None:
+                digests[algorithm] = digest
+        if len(digests) == len(algorithms):
+            return digests, True
+
+    missing = [algorithm for algorithm in algorithms
+               if algorithm not in digests]
+    hashing_started = time.time()
+    computed = hexdigests(filename, missing, buffer_size=buffer_size)
+    if same_file_state(stat_before, os.stat(filename)):
+        for algorithm, digest in computed.items():
+            fixity_cache.store(stat_before, algorithm, digest,
+                               hashing_started)
+    digests.update(computed)
+    return digests, False
+
+
+def check_file_size(metadata_info):
+    """Check that a file exists and has the size given in METS.
+
+    :metadata_info: metadata_info of the file
+    :returns: Tuple (status, size). Status is None if the file exists and
+              its size matches or no size is given. Size is the size of the
+              file in bytes, or None if the file could not be accessed.
+    """
+    try:
+        size = os.stat(metadata_info['filename']).st_size
+    except OSError as exception:
+        if exception.errno == errno.ENOENT:
+            return (STATUS_MISSING, None)
+        return (None, None)
+    expected_size = metadata_info.get('size')
+    if expected_size is not None and size != expected_size:
+        return (STATUS_INVALID_SIZE, size)
+    return (None, size)
+
+
+def file_result(relpath, status, metadata_info=None, actual=None,
+                size=None, hash_time=None, cached=False):
+    """Return result record of checking a single file.
+
+    :relpath: Path of the file relative to the SIP
+    :status: One of the STATUS_* constants
+    :metadata_info: metadata_info of the file, or None for nonlisted files
+    :actual: Hex digest computed, or None if the file was not hashed
+    :size: Size of the file in bytes
+    :hash_time: Time spent hashing the file in seconds, or None if the
+                file was not hashed
+    :cached: True if the digest was taken from the fixity cache without
+             reading the file
+    :returns: Dictionary with keys relpath, algorithm, expected, actual,
+              status, bytes, hash_time and cached
+    """
+    if metadata_info is None:
+        metadata_info = {}
+    return {'relpath': ensure_text(relpath),
+            'algorithm': metadata_info.get('algorithm'),
+            'expected': metadata_info.get('digest'),
+            'actual': actual,
+            'status': status,
+            'bytes': size,
+            'hash_time': hash_time,
+            'cached': cached}
+
+
+def check_checksums(sip_path, **kwargs):
     """Check checksums for all digital objects in METS
 
-    :sip_path: The path to the SIP contents
+    Files with valid checksums are printed to stdout.
+
+    :sip_path: The path to the SIP contents, or to a SIP archive
     :returns: Iterable containing all error messages
 
+    See :func:`check_results` for the other arguments.
+    """
+    for result in check_results(sip_path, **kwargs):
+        message = STATUS_MESSAGES.get(result['status'])
+        if message is None:
+            continue
+        message = ensure_text(f"{message}: {result['relpath']}")
+        if result['status'] == STATUS_OK:
+            print(message)
+        else:
+            yield message
+
+
+def check_results(sip_path, workers=1, fixity_cache=None, rehash=False,
+                  buffer_size=DEFAULT_BUFFER_SIZE, extra_algorithms=(),
+                  digests=None, read_order=READ_ORDER_METS):
+    """Check checksums for all digital objects in METS and yield a result
+    record for each file, see :func:`file_result`.
+
+    The existence and size of all files are checked before any file is
+    hashed, so missing and truncated files are reported first and never
+    read. The SIP is scanned for files not listed in METS concurrently with
+    hashing, and nonlisted files are reported last in sorted order.
+
+    If sip_path is a tar or zip archive, the SIP is checked without
+    extracting it, see :func:`check_archive_results`. Options that only
+    apply to files on disk (workers, fixity_cache, rehash, read_order) are
+    then ignored.
+
+    :sip_path: The path to the SIP contents, or to a SIP archive
+    :workers: Number of threads used for hashing files. Results are
+              reported in METS order regardless of the number of threads.
+    :fixity_cache: FixityCache for reusing digests of unchanged files
+    :rehash: Hash all files even if their digests are in fixity_cache
+    :buffer_size: Size of the read buffer of each thread in bytes
+    :extra_algorithms: Algorithms whose digests are computed in addition to
+                       the algorithm given in METS, from the same read
+    :digests: Dictionary where digests of all hashed files are collected.
+              Keys are paths of the files and values dictionaries of hex
+              digests by algorithm, including extra_algorithms.
+    :read_order: Order in which files are read: READ_ORDER_METS, or
+                 READ_ORDER_INODE or READ_ORDER_EXTENT for reading files in
+                 their physical order on disk. Results are reported in METS
+                 order in any case.
+    :returns: Iterable over result records
+
     """
 
-    checked_files = {}
+    if is_archive(sip_path):
+        yield from check_archive_results(
+            sip_path, buffer_size=buffer_size,
+            extra_algorithms=extra_algorithms, digests=digests)
+        return
+
+    checked_files = set()
     mets_path = os.path.join(sip_path, 'mets.xml')
 
-    def _message(metadata_info, message):
-        """Format error message"""
-        return ensure_text("{}: {}".format(
-            message, os.path.relpath(metadata_info["filename"], sip_path)))
+    def _result(metadata_info, status, **kwargs):
+        """Return result record of a listed file"""
+        return file_result(
+            os.path.relpath(metadata_info["filename"], sip_path), status,
+            metadata_info=metadata_info, **kwargs)
+
+    def _check(item):
+        """Check checksum of a single file.
+
+        :item: Tuple (metadata_info, size)
+        :returns: Result record
+        """
+        metadata_info, size = item
+        algorithm = metadata_info['algorithm']
+        if algorithm is None:
+            return _result(metadata_info, STATUS_NO_ALGORITHM)
+        algorithms = [algorithm] + [
+            extra for extra in extra_algorithms
+            if normalize_algorithm(extra) != normalize_algorithm(algorithm)]
+        started = time.perf_counter()
+        try:
+            file_digests, cached = _file_hexdigests(
+                metadata_info['filename'], algorithms,
+                fixity_cache=fixity_cache, rehash=rehash,
+                buffer_size=buffer_size)
+        except OSError as exception:
+            if exception.errno == errno.ENOENT:
+                return _result(metadata_info, STATUS_MISSING)
+            return _result(metadata_info, STATUS_UNREADABLE, size=size)
+        hash_time = time.perf_counter() - started
+
+        if digests is not None:
+            for extra in extra_algorithms:
+                file_digests.setdefault(extra, file_digests[algorithm])
+            digests[metadata_info['filename']] = file_digests
+        hex_digest = file_digests[algorithm]
+        if hex_digest.lower() == metadata_info["digest"].lower():
+            status = STATUS_OK
+        else:
+            status = STATUS_INVALID_CHECKSUM
+        return _result(metadata_info, status, actual=hex_digest, size=size,
+                       hash_time=None if cached else hash_time, cached=cached)
+
+    # The SIP is scanned for nonlisted files while METS is read and files
+    # are hashed
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scanned_files = executor.submit(set, iter_relpaths(sip_path))
+
+        mets_tree = read_mets(mets_path)
+        hashed = []
+        for metadata_info in iter_metadata_info(mets_tree, mets_path):
+            checked_files.add(os.path.normpath(metadata_info["relpath"]))
+
+            size = None
+            if metadata_info['algorithm'] is not None:
+                status, size = check_file_size(metadata_info)
+                if status is not None:
+                    yield _result(metadata_info, status, size=size)
+                    continue
+            hashed.append((metadata_info, size))
+
+        if read_order == READ_ORDER_METS:
+            yield from ordered_map(_check, hashed, workers)
+        else:
+            yield from sorted_map(
+                _check, hashed, workers=workers,
+                key=lambda item: read_order_key(item[0]['filename'],
+                                                read_order))
+
+        nonlisted_files = scanned_files.result() - checked_files
 
-    mets_tree = u.readfile(mets_path)
-    for metadata_info in iter_metadata_info(mets_tree, mets_path):
+    for relpath in sorted(nonlisted_files):
+        if relpath.endswith("ignore_validation_errors"):
+            continue
+        yield file_result(relpath, STATUS_NONLISTED)
 
-        checked_files[metadata_info["filename"]] = None
 
-        if metadata_info['algorithm'] is None:
-            yield _message(metadata_info, "Could not find checksum algorithm")
-        else:
+def check_archive_results(archive_path, buffer_size=DEFAULT_BUFFER_SIZE,
+                          extra_algorithms=(), digests=None):
+    """Check checksums for all digital objects in METS of a SIP archive.
+
+    mets.xml is read from the archive, and the members listed in METS are
+    hashed in a single sequential pass over the archive. Results are
+    reported in the same way and order as for SIP directories. A compressed
+    tar archive is decompressed once more for listing its members, see
+    :mod:`ipt.fixity.archive`.
+
+    :archive_path: Path to a tar or zip archive containing the SIP
+    :returns: Iterable over result records
 
-            try:
-                hex_digest = hexdigest(metadata_info['filename'],
-                                       metadata_info['algorithm'])
-            except OSError as exception:
-                if exception.errno == errno.ENOENT:
-                    yield _message(metadata_info, "File does not exist")
-                continue
-
-            if hex_digest.lower() == metadata_info["digest"].lower():
-                print(_message(metadata_info, "Checksum OK"))
-            else:
-                yield _message(metadata_info, "Invalid Checksum")
-
-    for path in iter_files(sip_path):
-        if path.endswith("ignore_validation_errors"):
+    See :func:`check_results` for the other arguments.
+    """
+
+    def _relpath(metadata_info):
+        """Return normalized path of the file inside the SIP"""
+        return os.path.normpath(metadata_info["relpath"])
+
+    with open_archive(archive_path) as archive:
+        sizes = archive.sizes()
+        with archive.open_mets() as mets_file:
+            mets_tree = read_mets(mets_file)
+        mets_path = os.path.join(archive_path, 'mets.xml')
+
+        checked_files = set()
+        hashed = []
+        for metadata_info in iter_metadata_info(mets_tree, mets_path):
+            relpath = _relpath(metadata_info)
+            checked_files.add(relpath)
+
+            if metadata_info['algorithm'] is not None:
+                expected_size = metadata_info.get('size')
+                if relpath not in sizes:
+                    yield file_result(relpath, STATUS_MISSING,
+                                      metadata_info=metadata_info)
+                    continue
+                if expected_size is not None and \
+                        sizes[relpath] != expected_size:
+                    yield file_result(relpath, STATUS_INVALID_SIZE,
+                                      metadata_info=metadata_info,
+                                      size=sizes[relpath])
+                    continue
+            hashed.append(metadata_info)
+
+        algorithms = {}
+        for metadata_info in hashed:
+            if metadata_info['algorithm'] is not None:
+                file_algorithms = algorithms.setdefault(
+                    _relpath(metadata_info), [])
+                for algorithm in [metadata_info['algorithm'],
+                                  *extra_algorithms]:
+                    if algorithm not in file_algorithms:
+                        file_algorithms.append(algorithm)
+
+        file_digests = {}
+        hash_times = {}
+        for relpath, stream in archive.iter_files(set(algorithms)):
+            started = time.perf_counter()
+            file_digests[relpath] = stream_hexdigests(
+                stream, algorithms[relpath], buffer_size=buffer_size)[0]
+            hash_times[relpath] = time.perf_counter() - started
+
+    for metadata_info in hashed:
+        relpath = _relpath(metadata_info)
+        algorithm = metadata_info['algorithm']
+        if algorithm is None:
+            yield file_result(relpath, STATUS_NO_ALGORITHM,
+                              metadata_info=metadata_info)
+            continue
+        hex_digest = file_digests[relpath][algorithm]
+        if digests is not None:
+            digests[metadata_info['filename']] = file_digests[relpath]
+        if hex_digest.lower() == metadata_info["digest"].lower():
+            status = STATUS_OK
+        else:
+            status = STATUS_INVALID_CHECKSUM
+        yield file_result(relpath, status, metadata_info=metadata_info,
+                          actual=hex_digest, size=sizes[relpath],
+                          hash_time=hash_times[relpath])
+
+    nonlisted_files = {
+        relpath for relpath in sizes
+        if os.path.dirname(relpath) or relpath not in IGNORED_FILES}
+    for relpath in sorted(nonlisted_files - checked_files):
+        if relpath.endswith("ignore_validation_errors"):
             continue
+        yield file_result(relpath, STATUS_NONLISTED, size=sizes[relpath])
 
-        if path not in checked_files:
-            yield _message({'filename': path}, "Nonlisted file")
+
+def write_json_report(results, outfile):
+    """Write results as JSON lines, one record per line.
+
+    Each file is written as soon as its result is available, so memory use
+    does not depend on the number of files. The last record is a summary
+    with the total number of bytes hashed, the hashing speed and the number
+    of files by status. Files whose digests were taken from the fixity cache
+    are not counted in the bytes hashed and the speed.
+
+    :results: Iterable over result records, see :func:`file_result`
+    :outfile: Text file object
+    :returns: Number of files with errors
+    """
+    started = time.monotonic()
+    status_counts = Counter()
+    total_bytes = 0
+    for result in results:
+        outfile.write(json.dumps({'type': 'file', **result}) + '\n')
+        status_counts[result['status']] += 1
+        if result['actual'] is not None and not result['cached']:
+            total_bytes += result['bytes'] or 0
+    elapsed = time.monotonic() - started
+
+    errors = sum(count for status, count in status_counts.items()
+                 if status in ERROR_STATUSES)
+    outfile.write(json.dumps({
+        'type': 'summary',
+        'files': sum(status_counts.values()),
+        'total_bytes': total_bytes,
+        'elapsed': elapsed,
+        'mb_per_second': total_bytes / 1e6 / elapsed if elapsed else None,
+        'status_counts': dict(status_counts),
+        'errors': errors}) + '\n')
+    return errors
 
 
 def main(arguments=None):
     """Main loop"""
 
     args = parse_arguments(arguments)
-
+    configure_logging(args.verbose)
+
+    fixity_cache = None
+    if args.fixity_cache:
+        fixity_cache = FixityCache(args.fixity_cache,
+                                   max_age=args.cache_trust)
+
+    options = {'workers': args.workers,
+               'fixity_cache': fixity_cache,
+               'rehash': args.rehash,
+               'buffer_size': args.buffer_size,
+               'read_order': args.read_order}
     returncode = 0
-    for error_message in check_checksums(ensure_text(args.sip_path)):
-        print(error_message)
-        returncode = 117
+    try:
+        if args.report == REPORT_JSON:
+            if write_json_report(check_results(ensure_text(args.sip_path),
+                                               **options), sys.stdout):
+                returncode = 117
+        else:
+            for error_message in check_checksums(ensure_text(args.sip_path),
+                                                 **options):
+                print(error_message)
+                returncode = 117
+    finally:
+        if fixity_cache is not None:
+            fixity_cache.close()
 
     return returncode
 
 
+def _mebibytes(value):
+    """Convert a positive number of mebibytes to bytes."""
+    size = int(float(value) * 1024 * 1024)
+    if size <= 0:
+        raise ValueError(f'Size must be positive, not {value}')
+    return size
+
+
 def parse_arguments(arguments):
     """ Create arguments parser and return parsed command line argumets"""
     parser = argparse.ArgumentParser()
-    parser.add_argument('sip_path')
+    parser.add_argument('sip_path',
+                        help='SIP directory, or tar or zip archive '
+                             'containing the SIP')
+    parser.add_argument('--report', choices=(REPORT_TEXT, REPORT_JSON),
+                        default=REPORT_TEXT,
+                        help='Report format. "json" writes a JSON record '
+                             'for each file and a summary record, one per '
+                             'line. (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of threads used for hashing files')
+    parser.add_argument('--buffer-size', type=_mebibytes,
+                        default=DEFAULT_BUFFER_SIZE, metavar='MIB',
+                        help='Size of the read buffer of each thread in '
+                             'MiB (default: 8)')
+    parser.add_argument('--read-order', choices=READ_ORDERS,
+                        default=READ_ORDER_METS,
+                        help='Order in which files are read. "inode" and '
+                             '"extent" read files in their physical order '
+                             'on disk, which is faster on rotational media. '
+                             '(default: %(default)s)')
+    parser.add_argument('--fixity-cache', metavar='PATH',
+                        help='SQLite database for caching digests of '
+                             'unchanged files between runs')
+    parser.add_argument('--cache-trust', type=parse_trust,
+                        default=TRUST_ALWAYS,
+                        help='How long cached digests are trusted: '
+                             '"always", "never" or number of hours '
+                             '(default: %(default)s)')
+    parser.add_argument('--rehash', action='store_true',
+                        help='Hash all files even if their digests are '
+                             'cached')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Write debug messages, e.g. peak memory use '
+                             'after reading METS, to standard error')
     return parser.parse_args(arguments)
 
 
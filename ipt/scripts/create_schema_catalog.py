@@ -10,12 +10,14 @@ import mets
 import premis
 import xml_helpers.utils
 from xml_helpers.schema_catalog import construct_catalog_xml
-from ipt.utils import parse_uri_filepath, ensure_text
+from ipt.utils import parse_uri_filepath, ensure_text, configure_logging
+from ipt.xml.mets import read_mets
 
 
 def main(arguments=None):
     """ The main method for create-schema-catalog script"""
     args = parse_arguments(arguments)
+    configure_logging(args.verbose)
     result = _create_schema_catalog(mets_path=args.mets,
                                     sip=args.sip,
                                     output_path=args.output_path,
@@ -44,6 +46,9 @@ def parse_arguments(arguments):
         default='/etc/xml/dpres-xml-schemas/schema_catalogs/catalog_main.xml',
         help=('File path to another existing (main) schema catalog to be '
               'added to the schema catalog that is constructed.'))
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Write debug messages, e.g. peak memory use '
+                             'after reading METS, to standard error')
 
     return parser.parse_args(arguments)
 
@@ -59,7 +64,7 @@ def _create_schema_catalog(mets_path, sip, output_path, catalog):
     :return: Integer 0 when no issue arises. 117 if METS file is missing.
     """
     try:
-        mets_tree = xml_helpers.utils.readfile(mets_path)
+        mets_tree = read_mets(mets_path)
     except OSError as err:
         print(ensure_text(str(err)), file=sys.stderr)
         return 117
@@ -1,10 +1,16 @@
 """
 Utility functions.
 """
+import logging
 import os
-from collections import defaultdict
+import re
+import sys
+from collections import defaultdict, deque
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from fractions import Fraction
+from functools import lru_cache
 import mimeparse
 
 import lxml.etree as ET
@@ -12,6 +18,16 @@ import lxml.etree as ET
 from urllib.parse import unquote_plus, urlparse
 
 
+# Strings with other characters cannot be parsed by Fraction
+_NUMBER_CHARACTERS = re.compile(r'[\s\d+\-./_eE]+\Z')
+# Plain decimal numbers, for which float() gives the same value as Fraction
+_PLAIN_DECIMAL = re.compile(r'[-+]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)\Z')
+# Longer plain decimals are handled with Fraction, which raises
+# OverflowError for too large values instead of returning infinity
+_PLAIN_DECIMAL_MAX_LENGTH = 32
+# Number of string values whose results handle_div remembers
+HANDLE_DIV_CACHE_SIZE = 4096
+
 _SCRAPER_PARAM_ADDML_KEY_RELATION = (('fields', 'header_fields'),
                                      ('separator', 'separator'),
                                      ('delimiter', 'delimiter'))
@@ -42,26 +58,87 @@ def merge_dicts(*dicts):
     """
     result = {}
     for dictionary in dicts:
-        if not dictionary:
+        merge_into(result, dictionary)
+    return result
+
+
+def merge_into(result, dictionary):
+    """
+    Merge dictionary in place into result, using the same rules as
+    merge_dicts(). Lists in result are extended and nested dictionaries
+    merged in place, so accumulating K dictionaries into the same result
+    takes linear time. Values taken from dictionary are copied, so that
+    dictionary is never modified by later merges.
+
+    If the dictionaries cannot be merged, TypeError is raised and result
+    is left untouched.
+
+    :result: Mutable mapping to merge into.
+    :dictionary: Mapping to merge.
+    :returns: result
+    """
+    if not dictionary:
+        return result
+    _check_mergeable(result, dictionary)
+    _merge_checked(result, dictionary)
+    return result
+
+
+def _check_mergeable(result, dictionary):
+    """
+    Recursive function for merge_into.
+    Raises TypeError if dictionary can not be merged into result.
+    """
+    for key, value in dictionary.items():
+        if key not in result:
+            continue
+        current = result[key]
+        if isinstance(current, Mapping) and isinstance(value, Mapping):
+            _check_mergeable(current, value)
+        elif isinstance(current, list) and isinstance(value, list):
+            continue
+        elif current is None or value is None:
+            continue
+        else:
+            raise TypeError('Only lists and dictionaries can be merged.')
+
+
+def _merge_checked(result, dictionary):
+    """
+    Recursive function for merge_into.
+    Merges dictionary into result, which must be checked to be mergeable.
+    """
+    for key, value in dictionary.items():
+        if key not in result:
+            result[key] = _copy_mergeable(value)
             continue
-        for key in dictionary.keys():
-            if key in result:
-                if isinstance(result[key], dict) and \
-                        isinstance(dictionary[key], dict):
-                    result[key] = merge_dicts(result[key], dictionary[key])
-                elif isinstance(result[key], list) and \
-                        isinstance(dictionary[key], list):
-                    result[key] = result[key] + dictionary[key]
-                elif result[key] is None:
-                    result[key] = dictionary[key]
-                elif dictionary[key] is None:
-                    continue
-                else:
-                    raise TypeError(
-                        'Only lists and dictionaries can be merged.')
+        current = result[key]
+        if isinstance(current, Mapping) and isinstance(value, Mapping):
+            if isinstance(current, MutableMapping):
+                _merge_checked(current, value)
             else:
-                result[key] = dictionary[key]
-    return result
+                # Immutable mappings are replaced with a merged copy
+                merged = _copy_mergeable(current, force=True)
+                _merge_checked(merged, value)
+                result[key] = merged
+        elif isinstance(current, list) and isinstance(value, list):
+            current.extend(value)
+        elif current is None:
+            result[key] = _copy_mergeable(value)
+
+
+def _copy_mergeable(value, force=False):
+    """
+    Copy the lists and mutable dictionaries in value that later merges
+    would modify in place. List elements are not copied, as they are never
+    merged.
+    """
+    if isinstance(value, MutableMapping) or \
+            (force and isinstance(value, Mapping)):
+        return {key: _copy_mergeable(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return list(value)
+    return value
 
 
 def compare_lists_of_dicts(expected, found):
@@ -159,13 +236,36 @@ def handle_div(div, decimals=2):
     :div: e.g. "16/9" or "1.7777778"
     :returns: e.g. "1.78"
     """
+    if isinstance(div, str):
+        return _handle_div_str(div, decimals)
+    return _handle_div_fraction(div, decimals)
+
+
+@lru_cache(maxsize=HANDLE_DIV_CACHE_SIZE)
+def _handle_div_str(div, decimals):
+    """handle_div for strings. Strings that cannot be numbers are returned
+    without parsing, and plain decimals are converted with float()."""
+    if not _NUMBER_CHARACTERS.match(div):
+        return div
+    if len(div) <= _PLAIN_DECIMAL_MAX_LENGTH and _PLAIN_DECIMAL.match(div):
+        # Adding zero turns "-0" into 0.0 like Fraction does, not -0.0
+        return _format_decimal(float(div) + 0.0, decimals)
+    return _handle_div_fraction(div, decimals)
+
+
+def _handle_div_fraction(div, decimals):
+    """handle_div using Fraction for any value."""
     try:
-        div = float(Fraction(div))
-        return ("%.2f" % round(div, decimals)).rstrip('0').rstrip('.')
+        return _format_decimal(float(Fraction(div)), decimals)
     except (ValueError, ZeroDivisionError):
         return div
 
 
+def _format_decimal(value, decimals):
+    """Format float with max <decimals> decimals for handle_div."""
+    return ("%.2f" % round(value, decimals)).rstrip('0').rstrip('.')
+
+
 def find_max_complete(list1, list2, forcekeys=None):
     """
     Finds such version in two lists of dicts, where all the elements in all
@@ -272,6 +372,10 @@ def pair_compatible_list_elements(list_a, list_b, check_compatible):
     gets more than one pair. Elements p and q can be paired iff
     check_compatible(p, q) returns True.
 
+    check_compatible is called once for each pair of elements, and the
+    pairing is found as a maximum bipartite matching, see
+    :func:`maximum_bipartite_matching`.
+
     :list_a: List of elements to pair
     :list_b: List of elements to pair
     :check_compatible: Function to test if some element in list_a can be paired
@@ -280,29 +384,99 @@ def pair_compatible_list_elements(list_a, list_b, check_compatible):
               in list_a which was paired with list_b[idx_b], or empty set if
               pairing is not possible.
     """
-
-    def _match(indices_a, indices_b):
-        if not indices_a:
-            # Nothing left to pair
-            return set()
-        idx_a = next(iter(indices_a))
-        for idx_b in indices_b:
-            if check_compatible(list_a[idx_a], list_b[idx_b]):
-                # Found matching elements, remove matched indices and pair
-                # the rest recursively
-                matched_indices = _match(indices_a - {idx_a},
-                                         indices_b - {idx_b})
-                if matched_indices or len(indices_a) == 1:
-                    # Pairing was successful, add indices of current matching
-                    # elements into the set of matched indices
-                    return matched_indices.union({(idx_a, idx_b)})
-        # list_a[idx_a] could not be paired with any element in list_b
-        return set()
-
     if len(list_a) != len(list_b):
         # If list lengths don't match, perfect pairing is impossible
         return set()
-    return _match(set(range(len(list_a))), set(range(len(list_b))))
+    adjacency = []
+    for element_a in list_a:
+        compatible = [idx_b for idx_b, element_b in enumerate(list_b)
+                      if check_compatible(element_a, element_b)]
+        if not compatible:
+            # list_a[idx_a] cannot be paired with any element in list_b
+            return set()
+        adjacency.append(compatible)
+    pairs = maximum_bipartite_matching(adjacency, len(list_b))
+    if len(pairs) != len(list_a):
+        return set()
+    return set(pairs.items())
+
+
+def maximum_bipartite_matching(adjacency, size_b):
+    """
+    Find a maximum matching of a bipartite graph with the Hopcroft-Karp
+    algorithm in O(E * sqrt(V)) time.
+
+    :adjacency: List of lists, where adjacency[idx_a] lists the indices of
+                the vertices in the second part that vertex idx_a of the
+                first part can be matched with
+    :size_b: Number of vertices in the second part
+    :returns: Dictionary of matched vertices {idx_a: idx_b}
+    """
+    match_a = [None] * len(adjacency)
+    match_b = [None] * size_b
+
+    def _layers():
+        """Compute distances of the vertices of the first part from the
+        unmatched vertices along alternating paths. Return None if there is
+        no augmenting path."""
+        distance = [None] * len(adjacency)
+        queue = deque()
+        for idx_a, idx_b in enumerate(match_a):
+            if idx_b is None:
+                distance[idx_a] = 0
+                queue.append(idx_a)
+        limit = None
+        while queue:
+            idx_a = queue.popleft()
+            if limit is not None and distance[idx_a] >= limit:
+                continue
+            for idx_b in adjacency[idx_a]:
+                next_a = match_b[idx_b]
+                if next_a is None:
+                    # Shortest augmenting paths end on this layer
+                    limit = distance[idx_a] + 1
+                elif distance[next_a] is None:
+                    distance[next_a] = distance[idx_a] + 1
+                    queue.append(next_a)
+        return distance if limit is not None else None
+
+    def _augment(root, distance):
+        """Search an augmenting path from root along the layers, and flip
+        the matching along it. The search is iterative, so that long paths
+        do not exhaust the recursion limit."""
+        stack = [(root, iter(adjacency[root]))]
+        path = []
+        while stack:
+            idx_a, candidates = stack[-1]
+            for idx_b in candidates:
+                next_a = match_b[idx_b]
+                if next_a is None:
+                    path.append(idx_b)
+                    for (path_a, _), path_b in zip(stack, path):
+                        match_a[path_a] = path_b
+                        match_b[path_b] = path_a
+                    return
+                if distance[next_a] == distance[idx_a] + 1:
+                    path.append(idx_b)
+                    stack.append((next_a, iter(adjacency[next_a])))
+                    break
+            else:
+                # Dead end, exclude the vertex from this phase
+                distance[idx_a] = None
+                stack.pop()
+                if path:
+                    path.pop()
+
+    while True:
+        distance = _layers()
+        if distance is None:
+            break
+        for idx_a in range(len(adjacency)):
+            if match_a[idx_a] is None:
+                _augment(idx_a, distance)
+
+    return {idx_a: idx_b for idx_a, idx_b in enumerate(match_a)
+            if idx_b is not None}
 
 
 def create_scraper_params(metadata_info):
@@ -416,6 +590,81 @@ def parse_uri_filepath(uri_path, accepted_schemes):
                                      parsed_result.path.lstrip('/')))
 
 
+def ordered_map(function, iterable, workers=1):
+    """Apply function to every item of iterable using a pool of threads.
+
+    Results are yielded in the order of the items. Only a bounded number of
+    items is read ahead from iterable, so it can be a long-running
+    generator. Threads are useful for functions that spend their time in
+    I/O or in code releasing the GIL, such as hashlib.
+
+    :function: Function taking one item as argument
+    :iterable: Items to process
+    :workers: Number of threads. With one worker, items are processed in
+              the calling thread.
+    :returns: Iterable over results of function
+    """
+    if workers <= 1:
+        yield from map(function, iterable)
+        return
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for item in iterable:
+                pending.append(executor.submit(function, item))
+                if len(pending) >= 4 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def sorted_map(function, items, key, workers=1):
+    """Apply function to items in the order given by key, but yield the
+    results in the original order of the items.
+
+    Results completed ahead of their turn are kept until all results before
+    them have been yielded.
+
+    :function: Function taking one item as argument
+    :items: Items to process
+    :key: Function returning sort key for an item
+    :workers: Number of threads, see :func:`ordered_map`
+    :returns: Iterable over results of function
+    """
+    items = list(items)
+    order = sorted(range(len(items)), key=lambda index: key(items[index]))
+    results = {}
+    next_index = 0
+    for index, result in zip(order, ordered_map(
+            lambda index: function(items[index]), order, workers)):
+        results[index] = result
+        while next_index in results:
+            yield results.pop(next_index)
+            next_index += 1
+
+
+def configure_logging(verbose=False):
+    """Configure logging of the command line tools.
+
+    Log messages of ipt are written to standard error. Debug messages, e.g.
+    the peak memory use after reading METS, are written only if verbose.
+
+    :verbose: True to write also debug messages
+    """
+    logger = logging.getLogger('ipt')
+    logger.setLevel(logging.DEBUG if verbose else logging.WARNING)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        logger.addHandler(handler)
+    # Standard error may have been replaced since the previous call
+    logger.handlers[0].setStream(sys.stderr)
+
+
 def ensure_binary(string, encoding='utf-8', errors='strict'):
     """Coerce string to binary.
     """
@@ -1,10 +1,22 @@
 """
-Module for national METS XML extensions
+Module for national METS XML extensions and reading METS documents
 """
 
+import logging
+import resource
+
+import lxml.etree as ET
+
 FI_NS = 'http://digitalpreservation.fi/schemas/mets/fi-extensions'
 FI_NS_KDK = 'http://www.kdk.fi/standards/mets/kdk-extensions'
 
+# Memory budget for reading a METS document with read_mets(): growth of the
+# peak resident set size in megabytes per megabyte of METS. The budget is
+# enforced by tests/xml/mets_test.py.
+MEMORY_BUDGET_PER_MB = 8
+
+LOGGER = logging.getLogger(__name__)
+
 
 def parse_spec_version(mets_root):
     """Parse specification version.
@@ -19,3 +31,42 @@ def parse_spec_version(mets_root):
     if specification is None:
         return None
     return specification.strip()
+
+
+def mets_parser():
+    """Return XML parser for reading METS documents in large-document mode.
+
+    The parser lifts the size limits of libxml2, so that METS documents of
+    digitised collections with hundreds of thousands of files can be read.
+    Comments, processing instructions and whitespace-only text are dropped
+    already while parsing, as they are never used by the tools.
+
+    :returns: lxml.etree.XMLParser
+    """
+    return ET.XMLParser(huge_tree=True,
+                        remove_comments=True,
+                        remove_pis=True,
+                        remove_blank_text=True,
+                        no_network=True)
+
+
+def read_mets(mets_path):
+    """Read METS document in large-document mode.
+
+    All tools that read mets.xml should use this function. Peak resident set
+    size of the process after reading is logged at debug level, which the
+    command line tools write with --verbose option. See MEMORY_BUDGET_PER_MB
+    for the memory required.
+
+    :mets_path: Path to METS document, or a file object
+    :returns: METS as lxml.etree.ElementTree
+    """
+    mets_tree = ET.parse(mets_path, parser=mets_parser())
+    LOGGER.debug('Read METS document %s, peak RSS %d kB',
+                 mets_path, peak_rss())
+    return mets_tree
+
+
+def peak_rss():
+    """Return peak resident set size of the current process in kilobytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -2,14 +2,21 @@
 This is a test module for bagit.py
 """
 
+import io
 import os
+import random
 import shutil
+import tarfile
+import time
 
 import pytest
 
 from ipt.aiptools.bagit import make_manifest, calculate_md5, \
-    write_manifest, write_bagit_txt, BagitError, check_directory_is_bagit, \
-    check_bagit_mandatory_files
+    calculate_digests, write_manifest, write_bagit_txt, BagitError, \
+    check_directory_is_bagit, check_bagit_mandatory_files, read_manifest, \
+    update_manifest, iter_manifest, iter_manifests, write_manifests, \
+    write_tagmanifests, update_bag_info, verify_bag, export_tar, \
+    remove_manifests, manifest_algorithm
 
 
 def test_make_manifest(testpath):
@@ -40,6 +47,329 @@ def test_make_manifest(testpath):
         [b'e80b5017098950fc58aad83c8c14978e', b'data/kuvat/image1.jpg']]
 
 
+def test_make_manifest_known_digests(bagit_no_manifest_fx, manifest_fx,
+                                     monkeypatch):
+    """Test that files with known digests are not hashed again."""
+    hashed = []
+    monkeypatch.setattr('ipt.aiptools.bagit.calculate_digests',
+                        lambda path, algorithms: hashed.append(path))
+
+    manifest = make_manifest(str(bagit_no_manifest_fx), known_digests={
+        line.split(b' ', 1)[1]: {'MD5': line.split(b' ', 1)[0]}
+        for line in manifest_fx.splitlines()})
+
+    assert b''.join(b'%s %s\n' % tuple(line) for line in manifest) == \
+        manifest_fx
+    assert hashed == []
+
+
+def test_make_manifest_workers(tmp_path):
+    """Test that manifest is sorted by path and does not depend on the
+    number of threads."""
+    for index in range(50):
+        for name in ('a', 'a.txt', f'dir_{index % 7}/a', 'a-b/c'):
+            path = tmp_path / 'data' / f'{index}' / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(f'{index} {name}')
+
+    manifest = make_manifest(str(tmp_path))
+    paths = [line[1] for line in manifest]
+    assert len(paths) == 200
+    assert paths == sorted(paths)
+    assert make_manifest(str(tmp_path), workers=4) == manifest
+
+
+def test_update_manifest(tmp_path, monkeypatch):
+    """Test that only new and modified files are hashed when updating
+    manifest incrementally."""
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    for name in ('unchanged.txt', 'changed.txt', 'deleted.txt'):
+        (data_path / name).write_text(name)
+    write_manifest(make_manifest(str(tmp_path)), str(tmp_path))
+    # Timestamps cannot be set in the past for status change time, so the
+    # manifest is moved to the future instead
+    manifest_time = time.time() + 100
+    os.utime(str(tmp_path / 'manifest-md5.txt'),
+             (manifest_time, manifest_time))
+
+    (data_path / 'changed.txt').write_text('new content')
+    os.utime(str(data_path / 'changed.txt'),
+             (manifest_time + 100, manifest_time + 100))
+    (data_path / 'deleted.txt').unlink()
+    (data_path / 'new.txt').write_text('new.txt')
+
+    hashed = []
+    monkeypatch.setattr(
+        'ipt.aiptools.bagit.calculate_digests',
+        lambda path, algorithms: hashed.append(path) or calculate_digests(
+            path, algorithms))
+    counts = {}
+    manifest = list(update_manifest(str(tmp_path), counts, workers=2))
+
+    assert sorted(hashed) == [bytes(data_path / 'changed.txt'),
+                              bytes(data_path / 'new.txt')]
+    assert counts == {'new': 1, 'changed': 1, 'unchanged': 1, 'deleted': 1,
+                      'rehashed': 1}
+    monkeypatch.setattr('ipt.aiptools.bagit.calculate_digests',
+                        calculate_digests)
+    assert manifest == make_manifest(str(tmp_path))
+
+
+def test_iter_manifests(bagit_with_manifest_fx, manifest_fx, monkeypatch):
+    """Test that digests of several algorithms are calculated with a single
+    read of each file, and only for algorithms not already known."""
+    bagit_path = str(bagit_with_manifest_fx)
+    calls = []
+    monkeypatch.setattr(
+        'ipt.aiptools.bagit.calculate_digests',
+        lambda path, algorithms: calls.append(algorithms) or
+        calculate_digests(path, algorithms))
+
+    manifests = list(iter_manifests(bagit_path, ['md5', 'SHA-256']))
+    assert all(algorithms == ['md5', 'sha256'] for algorithms in calls)
+    assert b''.join(b'%s %s\n' % (digests['md5'], path)
+                    for path, digests in manifests) == manifest_fx
+    path, digests = manifests[0]
+    assert digests['sha256'] == calculate_digests(
+        os.path.join(bagit_path.encode(), path),
+        ['sha256'])['sha256'].encode()
+
+    calls.clear()
+    known_digests = {path: {'md5': digests['md5']}
+                     for path, digests in manifests}
+    assert list(iter_manifests(bagit_path, ['md5', 'sha256'],
+                               known_digests=known_digests)) == manifests
+    assert all(algorithms == ['sha256'] for algorithms in calls)
+
+
+def test_tag_file_names_in_payload(tmp_path):
+    """Test that files named like tag files are skipped only at the root of
+    bagit."""
+    names = ['bagit.txt', 'bag-info.txt', 'manifest-md5.txt',
+             'manifest-sha256.txt', 'tagmanifest-md5.txt']
+    (tmp_path / 'data' / 'sip').mkdir(parents=True)
+    for name in names:
+        (tmp_path / name).write_text(name)
+        (tmp_path / 'data' / 'sip' / name).write_text(name)
+
+    assert [path for _, path in make_manifest(str(tmp_path))] == sorted(
+        f'data/sip/{name}'.encode() for name in names)
+
+
+def test_write_manifests(bagit_with_manifest_fx, manifest_fx):
+    """Test writing payload and tag manifests of several algorithms."""
+    bagit_path = str(bagit_with_manifest_fx)
+    (bagit_with_manifest_fx / 'manifest-md5.txt').unlink()
+    write_manifests(iter_manifests(bagit_path, ['md5', 'sha512']),
+                    bagit_path, ['md5', 'sha512'])
+    write_tagmanifests(bagit_path, ['md5', 'sha512'])
+
+    assert sorted(os.listdir(bagit_path)) == [
+        'bagit.txt', 'data', 'manifest-md5.txt', 'manifest-sha512.txt',
+        'tagmanifest-md5.txt', 'tagmanifest-sha512.txt']
+    assert (bagit_with_manifest_fx / 'manifest-md5.txt').read_bytes() == \
+        manifest_fx
+    assert len(read_manifest(bagit_path, 'sha512')) == \
+        len(manifest_fx.splitlines())
+    tagmanifest = (bagit_with_manifest_fx / 'tagmanifest-md5.txt').read_text()
+    assert [line.split(' ', 1)[1] for line in tagmanifest.splitlines()] == [
+        'bagit.txt', 'manifest-md5.txt', 'manifest-sha512.txt']
+
+    # Manifests are not listed in manifests
+    assert all(not path.startswith(b'manifest') and
+               not path.startswith(b'tagmanifest')
+               for _, path in make_manifest(bagit_path))
+
+
+def test_update_manifest_modified_during_write(tmp_path):
+    """Test that a file modified after it was hashed, but before the
+    manifest was written completely, is hashed again when updating."""
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    for name in ('a.txt', 'b.txt', 'c.txt'):
+        (data_path / name).write_text(name)
+
+    def _modifying_manifest():
+        for index, line in enumerate(iter_manifest(str(tmp_path))):
+            yield line
+            if index == 0:
+                (data_path / 'a.txt').write_text('modified')
+                # Writing the manifest finishes clearly after modification
+                time.sleep(0.1)
+
+    write_manifest(_modifying_manifest(), str(tmp_path))
+    # Manifest has the digest of the file before it was modified
+    assert read_manifest(str(tmp_path))[b'data/a.txt'] != \
+        calculate_md5(str(data_path / 'a.txt')).encode()
+
+    counts = {}
+    manifest = list(update_manifest(str(tmp_path), counts))
+    assert counts['rehashed'] >= 1
+    assert counts['changed'] == 1
+    assert manifest == make_manifest(str(tmp_path))
+
+
+def test_read_manifest(tmp_path):
+    """Test reading manifest with various separators."""
+    (tmp_path / 'manifest-md5.txt').write_bytes(
+        b'abc data/a b.txt\n'
+        b'def  *data/c.txt\r\n'
+        b'\n')
+    assert read_manifest(str(tmp_path)) == {b'data/a b.txt': b'abc',
+                                            b'data/c.txt': b'def'}
+
+    (tmp_path / 'manifest-md5.txt').write_bytes(b'abc\n')
+    with pytest.raises(BagitError):
+        read_manifest(str(tmp_path))
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_verify_bag(tmp_path, workers):
+    """Test that invalid checksums, missing files and nonlisted files are
+    reported."""
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    for index in range(20):
+        (data_path / f'file_{index}.txt').write_text(f'{index}')
+    write_manifest(make_manifest(str(tmp_path)), str(tmp_path))
+    assert list(verify_bag(str(tmp_path), workers=workers)) == []
+
+    (data_path / 'file_3.txt').write_text('corrupted')
+    (data_path / 'file_5.txt').unlink()
+    (data_path / 'extra.txt').write_text('extra')
+
+    assert list(verify_bag(str(tmp_path), workers=workers)) == [
+        ('Invalid checksum', b'data/file_3.txt'),
+        ('File does not exist', b'data/file_5.txt'),
+        ('Nonlisted file', b'data/extra.txt')]
+
+    # Files are not hashed, but missing files are still found
+    assert list(verify_bag(str(tmp_path), workers=workers, sample=0)) == [
+        ('File does not exist', b'data/file_5.txt'),
+        ('Nonlisted file', b'data/extra.txt')]
+
+
+def test_verify_bag_algorithms(tmp_path):
+    """Test that files are verified against manifests of all algorithms,
+    also when there is no md5 manifest."""
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    for name in ('a.txt', 'b.txt'):
+        (data_path / name).write_text(name)
+    bagit_path = str(tmp_path)
+    write_manifests(iter_manifests(bagit_path, ['sha512']), bagit_path,
+                    ['sha512'])
+    assert list(verify_bag(bagit_path)) == []
+
+    write_manifest(make_manifest(bagit_path), bagit_path)
+    (tmp_path / 'manifest-sha512.txt').write_bytes(
+        (tmp_path / 'manifest-sha512.txt').read_bytes().replace(
+            b'data/a.txt', b'data/c.txt'))
+    assert sorted(verify_bag(bagit_path)) == [
+        ('File does not exist', b'data/c.txt'),
+        ('Nonlisted file', b'data/a.txt')]
+
+    (tmp_path / 'manifest-md5.txt').unlink()
+    (tmp_path / 'manifest-sha512.txt').unlink()
+    with pytest.raises(BagitError):
+        list(verify_bag(bagit_path))
+
+
+def test_verify_bag_unreadable(tmp_path, monkeypatch):
+    """Test that files which cannot be read are reported as errors."""
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    for name in ('a.txt', 'b.txt'):
+        (data_path / name).write_text(name)
+    bagit_path = str(tmp_path)
+    write_manifest(make_manifest(bagit_path), bagit_path)
+
+    # Manifest entry pointing to a directory
+    (tmp_path / 'manifest-md5.txt').write_bytes(
+        (tmp_path / 'manifest-md5.txt').read_bytes() +
+        b'd41d8cd98f00b204e9800998ecf8427e data\n')
+    assert list(verify_bag(bagit_path)) == [('Unreadable file', b'data')]
+
+    # File without read permission
+    def _calculate_digests(path, algorithms):
+        """Deny reading a.txt"""
+        if path.endswith(b'a.txt'):
+            raise PermissionError(path)
+        return calculate_digests(path, algorithms)
+
+    write_manifest(make_manifest(bagit_path), bagit_path)
+    monkeypatch.setattr('ipt.aiptools.bagit.calculate_digests',
+                        _calculate_digests)
+    assert list(verify_bag(bagit_path)) == [
+        ('Unreadable file', b'data/a.txt')]
+
+
+def test_verify_bag_unsupported_algorithm(tmp_path):
+    """Test that files of a manifest whose algorithm hashlib does not
+    support are reported as errors."""
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    (data_path / 'a.txt').write_text('a')
+    (tmp_path / 'manifest-nosuchhash.txt').write_bytes(b'abcd data/a.txt\n')
+    assert list(verify_bag(str(tmp_path))) == [
+        ('Unsupported algorithm', b'data/a.txt')]
+
+
+@pytest.mark.parametrize(('algorithm', 'expected'), [
+    ('MD5', 'md5'),
+    ('SHA-512', 'sha512'),
+    ('sha3_256', None),
+    ('sha3-256', None),
+    ('nosuchhash', None),
+])
+def test_manifest_algorithm(algorithm, expected):
+    """Test that only hashlib algorithms whose names are allowed in
+    manifest file names are accepted."""
+    if expected is None:
+        with pytest.raises(ValueError):
+            manifest_algorithm(algorithm)
+    else:
+        assert manifest_algorithm(algorithm) == expected
+
+
+def test_remove_manifests(tmp_path):
+    """Test that only manifests of other algorithms are removed."""
+    names = ['bagit.txt', 'manifest-md5.txt', 'manifest-sha512.txt',
+             'tagmanifest-md5.txt', 'tagmanifest-sha512.txt']
+    for name in names:
+        (tmp_path / name).write_text(name)
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'data' / 'manifest-md5.txt').write_text('payload')
+
+    remove_manifests(str(tmp_path), ['SHA-512'])
+    remove_manifests(str(tmp_path), manifest_type='tagmanifest')
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'bagit.txt', 'data', 'manifest-sha512.txt']
+    assert (tmp_path / 'data' / 'manifest-md5.txt').exists()
+
+
+def test_verify_bag_sample(tmp_path, monkeypatch):
+    """Test that only a sample of files is hashed."""
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    for index in range(1000):
+        (data_path / f'file_{index}.txt').write_text(f'{index}')
+    write_manifest(make_manifest(str(tmp_path)), str(tmp_path))
+
+    hashed = []
+    monkeypatch.setattr(
+        'ipt.aiptools.bagit.calculate_digests',
+        lambda path, algorithms: hashed.append(path) or calculate_digests(
+            path, algorithms))
+    assert list(verify_bag(str(tmp_path), sample=0.1,
+                           random_source=random.Random(1))) == []
+    assert 50 < len(hashed) < 150
+
+    with pytest.raises(ValueError):
+        list(verify_bag(str(tmp_path), sample=1.5))
+
+
 def test_write_manifest(testpath):
     """Test for writing manifest file"""
     sip_dir = os.path.join(testpath, 'sip')
@@ -54,6 +384,78 @@ def test_write_manifest(testpath):
         assert lines[1] == 'ab232 ' + os.path.join(sip_dir, 'file2.txt') + '\n'
 
 
+def test_write_manifest_streaming(bagit_with_manifest_fx, manifest_fx):
+    """Test that manifest is written from an iterator to a temporary file,
+    which is not included in the manifest, and renamed in place only if
+    all lines are written."""
+    bagit_path = str(bagit_with_manifest_fx)
+    write_manifest(iter_manifest(bagit_path), bagit_path)
+    assert (bagit_with_manifest_fx / 'manifest-md5.txt').read_bytes() == \
+        manifest_fx
+
+    def _failing_manifest():
+        yield [b'abc', b'data/file.txt']
+        raise OSError('Hashing failed')
+
+    with pytest.raises(OSError):
+        write_manifest(_failing_manifest(), bagit_path)
+    assert (bagit_with_manifest_fx / 'manifest-md5.txt').read_bytes() == \
+        manifest_fx
+    assert sorted(os.listdir(bagit_path)) == [
+        'bagit.txt', 'data', 'manifest-md5.txt']
+
+
+def test_export_tar(bagit_with_manifest_fx, manifest_fx, monkeypatch):
+    """Test that bag is exported as a tar archive with manifests computed
+    while writing the files, appended as the final members."""
+    bagit_path = str(bagit_with_manifest_fx)
+    (bagit_with_manifest_fx / 'manifest-md5.txt').write_bytes(b'stale\n')
+    monkeypatch.setattr('ipt.aiptools.bagit.calculate_digests', None)
+
+    outfile = io.BytesIO()
+    export_tar(bagit_path, outfile, ['md5', 'sha256'])
+
+    bag_name = os.path.basename(bagit_path)
+    outfile.seek(0)
+    with tarfile.open(fileobj=outfile) as tar:
+        names = tar.getnames()
+        assert names[-3:] == [f'{bag_name}/manifest-md5.txt',
+                              f'{bag_name}/manifest-sha256.txt',
+                              f'{bag_name}/bagit.txt']
+        assert tar.extractfile(names[-3]).read() == manifest_fx
+        assert tar.extractfile(names[-1]).read().startswith(
+            b'BagIt-Version: ')
+        for name in names[:-3]:
+            relpath = name.split('/', 1)[1]
+            assert tar.extractfile(name).read() == \
+                (bagit_with_manifest_fx / relpath).read_bytes()
+        assert len(names) == len(manifest_fx.splitlines()) + 3
+    assert (bagit_with_manifest_fx / 'manifest-md5.txt').read_bytes() == \
+        b'stale\n'
+
+
+def test_export_tar_bag_info(bagit_with_manifest_fx):
+    """Test that bag-info.txt is exported without the record of digests
+    taken without hashing, since all files are hashed on export."""
+    bagit_path = str(bagit_with_manifest_fx)
+    update_bag_info(bagit_path, {'Source-Organization': 'Org',
+                                 'Payload-Digest-Source': 'METS'})
+    outfile = io.BytesIO()
+    export_tar(bagit_path, outfile)
+    outfile.seek(0)
+    with tarfile.open(fileobj=outfile) as tar:
+        assert tar.extractfile(tar.getnames()[-2]).read() == \
+            b'Source-Organization: Org\n'
+
+    update_bag_info(bagit_path, {'Source-Organization': None})
+    outfile = io.BytesIO()
+    export_tar(bagit_path, outfile)
+    outfile.seek(0)
+    with tarfile.open(fileobj=outfile) as tar:
+        assert not any(name.endswith('/bag-info.txt')
+                       for name in tar.getnames())
+
+
 def test_write_bagit_txt(testpath):
     """Test for writing bagit.txt"""
     write_bagit_txt(testpath)
@@ -63,6 +465,29 @@ def test_write_bagit_txt(testpath):
         assert lines[1] == 'Tag-File-Character-Encoding: UTF-8\n'
 
 
+def test_update_bag_info(bagit_with_manifest_fx, manifest_fx):
+    """Test that fields of bag-info.txt are updated and removed, keeping
+    other fields, and that bag-info.txt is not listed in manifest."""
+    bagit_path = str(bagit_with_manifest_fx)
+    bag_info_path = bagit_with_manifest_fx / 'bag-info.txt'
+    update_bag_info(bagit_path, {'Source-Organization': None})
+    assert not bag_info_path.exists()
+
+    bag_info_path.write_text('Source-Organization: Org\n'
+                             'Payload-Digest-Source: Old value\n'
+                             '    continued\n')
+    update_bag_info(bagit_path, {'Payload-Digest-Source': 'New value'})
+    assert bag_info_path.read_text() == ('Source-Organization: Org\n'
+                                         'Payload-Digest-Source: New value\n')
+    update_bag_info(bagit_path, {'Payload-Digest-Source': None})
+    assert bag_info_path.read_text() == 'Source-Organization: Org\n'
+    update_bag_info(bagit_path, {'Source-Organization': None})
+    assert not bag_info_path.exists()
+
+    assert b''.join(b'%s %s\n' % tuple(line)
+                    for line in make_manifest(bagit_path)) == manifest_fx
+
+
 def test_bagit_structure(bagit_with_manifest_fx):
     """Test bagit the created bagit structure"""
     assert (bagit_with_manifest_fx / 'data').is_dir()
@@ -82,6 +507,18 @@ def test_bagit_missing_files(bagit_with_manifest_fx, filename):
         check_bagit_mandatory_files(str(bagit_with_manifest_fx))
 
 
+def test_bagit_other_manifest(bagit_with_manifest_fx):
+    """Test that manifest of any algorithm is accepted as mandatory
+    manifest, but a tag manifest is not."""
+    (bagit_with_manifest_fx / 'manifest-md5.txt').rename(
+        bagit_with_manifest_fx / 'tagmanifest-md5.txt')
+    with pytest.raises(BagitError):
+        check_bagit_mandatory_files(str(bagit_with_manifest_fx))
+
+    (bagit_with_manifest_fx / 'manifest-sha512.txt').write_text('')
+    assert check_bagit_mandatory_files(str(bagit_with_manifest_fx)) == 0
+
+
 def test_bagit_missing_datadir(bagit_with_manifest_fx):
     """Test that bagit util raises exception if any of the mandatory files are
     missing"""
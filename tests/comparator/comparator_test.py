@@ -16,9 +16,11 @@ The tests check the dictionary returned by the result() method to ensure that:
 """
 
 
+import json
 from copy import deepcopy
 import pytest
 from file_scraper.scraper import Scraper
+import ipt.comparator.comparator
 from ipt.comparator.comparator import MetadataComparator
 from ipt.utils import concat
 
@@ -301,3 +303,46 @@ def test_invalid_result(test_params, monkeypatch):
     expected_error = test_params['expected_error']
     assert expected_error in concat(result['errors'])
     assert not result['is_valid']
+
+
+def test_streams_compared_once(monkeypatch):
+    """Test that versions of each scraper stream are harmonized only once
+    when pairing streams of a video container."""
+    monkeypatch.setattr(Scraper, 'is_textfile', _is_textfile)
+    harmonized = []
+    harmonized_versions = ipt.comparator.comparator._harmonized_versions
+    monkeypatch.setattr(
+        'ipt.comparator.comparator._harmonized_versions',
+        lambda scraper_format, rules=None: harmonized.append(
+            scraper_format) or harmonized_versions(scraper_format, rules))
+
+    result = MetadataComparator(METADATA_INFO['valid_video'],
+                                SCRAPER_STREAMS['valid_video']
+                                ).result()
+    assert result['is_valid']
+    # Container format, two audio streams and one video stream
+    assert len(harmonized) == 4
+
+
+def test_error_records(monkeypatch):
+    """Test that errors are stored as records, which are rendered as text
+    or serialized as JSON only when requested."""
+    monkeypatch.setattr(Scraper, 'is_textfile', _is_textfile)
+    metadata_info = patch_dict(METADATA_INFO['valid_video'],
+                               [['audio_streams', 0, 'audio', 'bit_rate',
+                                 200]])
+    comparator = MetadataComparator(metadata_info,
+                                    SCRAPER_STREAMS['valid_video'])
+    result = comparator.result()
+    assert not result['is_valid']
+
+    records = comparator.error_records()
+    assert len(records) == 1
+    assert records[0].mets_value == metadata_info['audio_streams']
+    assert result['errors'] == ['ERROR: ' + str(records[0])]
+    assert '"bit_rate": 200' in result['errors'][0]
+
+    errors = json.loads(json.dumps(records[0].as_dict(), default=dict))
+    assert errors['error'] == records[0].info
+    assert errors['mets'][0]['audio']['bit_rate'] == 200
+    assert len(errors['scraper']) == 2
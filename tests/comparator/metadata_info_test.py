@@ -0,0 +1,127 @@
+"""Tests for metadata_info records."""
+
+import copy
+import json
+import pickle
+import tracemalloc
+
+import pytest
+
+from ipt.comparator.metadata_info import Format, MetadataInfo, Stream
+from ipt.utils import create_scraper_params
+
+METADATA_INFO = {
+    'filename': '/sip/data/file.csv',
+    'relpath': 'data/file.csv',
+    'use': '',
+    'format': {'mimetype': 'text/csv', 'version': '', 'charset': 'UTF-8'},
+    'object_id': {'type': 'UUID', 'value': 'urn:uuid:1234'},
+    'algorithm': 'MD5',
+    'digest': 'aa4bddaacf5ed1ca92b30826af257a1b',
+    'errors': None,
+    'spec_version': '1.7.3',
+    'addml': {'header_fields': ['a', 'b'],
+              'separator': 'CR+LF',
+              'delimiter': ';'}
+}
+
+
+def test_dict_access():
+    """Test that records can be used like metadata_info dictionaries."""
+    metadata_info = MetadataInfo(copy.deepcopy(METADATA_INFO))
+
+    assert metadata_info == METADATA_INFO
+    assert METADATA_INFO == metadata_info
+    assert metadata_info['format']['charset'] == 'UTF-8'
+    assert 'addml' in metadata_info
+    assert 'audio' not in metadata_info
+    assert metadata_info.get('audio_streams') is None
+    assert set(metadata_info.keys()) == set(METADATA_INFO.keys())
+    assert create_scraper_params(metadata_info) == {
+        'charset': 'UTF-8',
+        'fields': ['a', 'b'],
+        'separator': 'CR+LF',
+        'delimiter': ';'}
+
+    metadata_info['errors'] = 'Some error'
+    assert metadata_info['errors'] == 'Some error'
+    assert metadata_info.pop('addml')['delimiter'] == ';'
+    assert 'addml' not in metadata_info
+    with pytest.raises(KeyError):
+        del metadata_info['addml']
+    with pytest.raises(KeyError):
+        metadata_info['addml']
+
+
+def test_nested_records():
+    """Test that nested dictionaries are converted to records."""
+    metadata_info = MetadataInfo(copy.deepcopy(METADATA_INFO))
+    metadata_info['audio_streams'] = [
+        {'format': {'mimetype': 'audio/aac', 'version': ''},
+         'audio': {'channels': '2'}}]
+
+    stream = metadata_info['audio_streams'][0]
+    assert isinstance(stream, Stream)
+    assert isinstance(stream['format'], Format)
+    assert stream['audio'] == {'channels': '2'}
+    assert metadata_info.to_dict()['audio_streams'] == [
+        {'format': {'mimetype': 'audio/aac', 'version': ''},
+         'audio': {'channels': '2'}}]
+
+
+def test_shared_format():
+    """Test that formats are shared between records and are immutable."""
+    first = MetadataInfo(copy.deepcopy(METADATA_INFO))
+    second = MetadataInfo(copy.deepcopy(METADATA_INFO))
+    assert first['format'] is second['format']
+
+    with pytest.raises(TypeError):
+        # pylint: disable=unsupported-assignment-operation
+        first['format']['version'] = '1.0'
+
+    first['format'] = {'mimetype': 'text/plain', 'version': ''}
+    assert second['format']['mimetype'] == 'text/csv'
+
+
+def test_serialization():
+    """Test that records can be copied, pickled and dumped to JSON."""
+    metadata_info = MetadataInfo(copy.deepcopy(METADATA_INFO))
+
+    assert copy.deepcopy(metadata_info) == METADATA_INFO
+    assert pickle.loads(pickle.dumps(metadata_info)) == METADATA_INFO
+    assert json.loads(json.dumps(metadata_info, default=dict)) == \
+        METADATA_INFO
+
+
+def test_memory_usage():
+    """Test that records take at least three times less memory than the
+    corresponding dictionaries. Strings are created beforehand, so that only
+    the memory used by the containers is measured.
+    """
+    count = 10000
+    values = [(f'/sip/data/file_{i}.png', f'data/file_{i}.png',
+               f'{i:032x}', f'urn:uuid:{i:032x}') for i in range(count)]
+
+    def _metadata_info(filename, relpath, digest, uuid):
+        return {'filename': filename,
+                'relpath': relpath,
+                'use': '',
+                'format': {'mimetype': 'image/png', 'version': '1.2'},
+                'object_id': {'type': 'UUID', 'value': uuid},
+                'algorithm': 'MD5',
+                'digest': digest,
+                'errors': None,
+                'spec_version': '1.7.3'}
+
+    def _measure(record_type):
+        tracemalloc.start()
+        try:
+            records = [record_type(_metadata_info(*value))
+                       for value in values]
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        assert len(records) == count
+        return size
+
+    assert _measure(dict) >= 3 * _measure(MetadataInfo)
@@ -0,0 +1,51 @@
+"""Tests for ipt.comparator.rules module."""
+
+import pytest
+
+from ipt.comparator.rules import DEFAULT_RULES, RULES, ComparisonRules
+
+
+@pytest.mark.parametrize(('mimetype', 'version', 'expected'), [
+    ('image/jpeg', '1.02', {'1.02'}),
+    ('audio/x-wav', '(:unap)', {''}),
+    ('image/jpeg', '(:unav)', set()),
+    ('image/jpeg', None, set()),
+    ('application/vnd.oasis.opendocument.text', '(:unav)',
+     {'1.0', '1.1', '1.2'}),
+    ('application/vnd.oasis.opendocument.formula', None, {'1.0', '1.2'}),
+    ('application/pdf', 'A-1b', {'A-1b', '1.4'}),
+    ('application/pdf', 'A-3u', {'A-3u', '1.7'}),
+    ('application/pdf', '1.4', {'1.4'}),
+    ('image/tiff', 'A-1b', {'A-1b'}),
+])
+def test_harmonized_versions(mimetype, version, expected):
+    """Test versions accepted in METS for versions found by scraper."""
+    assert RULES.lookup(mimetype).harmonized_versions(version) == expected
+
+
+def test_lookup():
+    """Test that rules are selected by mimetype and stream type, and
+    compiled only once."""
+    audio_rules = RULES.lookup('audio/aac', 'audio')
+    assert audio_rules.integer_keys == {'data_rate'}
+    assert audio_rules.unavailable_values == ('(:unav)', '0')
+    assert audio_rules.etal_keys == {'display_aspect_ratio'}
+    assert RULES.lookup('audio/aac', 'audio') is audio_rules
+
+    assert RULES.lookup('video/h264', 'video').integer_keys == set()
+    assert RULES.lookup('audio/aac').integer_keys == set()
+
+
+def test_custom_rules():
+    """Test that new exceptions are added as rules."""
+    rules = ComparisonRules(DEFAULT_RULES + [
+        {'mimetype': 'video/h264', 'stream_type': 'video',
+         'integer_keys': ['bit_rate'], 'etal_keys': ['avg_frame_rate']}])
+    video_rules = rules.lookup('video/h264', 'video')
+    assert video_rules.integer_keys == {'bit_rate'}
+    assert video_rules.etal_keys == {'display_aspect_ratio',
+                                     'avg_frame_rate'}
+    assert rules.lookup('video/mpeg', 'video').integer_keys == set()
+
+    with pytest.raises(ValueError):
+        ComparisonRules([{'mimetype': 'video/h264', 'unknown': []}])
@@ -0,0 +1,68 @@
+"""Tests for ipt.comparator.utils module."""
+
+import lxml.etree as ET
+import pytest
+
+from ipt.comparator.utils import mdwrap_to_metadata_info, register_md_parser
+
+
+def mdwrap(mdtype, othermdtype=None, content='<object>a</object>'):
+    """Return mdWrap element of given type with content in xmlData."""
+    attributes = f'MDTYPE="{mdtype}"'
+    if othermdtype is not None:
+        attributes += f' OTHERMDTYPE="{othermdtype}"'
+    return ET.fromstring(
+        f'<mets:mdWrap xmlns:mets="http://www.loc.gov/METS/" {attributes}>'
+        f'<mets:xmlData>{content}</mets:xmlData></mets:mdWrap>')
+
+
+@pytest.fixture(autouse=True)
+def md_parsers(monkeypatch):
+    """Keep parsers registered in tests out of the module registry."""
+    monkeypatch.setattr('ipt.comparator.utils._MD_PARSERS', {})
+    monkeypatch.setattr('ipt.comparator.utils._OTHER_MD_PARSERS', {})
+
+
+def test_register_md_parser():
+    """Test that parsers are looked up by MDTYPE, and by OTHERMDTYPE when
+    it is given."""
+    register_md_parser(lambda xmldata: {'parser': 'premis',
+                                        'tag': xmldata.tag},
+                       mdtype='PREMIS:OBJECT')
+    register_md_parser(lambda xmldata: {'parser': 'custom'},
+                       othermdtype='Custom')
+
+    assert mdwrap_to_metadata_info(mdwrap('PREMIS:OBJECT')) == {
+        'parser': 'premis', 'tag': 'object'}
+    assert mdwrap_to_metadata_info(
+        mdwrap('PREMIS:OBJECT', othermdtype='Custom')) == {'parser': 'custom'}
+    assert mdwrap_to_metadata_info(mdwrap('OTHER', othermdtype='Custom')) \
+        == {'parser': 'custom'}
+
+    with pytest.raises(ValueError):
+        register_md_parser(lambda xmldata: {})
+
+
+def test_unsupported_mdtype():
+    """Test that metadata without a parser gives an empty metadata_info,
+    also when OTHERMDTYPE has no parser but MDTYPE has."""
+    register_md_parser(lambda xmldata: {'parser': 'premis'},
+                       mdtype='PREMIS:OBJECT')
+
+    assert mdwrap_to_metadata_info(mdwrap('MIX')) == {}
+    assert mdwrap_to_metadata_info(
+        mdwrap('PREMIS:OBJECT', othermdtype='Unknown')) == {}
+    assert mdwrap_to_metadata_info(None) == {}
+
+
+def test_parser_key_error():
+    """Test that metadata missing an element the parser needs gives an
+    empty metadata_info."""
+
+    def _parser(xmldata):
+        """Parser which does not find its element"""
+        raise KeyError('element')
+
+    register_md_parser(_parser, othermdtype='AudioMD')
+    assert mdwrap_to_metadata_info(mdwrap('OTHER', othermdtype='AudioMD')) \
+        == {}
@@ -121,11 +121,11 @@ def bagit_no_manifest_fx(tmp_path, chars_fx):
 def manifest_fx(chars_fx):
     """Return manifest file contents as bytes"""
     return b"\n".join([
-        b"84a37a4d5bd4b36db0da5379aa6fbde3 "
-        b"data/transfers/sip_X/mets.xml",
-
         b"e80b5017098950fc58aad83c8c14978e "
-        b"data/transfers/sip_X/files/file_X\n"
+        b"data/transfers/sip_X/files/file_X",
+
+        b"84a37a4d5bd4b36db0da5379aa6fbde3 "
+        b"data/transfers/sip_X/mets.xml\n"
     ]).replace(b'X', ensure_binary(chars_fx))
 
 
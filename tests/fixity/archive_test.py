@@ -0,0 +1,71 @@
+"""Tests for ipt.fixity.archive module."""
+
+import shutil
+
+import pytest
+
+from ipt.fixity.archive import ArchiveError, is_archive, open_archive
+
+FILES = {
+    'mets.xml': b'<mets/>',
+    'data/a.txt': b'abcd',
+    'data/b/c.txt': b'abcdef',
+    'data/mets.xml': b'<other/>'
+}
+
+
+@pytest.fixture
+def sip_dir(tmp_path):
+    """Create a SIP directory inside a parent directory."""
+    for name, content in FILES.items():
+        path = tmp_path / 'parent' / 'sip' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return tmp_path / 'parent'
+
+
+@pytest.mark.parametrize('archive_format', ['tar', 'gztar', 'zip'])
+@pytest.mark.parametrize('root_dir', ['parent', 'parent/sip'])
+def test_open_archive(sip_dir, tmp_path, archive_format, root_dir):
+    """Test reading SIP at the root of an archive or inside a directory."""
+    archive_path = shutil.make_archive(
+        str(tmp_path / 'archive'), archive_format,
+        root_dir=str(tmp_path / root_dir))
+    assert is_archive(archive_path)
+    assert not is_archive(str(sip_dir / 'sip' / 'mets.xml'))
+
+    with open_archive(archive_path) as archive:
+        assert archive.sizes() == {
+            name: len(content) for name, content in FILES.items()}
+        with archive.open_mets() as mets_file:
+            assert mets_file.read() == b'<mets/>'
+
+        files = {relpath: stream.read() for relpath, stream
+                 in archive.iter_files({'data/a.txt', 'data/b/c.txt'})}
+    assert files == {'data/a.txt': b'abcd', 'data/b/c.txt': b'abcdef'}
+
+
+@pytest.mark.parametrize('archive_format', ['tar', 'zip'])
+def test_open_archive_outside_root(sip_dir, tmp_path, archive_format):
+    """Test that members outside the SIP directory are ignored."""
+    (sip_dir / 'README').write_bytes(b'readme')
+    (sip_dir / 'other').mkdir()
+    (sip_dir / 'other' / 'd.txt').write_bytes(b'd')
+    archive_path = shutil.make_archive(
+        str(tmp_path / 'archive'), archive_format, root_dir=str(sip_dir))
+
+    with open_archive(archive_path) as archive:
+        assert archive.sizes() == {
+            name: len(content) for name, content in FILES.items()}
+
+
+def test_open_archive_errors(sip_dir, tmp_path):
+    """Test that archives without mets.xml and other files are rejected."""
+    (sip_dir / 'sip' / 'mets.xml').unlink()
+    (sip_dir / 'sip' / 'data' / 'mets.xml').unlink()
+    archive_path = shutil.make_archive(
+        str(tmp_path / 'archive'), 'tar', root_dir=str(sip_dir))
+    with pytest.raises(ArchiveError):
+        open_archive(archive_path)
+    with pytest.raises(ArchiveError):
+        open_archive(str(sip_dir / 'sip' / 'data' / 'a.txt'))
@@ -0,0 +1,93 @@
+"""Tests for ipt.fixity.cache module."""
+
+import os
+import time
+
+import pytest
+
+import ipt.fixity.cache
+from ipt.fixity.cache import FixityCache, parse_trust, same_file_state
+
+DIGEST = 'e80b5017098950fc58aad83c8c14978e'
+
+
+@pytest.fixture
+def payload(tmp_path):
+    """Create a file which was last modified an hour ago."""
+    path = tmp_path / 'payload.txt'
+    path.write_bytes(b'abcdef')
+    modified = time.time() - 3600
+    os.utime(path, (modified, modified))
+    return path
+
+
+@pytest.mark.parametrize(('value', 'max_age'), [
+    ('always', None),
+    ('never', 0),
+    ('24', 24 * 3600),
+    ('0.5', 1800)
+])
+def test_parse_trust(value, max_age):
+    """Test parsing cache trust settings."""
+    assert parse_trust(value) == max_age
+
+
+@pytest.mark.parametrize('value', ['sometimes', '-1'])
+def test_parse_trust_invalid(value):
+    """Test that invalid cache trust settings raise ValueError."""
+    with pytest.raises(ValueError):
+        parse_trust(value)
+
+
+def test_store_and_lookup(tmp_path, payload):
+    """Test that stored digests are found in later runs."""
+    cache_path = str(tmp_path / 'cache.db')
+    with FixityCache(cache_path) as cache:
+        assert cache.lookup(os.stat(payload), 'MD5') is None
+        cache.store(os.stat(payload), 'MD5', DIGEST)
+
+    with FixityCache(cache_path) as cache:
+        assert cache.lookup(os.stat(payload), 'md5') == DIGEST
+        assert cache.lookup(os.stat(payload), 'SHA-256') is None
+
+
+def test_modified_file(tmp_path, payload):
+    """Test that cached digests are not used for modified files."""
+    with FixityCache(str(tmp_path / 'cache.db')) as cache:
+        stat_before = os.stat(payload)
+        cache.store(stat_before, 'MD5', DIGEST)
+
+        payload.write_bytes(b'abcdeg')
+        modified = time.time() - 1800
+        os.utime(payload, (modified, modified))
+
+        assert not same_file_state(stat_before, os.stat(payload))
+        assert cache.lookup(os.stat(payload), 'MD5') is None
+
+
+def test_recently_modified_file(tmp_path):
+    """Test that digests of files modified right before hashing are not
+    stored."""
+    path = tmp_path / 'payload.txt'
+    path.write_bytes(b'abcdef')
+    with FixityCache(str(tmp_path / 'cache.db')) as cache:
+        cache.store(os.stat(path), 'MD5', DIGEST)
+        assert cache.lookup(os.stat(path), 'MD5') is None
+
+
+def test_trust(tmp_path, payload, monkeypatch):
+    """Test that cached digests are trusted only for the given time."""
+    cache_path = str(tmp_path / 'cache.db')
+    with FixityCache(cache_path) as cache:
+        cache.store(os.stat(payload), 'MD5', DIGEST)
+
+    with FixityCache(cache_path, max_age=0) as cache:
+        assert cache.lookup(os.stat(payload), 'MD5') is None
+
+    with FixityCache(cache_path, max_age=3600) as cache:
+        assert cache.lookup(os.stat(payload), 'MD5') is not None
+
+        now = time.time()
+        monkeypatch.setattr(ipt.fixity.cache.time, 'time',
+                            lambda: now + 7200)
+        assert cache.lookup(os.stat(payload), 'MD5') is None
@@ -0,0 +1,80 @@
+"""Tests for ipt.fixity.hashing module."""
+
+import hashlib
+import io
+
+import pytest
+
+from ipt.fixity.hashing import HashingReader, hexdigest, hexdigests, \
+    normalize_algorithm
+
+CONTENT = bytes(range(256)) * 1000
+
+
+@pytest.mark.parametrize(('algorithm', 'expected'), [
+    ('MD5', 'md5'),
+    ('SHA-1', 'sha1'),
+    ('SHA-256', 'sha256'),
+    ('sha512', 'sha512')
+])
+def test_normalize_algorithm(algorithm, expected):
+    """Test converting PREMIS algorithm names to hashlib names."""
+    assert normalize_algorithm(algorithm) == expected
+
+
+@pytest.mark.parametrize('buffer_size', [1, 1000, 4096, 8 * 1024 * 1024])
+@pytest.mark.parametrize('mmap_threshold', [0, 1024 * 1024])
+@pytest.mark.parametrize('algorithm', ['MD5', 'SHA-256'])
+def test_hexdigest(tmp_path, buffer_size, mmap_threshold, algorithm):
+    """Test that digests match hashlib with all read strategies."""
+    path = tmp_path / 'payload.bin'
+    path.write_bytes(CONTENT)
+
+    expected = hashlib.new(normalize_algorithm(algorithm), CONTENT)
+    assert hexdigest(str(path), algorithm, buffer_size=buffer_size,
+                     mmap_threshold=mmap_threshold) == expected.hexdigest()
+
+
+@pytest.mark.parametrize('mmap_threshold', [0, 1024])
+def test_hexdigest_empty_file(tmp_path, mmap_threshold):
+    """Test hashing an empty file, which cannot be mapped."""
+    path = tmp_path / 'empty.bin'
+    path.write_bytes(b'')
+    assert hexdigest(str(path), mmap_threshold=mmap_threshold) == \
+        hashlib.md5(b'').hexdigest()
+
+
+def test_hexdigest_missing_file(tmp_path):
+    """Test that a missing file raises OSError."""
+    with pytest.raises(OSError):
+        hexdigest(str(tmp_path / 'missing.bin'))
+
+
+def test_hexdigests(tmp_path, monkeypatch):
+    """Test that several digests are computed from a single read."""
+    path = tmp_path / 'payload.bin'
+    path.write_bytes(CONTENT)
+
+    opened = []
+    original_open = open
+
+    def _open(*args, **kwargs):
+        opened.append(args[0])
+        return original_open(*args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', _open)
+    digests = hexdigests(str(path), ['SHA-256', 'MD5'], buffer_size=1000)
+    assert digests == {'SHA-256': hashlib.sha256(CONTENT).hexdigest(),
+                       'MD5': hashlib.md5(CONTENT).hexdigest()}
+    assert opened == [str(path)]
+
+
+def test_hashing_reader():
+    """Test that data is hashed as it is read through the wrapper."""
+    reader = HashingReader(io.BytesIO(CONTENT), ['md5', 'SHA-256'])
+    data = reader.read(1000) + reader.read()
+    assert data == CONTENT
+    assert reader.size == len(CONTENT)
+    assert reader.hexdigests() == {
+        'md5': hashlib.md5(CONTENT).hexdigest(),
+        'SHA-256': hashlib.sha256(CONTENT).hexdigest()}
@@ -0,0 +1,35 @@
+"""Tests for ipt.fixity.layout module."""
+
+import os
+
+import pytest
+
+from ipt.fixity.layout import (READ_ORDER_EXTENT, READ_ORDER_INODE,
+                               physical_offset, read_order_key)
+
+
+def test_physical_offset(tmp_path):
+    """Test querying physical offset of files. File systems that do not
+    support FIEMAP return None for all files."""
+    path = tmp_path / 'payload.bin'
+    path.write_bytes(b'abcdef' * 10000)
+    offset = physical_offset(str(path))
+    assert offset is None or offset >= 0
+
+    empty = tmp_path / 'empty.bin'
+    empty.write_bytes(b'')
+    assert physical_offset(str(empty)) is None
+    assert physical_offset(str(tmp_path / 'missing.bin')) is None
+
+
+@pytest.mark.parametrize('read_order', [READ_ORDER_INODE, READ_ORDER_EXTENT])
+def test_read_order_key(tmp_path, read_order):
+    """Test that missing files are sorted after existing files."""
+    path = tmp_path / 'payload.bin'
+    path.write_bytes(b'abcdef')
+    missing = tmp_path / 'missing.bin'
+
+    keys = sorted([read_order_key(str(missing), read_order),
+                   read_order_key(str(path), read_order)])
+    assert keys[0][-1] == os.stat(str(path)).st_ino
+    assert keys[1] == read_order_key(str(missing), read_order)
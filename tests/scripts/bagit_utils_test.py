@@ -1,10 +1,13 @@
 """tests for bagit_util-commandline interface."""
 import shutil
+import tarfile
 
 import pytest
 
+import ipt.aiptools.bagit
 from ipt.aiptools.bagit import BagitError
 from ipt.scripts.bagit_util import main
+import tests.testcommon.shell
 
 
 def test_main(bagit_no_manifest_fx, manifest_fx):
@@ -17,6 +20,15 @@ def test_main(bagit_no_manifest_fx, manifest_fx):
         assert manifest_fx == infile.read()
 
 
+def test_main_workers(bagit_no_manifest_fx, manifest_fx):
+    """Test that manifest does not depend on the number of threads."""
+    assert main(['make_manifest', '--workers', '4',
+                 str(bagit_no_manifest_fx)]) == 0
+
+    manifest_path = bagit_no_manifest_fx / 'manifest-md5.txt'
+    assert manifest_path.read_bytes() == manifest_fx
+
+
 def test_main_missing_datadir(bagit_no_manifest_fx):
     """Test command line utility with missing data directory"""
     shutil.rmtree(bytes(bagit_no_manifest_fx / "data"))
@@ -25,3 +37,165 @@ def test_main_missing_datadir(bagit_no_manifest_fx):
 
     manifest_path = bagit_no_manifest_fx / 'manifest-md5.txt'
     assert not manifest_path.exists()
+
+
+def test_main_check_fixity(temp_sip, tmp_path, monkeypatch):
+    """Test that fixity of the SIP is checked while making the manifest and
+    that files checked are not read again."""
+    bagit_path = tmp_path / 'bagit'
+    sip_path = bagit_path / 'data' / 'transfers' / 'sip'
+    sip_path.parent.mkdir(parents=True)
+    shutil.copytree(temp_sip('valid_1.7.1_image'), str(sip_path))
+
+    hashed = []
+    calculate_digests = ipt.aiptools.bagit.calculate_digests
+    monkeypatch.setattr(
+        'ipt.aiptools.bagit.calculate_digests',
+        lambda path, algorithms: hashed.append(path) or calculate_digests(
+            path, algorithms))
+
+    assert main(['make_manifest', str(bagit_path), '-a', 'md5',
+                 '-a', 'sha256', '--check-fixity', str(sip_path)]) == 0
+    manifests = [(bagit_path / name).read_bytes()
+                 for name in ('manifest-md5.txt', 'manifest-sha256.txt')]
+    assert b' data/transfers/sip/data/valid_1.2.png\n' in manifests[0]
+    assert not any(path.endswith(b'valid_1.2.png') for path in hashed)
+
+    # Manifests are equal to ones created without checking fixity
+    (bagit_path / 'manifest-md5.txt').unlink()
+    (bagit_path / 'manifest-sha256.txt').unlink()
+    assert main(['make_manifest', str(bagit_path), '-a', 'md5',
+                 '-a', 'sha256']) == 0
+    assert [(bagit_path / name).read_bytes()
+            for name in ('manifest-md5.txt', 'manifest-sha256.txt')] == \
+        manifests
+
+
+def test_main_check_fixity_error(temp_sip, tmp_path):
+    """Test that manifest is not written if fixity check fails."""
+    bagit_path = tmp_path / 'bagit'
+    sip_path = bagit_path / 'data' / 'transfers' / 'sip'
+    sip_path.parent.mkdir(parents=True)
+    shutil.copytree(temp_sip('valid_1.7.1_image'), str(sip_path))
+    (sip_path / 'data' / 'valid_1.2.png').write_bytes(b'a')
+
+    (returncode, stdout, _) = tests.testcommon.shell.run_main(
+        main, ['make_manifest', str(bagit_path),
+               '--check-fixity', str(sip_path)])
+    assert returncode == 117
+    assert 'Invalid Checksum: data/valid_1.2.png' in stdout
+    assert not (bagit_path / 'manifest-md5.txt').exists()
+
+
+def test_main_incremental(bagit_with_manifest_fx, manifest_fx):
+    """Test updating existing manifest incrementally."""
+    bagit_path = str(bagit_with_manifest_fx)
+    (returncode, stdout, _) = tests.testcommon.shell.run_main(
+        main, ['make_manifest', '--incremental', bagit_path])
+    assert returncode == 0
+    assert 'deleted: 0' in stdout
+    assert (bagit_with_manifest_fx / 'manifest-md5.txt').read_bytes() == \
+        manifest_fx
+
+
+def test_main_trust_mets(temp_sip, tmp_path, monkeypatch):
+    """Test that digests given in METS are used without hashing the files
+    and that this is recorded in bag-info.txt."""
+    bagit_path = tmp_path / 'bagit'
+    sip_path = bagit_path / 'data' / 'transfers' / 'sip'
+    sip_path.parent.mkdir(parents=True)
+    shutil.copytree(temp_sip('valid_1.7.1_image'), str(sip_path))
+    assert main(['make_manifest', str(bagit_path)]) == 0
+    manifest = (bagit_path / 'manifest-md5.txt').read_bytes()
+
+    hashed = []
+    calculate_digests = ipt.aiptools.bagit.calculate_digests
+    monkeypatch.setattr(
+        'ipt.aiptools.bagit.calculate_digests',
+        lambda path, algorithms: hashed.append(path) or calculate_digests(
+            path, algorithms))
+    assert main(['make_manifest', str(bagit_path),
+                 '--trust-mets', str(sip_path)]) == 0
+    assert (bagit_path / 'manifest-md5.txt').read_bytes() == manifest
+    assert sorted(hashed) == [bytes(sip_path / 'mets.xml'),
+                              bytes(sip_path / 'signature.sig')]
+    bag_info = (bagit_path / 'bag-info.txt').read_text()
+    assert bag_info.startswith('Payload-Digest-Source: Digests of 1 files')
+    assert 'data/transfers/sip/mets.xml' in bag_info
+
+    # The record is removed when all files are hashed again
+    assert main(['make_manifest', str(bagit_path)]) == 0
+    assert not (bagit_path / 'bag-info.txt').exists()
+
+
+def test_main_algorithms(bagit_no_manifest_fx, manifest_fx):
+    """Test writing manifests and tag manifests of several algorithms."""
+    bagit_path = str(bagit_no_manifest_fx)
+    assert main(['make_manifest', bagit_path, '--algorithm', 'MD5',
+                 '--algorithm', 'SHA-512', '--tagmanifests']) == 0
+    assert sorted(path.name for path in bagit_no_manifest_fx.iterdir()) == [
+        'bagit.txt', 'data', 'manifest-md5.txt', 'manifest-sha512.txt',
+        'tagmanifest-md5.txt', 'tagmanifest-sha512.txt']
+    assert (bagit_no_manifest_fx / 'manifest-md5.txt').read_bytes() == \
+        manifest_fx
+
+    with pytest.raises(SystemExit):
+        main(['make_manifest', bagit_path, '--incremental',
+              '--algorithm', 'sha512'])
+    # Unknown algorithm, and algorithm not allowed in manifest file names
+    for algorithm in ('nosuchhash', 'sha3_256'):
+        with pytest.raises(SystemExit):
+            main(['make_manifest', bagit_path, '--algorithm', algorithm])
+        with pytest.raises(SystemExit):
+            main(['export-tar', bagit_path, '-', '--algorithm', algorithm])
+
+    # Incremental update would leave sha512 manifest stale
+    (returncode, _, stderr) = tests.testcommon.shell.run_main(
+        main, ['make_manifest', bagit_path, '--incremental'])
+    assert returncode == 1
+    assert 'manifest-md5.txt' in stderr
+
+    # Manifests of algorithms not written are removed
+    assert main(['make_manifest', bagit_path, '-a', 'sha512']) == 0
+    assert sorted(path.name for path in bagit_no_manifest_fx.iterdir()) == [
+        'bagit.txt', 'data', 'manifest-sha512.txt']
+
+
+def test_main_export_tar(bagit_no_manifest_fx, manifest_fx, tmp_path):
+    """Test exporting bag as a tar archive to a file."""
+    tar_path = tmp_path / 'bag.tar'
+    assert main(['export-tar', str(bagit_no_manifest_fx),
+                 str(tar_path)]) == 0
+    with tarfile.open(str(tar_path)) as tar:
+        names = tar.getnames()
+        assert names[-2].endswith('/manifest-md5.txt')
+        assert names[-1].endswith('/bagit.txt')
+        assert tar.extractfile(names[-2]).read() == manifest_fx
+    assert not (bagit_no_manifest_fx / 'manifest-md5.txt').exists()
+
+
+def test_main_verify(bagit_with_manifest_fx):
+    """Test verifying bagit from command line."""
+    bagit_path = str(bagit_with_manifest_fx)
+    assert main(['verify', bagit_path]) == 0
+
+    for path in (bagit_with_manifest_fx / 'data').glob('**/mets.xml'):
+        path.write_bytes(b'corrupted')
+    (bagit_with_manifest_fx / 'data' / 'extra.txt').write_bytes(b'extra')
+
+    (returncode, stdout, _) = tests.testcommon.shell.run_main(
+        main, ['verify', '--workers', '2', bagit_path])
+    assert returncode == 117
+    assert len(stdout.splitlines()) == 2
+    assert 'Nonlisted file: data/extra.txt' in stdout
+
+    (returncode, stdout, _) = tests.testcommon.shell.run_main(
+        main, ['verify', '--fail-fast', bagit_path])
+    assert returncode == 117
+    assert len(stdout.splitlines()) == 1
+    assert stdout.startswith('Invalid checksum: ')
+
+
+def test_main_no_command():
+    """Test that a command must be given."""
+    assert main([]) == 1
@@ -1,6 +1,8 @@
 """Test the ipt.scripts.check_digital_objects module"""
 # TODO add proper testing plan
 
+import io
+import json
 import os
 import uuid
 
@@ -8,8 +10,6 @@ import lxml.etree as ET
 import pytest
 import premis
 
-import xml_helpers
-
 from file_scraper.iterator import iter_detectors
 from file_scraper.scraper import Scraper
 from file_scraper.defaults import (
@@ -30,7 +30,9 @@ from ipt.scripts.check_sip_digital_objects import (main,
                                                    validation,
                                                    validation_report,
                                                    make_result_dict,
-                                                   join_validation_results)
+                                                   join_validation_results,
+                                                   write_comparison_errors)
+from ipt.comparator.comparator import ComparisonError
 import ipt.scripts.check_sip_digital_objects
 from ipt.scripts.create_schema_catalog import main as schema_main
 
@@ -379,8 +381,8 @@ def test_native_marked(md_info, use, grade, is_valid, monkeypatch):
         _iter_metadata_info
     )
     monkeypatch.setattr(
-        xml_helpers.utils,
-        'readfile',
+        ipt.scripts.check_sip_digital_objects,
+        'read_mets',
         lambda *args: "mock"
     )
 
@@ -434,8 +436,8 @@ def patch_scraper_identify(mimetype='', version=''):
 def test_metadata_info_erros(monkeypatch):
     """Test that when mets has errors, other validation steps are skipped."""
     monkeypatch.setattr(
-        xml_helpers.utils,
-        'readfile',
+        ipt.scripts.check_sip_digital_objects,
+        'read_mets',
         lambda *args: "mock"
     )
 
@@ -470,3 +472,28 @@ def test_join_validation_results():
     assert joined2['messages'] == 'message1\nvalid'
     assert not joined2['errors']
     assert joined2['extensions'] == [extension1]
+
+
+def test_write_comparison_errors():
+    """Test that comparison errors of a file are written as a JSON line,
+    and nothing is written for files without them."""
+    error = ComparisonError('Bit rate differs', [{'bit_rate': 200}],
+                            [{'bit_rate': 100}])
+    result = join_validation_results(
+        {'filename': 'sip/data/a.wav', 'relpath': 'data/a.wav'},
+        [make_result_dict(True),
+         make_result_dict(False, comparison_errors=[error])])
+    assert result['comparison_errors'] == [error]
+
+    outfile = io.StringIO()
+    write_comparison_errors(result, outfile)
+    write_comparison_errors(
+        join_validation_results({}, [make_result_dict(True)]), outfile)
+    lines = outfile.getvalue().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0]) == {
+        'filename': 'sip/data/a.wav',
+        'relpath': 'data/a.wav',
+        'errors': [{'error': 'Bit rate differs',
+                    'mets': [{'bit_rate': 200}],
+                    'scraper': [{'bit_rate': 100}]}]}
@@ -1,10 +1,14 @@
 """Test the `ipt.scripts.test_sip_file_checksums` module"""
 
+import json
 import os
+import shutil
+
+import pytest
 
 from ipt.utils import ensure_text
 
-from ipt.scripts.check_sip_file_checksums import main
+from ipt.scripts.check_sip_file_checksums import iter_relpaths, main
 import tests.testcommon.shell
 
 
@@ -135,3 +139,210 @@ def test_uppercase_checksum(temp_sip):
     assert 'Checksum OK: data/valid__iso8859.txt' in stdout
     assert 'tmp' not in stdout
     assert returncode == 0
+
+
+def test_checksum_workers(temp_sip):
+    """Test that hashing with multiple threads reports the same results in
+    the same order as hashing in a single thread."""
+
+    sip_path = temp_sip('valid_1.7.1_multiple_objects')
+    corrupted_file = os.path.join(sip_path, 'data/valid_1.mp3')
+    with open(corrupted_file, 'w') as outfile:
+        outfile.write('a')
+
+    expected = run_main(sip_path)
+    (returncode, stdout, stderr) = tests.testcommon.shell.run_main(
+        main, ['--workers', '4', sip_path])
+
+    assert stderr == ''
+    assert 'Invalid Checksum: data/valid_1.mp3' in stdout
+    assert (returncode, stdout, stderr) == expected
+
+
+def test_checksum_fixity_cache(temp_sip, tmp_path):
+    """Test that digests of unchanged files are read from the fixity cache
+    unless rehashing is requested."""
+
+    sip_path = temp_sip('valid_1.7.1_image')
+    cache_args = ['--fixity-cache', str(tmp_path / 'fixity.db')]
+    (returncode, stdout, _) = tests.testcommon.shell.run_main(
+        main, cache_args + [sip_path])
+    assert 'Checksum OK: data/valid_1.2.png' in stdout
+    assert returncode == 0
+
+    # Corrupt the file without changing its size or modification time, so
+    # that the cached digest is still used
+    corrupted_file = os.path.join(sip_path, 'data/valid_1.2.png')
+    stat_result = os.stat(corrupted_file)
+    with open(corrupted_file, 'r+b') as outfile:
+        outfile.write(b'a')
+    os.utime(corrupted_file, ns=(stat_result.st_atime_ns,
+                                 stat_result.st_mtime_ns))
+
+    (returncode, stdout, _) = tests.testcommon.shell.run_main(
+        main, cache_args + [sip_path])
+    assert 'Checksum OK: data/valid_1.2.png' in stdout
+    assert returncode == 0
+
+    for extra_args in (['--rehash'], ['--cache-trust', 'never']):
+        (returncode, stdout, _) = tests.testcommon.shell.run_main(
+            main, cache_args + extra_args + [sip_path])
+        assert 'Invalid Checksum: data/valid_1.2.png' in stdout
+        assert returncode == 117
+
+
+def test_checksum_file_size(temp_sip):
+    """Test that files with a size different from the size given in PREMIS
+    are reported without hashing them."""
+
+    sip_path = temp_sip('valid_1.7.1_image')
+    mets_path = os.path.join(sip_path, 'mets.xml')
+    with open(mets_path, encoding='utf-8') as infile:
+        mets = infile.read()
+    with open(mets_path, 'w', encoding='utf-8') as outfile:
+        outfile.write(mets.replace(
+            '</premis:fixity>',
+            '</premis:fixity><premis:size>272</premis:size>', 1))
+
+    (returncode, stdout, _) = run_main(sip_path)
+    assert 'Checksum OK: data/valid_1.2.png' in stdout
+    assert returncode == 0
+
+    truncated_file = os.path.join(sip_path, 'data/valid_1.2.png')
+    with open(truncated_file, 'r+b') as outfile:
+        outfile.truncate(100)
+
+    (returncode, stdout, _) = run_main(sip_path)
+    assert 'Invalid file size: data/valid_1.2.png' in stdout
+    assert 'Checksum' not in stdout
+    assert returncode == 117
+
+
+@pytest.mark.parametrize('read_order', ['inode', 'extent'])
+def test_checksum_read_order(temp_sip, read_order):
+    """Test that reading files in physical order reports the same results
+    in METS order."""
+
+    sip_path = temp_sip('valid_1.7.1_multiple_objects')
+    corrupted_file = os.path.join(sip_path, 'data/valid_1.mp3')
+    with open(corrupted_file, 'w') as outfile:
+        outfile.write('a')
+
+    expected = run_main(sip_path)
+    for workers in ('1', '4'):
+        assert tests.testcommon.shell.run_main(
+            main, ['--read-order', read_order, '--workers', workers,
+                   sip_path]) == expected
+
+
+def test_iter_relpaths(tmp_path):
+    """Test scanning relative paths of files, ignoring METS and signature
+    files at the top level only."""
+    create_files(str(tmp_path), [
+        'mets.xml.file', 'empty_dir', 'data/a.file', 'data/b/c.file',
+        'data/mets.xml.file'])
+    os.rename(str(tmp_path / 'mets.xml.file'), str(tmp_path / 'mets.xml'))
+    os.rename(str(tmp_path / 'data/mets.xml.file'),
+              str(tmp_path / 'data/mets.xml'))
+    os.symlink(str(tmp_path / 'data'), str(tmp_path / 'link'))
+
+    assert sorted(iter_relpaths(str(tmp_path))) == [
+        'data/a.file', 'data/b/c.file', 'data/mets.xml']
+
+
+@pytest.mark.parametrize('archive_format', ['tar', 'zip'])
+def test_checksum_archive(temp_sip, tmp_path, archive_format):
+    """Test that SIP archives are checked without extracting them and that
+    the results are the same as for the extracted SIP."""
+
+    sip_path = temp_sip('invalid_1.7.1_extra_object')
+    corrupted_file = os.path.join(sip_path, 'data/valid_A-1a.pdf')
+    with open(corrupted_file, 'w') as outfile:
+        outfile.write('a')
+    expected = run_main(sip_path)
+    assert expected[0] == 117
+
+    archive_path = shutil.make_archive(
+        str(tmp_path / 'sip'), archive_format,
+        root_dir=os.path.dirname(sip_path),
+        base_dir=os.path.basename(sip_path))
+    assert run_main(archive_path) == expected
+
+
+def test_checksum_json_report(temp_sip):
+    """Test that JSON report has a record for each file and a summary."""
+
+    sip_path = temp_sip('invalid_1.7.1_extra_object')
+    corrupted_file = os.path.join(sip_path, 'data/valid_A-1a.pdf')
+    with open(corrupted_file, 'wb') as outfile:
+        outfile.write(b'abcdef')
+
+    (returncode, stdout, stderr) = tests.testcommon.shell.run_main(
+        main, ['--report', 'json', sip_path])
+    assert stderr == ''
+    assert returncode == 117
+
+    records = [json.loads(line) for line in stdout.splitlines()]
+    assert records[0] == {
+        'type': 'file',
+        'relpath': 'data/valid_A-1a.pdf',
+        'algorithm': 'MD5',
+        'expected': records[0]['expected'],
+        'actual': 'e80b5017098950fc58aad83c8c14978e',
+        'status': 'invalid_checksum',
+        'bytes': 6,
+        'hash_time': records[0]['hash_time'],
+        'cached': False}
+    assert records[0]['hash_time'] >= 0
+    assert [(record['relpath'], record['status'])
+            for record in records[1:-1]] == [
+                ('data/valid_1.6.pdf', 'nonlisted'),
+                ('extra_file.txt', 'nonlisted')]
+
+    summary = records[-1]
+    assert summary['type'] == 'summary'
+    assert summary['files'] == 3
+    assert summary['total_bytes'] == 6
+    assert summary['status_counts'] == {'invalid_checksum': 1,
+                                        'nonlisted': 2}
+    assert summary['errors'] == 3
+
+
+def test_checksum_json_report_cached(temp_sip, tmp_path):
+    """Test that files whose digests are taken from the fixity cache are
+    marked as cached and left out of the hashing speed."""
+
+    sip_path = temp_sip('valid_1.7.1_image')
+    args = ['--report', 'json', '--fixity-cache', str(tmp_path / 'fixity.db'),
+            sip_path]
+    (returncode, stdout, _) = tests.testcommon.shell.run_main(main, args)
+    assert returncode == 0
+    summary = json.loads(stdout.splitlines()[-1])
+    assert summary['total_bytes'] > 0
+
+    (returncode, stdout, _) = tests.testcommon.shell.run_main(main, args)
+    assert returncode == 0
+    records = [json.loads(line) for line in stdout.splitlines()]
+    summary = records.pop()
+    assert records
+    for record in records:
+        assert record['status'] == 'ok'
+        assert record['cached']
+        assert record['hash_time'] is None
+    assert summary['total_bytes'] == 0
+
+
+def test_checksum_verbose(temp_sip):
+    """Test that peak memory use after reading METS is written to standard
+    error only with --verbose."""
+    sip_path = temp_sip('valid_1.7.1_image')
+    (returncode, _, stderr) = tests.testcommon.shell.run_main(
+        main, [sip_path])
+    assert returncode == 0
+    assert stderr == ''
+
+    (returncode, _, stderr) = tests.testcommon.shell.run_main(
+        main, ['--verbose', sip_path])
+    assert returncode == 0
+    assert 'DEBUG: Read METS document' in stderr
+    assert 'peak RSS' in stderr
@@ -1,11 +1,18 @@
 """Test for utils.py."""
 
+import logging
 import random
+import threading
+import time
+from fractions import Fraction
+
 import pytest
 
 from ipt.utils import (compare_lists_of_dicts, find_max_complete, merge_dicts,
-                       serialize_dict, uri_to_path,
-                       pair_compatible_list_elements, parse_uri_filepath)
+                       merge_into, serialize_dict, uri_to_path,
+                       pair_compatible_list_elements, parse_uri_filepath,
+                       maximum_bipartite_matching, ordered_map, sorted_map,
+                       handle_div, configure_logging)
 
 CODEC1 = {"codec": "foo"}
 CODEC2 = {"codec": "bar"}
@@ -57,6 +64,30 @@ def test_merge_dicts():
         merge_dicts(FORMAT2, FORMAT3)
 
 
+def test_merge_into():
+    """Test merging dicts in place into an accumulator dict."""
+    result = {'filename': 'sippi', 'format': {'mimetype': None}}
+
+    for _ in range(3):
+        assert merge_into(result, AUDIOMD1) is result
+    assert result['audiomd'] == [CODEC1, CODEC1, CODEC1]
+    # Merged dicts are not modified
+    assert AUDIOMD1 == {'audiomd': [CODEC1]}
+
+    merge_into(result, FORMAT2)
+    assert result['format'] == {'mimetype': 'image/ipeg', 'version': None}
+    assert FORMAT2 == {'format': {'mimetype': 'image/ipeg',
+                                  'version': None}}
+
+    # Conflicting values raise TypeError and leave the result untouched
+    with pytest.raises(TypeError):
+        merge_into(result, {'audiomd': [CODEC2],
+                            'format': {'mimetype': 'image/png'}})
+    assert result == {'filename': 'sippi',
+                      'format': {'mimetype': 'image/ipeg', 'version': None},
+                      'audiomd': [CODEC1, CODEC1, CODEC1]}
+
+
 def test_compare_lists_of_dicts():
     """Test list comparison of dicts."""
     assert compare_lists_of_dicts(None, None)
@@ -206,6 +237,73 @@ def test_pair_compatible_list_elements():
     assert not pair_compatible_list_elements(list_a, list_b, integer_compare)
 
 
+@pytest.mark.parametrize('duplicate', [False, True])
+def test_pair_compatible_list_elements_64_streams(duplicate, monkeypatch):
+    """Test pairing of 64 similar streams, e.g. mono audio channels of an
+    MXF container. Each pair of streams is compared only once, also when
+    pairing fails. Exhaustive backtracking would take exponential time when
+    the streams cannot be paired."""
+    calls = []
+    matchings = []
+
+    def channel_compare(stream_a, stream_b):
+        """Streams differ only by channel, which is unknown in some"""
+        calls.append((stream_a, stream_b))
+        return stream_a == stream_b or '(:unav)' in (stream_a, stream_b)
+
+    def matching(adjacency, size_b):
+        """Record that the matching is computed"""
+        matchings.append(adjacency)
+        return maximum_bipartite_matching(adjacency, size_b)
+
+    monkeypatch.setattr('ipt.utils.maximum_bipartite_matching', matching)
+    list_a = ['(:unav)'] * 62 + ['channel 62', 'channel 63']
+    if duplicate:
+        # Every stream has a candidate, but two streams compete for the
+        # same single candidate
+        list_a[63] = 'channel 62'
+    list_b = [f'channel {index}' for index in range(64)]
+    random.seed(1)
+    random.shuffle(list_b)
+
+    index_pairs = pair_compatible_list_elements(
+        list_a, list_b, channel_compare)
+
+    if duplicate:
+        assert index_pairs == set()
+    else:
+        assert len(index_pairs) == 64
+        assert len({idx_b for _, idx_b in index_pairs}) == 64
+        assert (62, list_b.index('channel 62')) in index_pairs
+        assert (63, list_b.index('channel 63')) in index_pairs
+    assert len(matchings) == 1
+    assert len(calls) == 64 * 64
+
+
+@pytest.mark.parametrize('size', [2, 64, 5000])
+def test_maximum_bipartite_matching_augmenting_path(size):
+    """Test that the matching is completed along an augmenting path through
+    all vertices. Vertex i of the first part can be matched with vertices i
+    and i + 1, except the last vertex only with vertex 0, so the first
+    matching found must be shifted by one along the whole path."""
+    adjacency = [[idx, idx + 1] for idx in range(size - 1)] + [[0]]
+    pairs = maximum_bipartite_matching(adjacency, size)
+    assert pairs == {idx: (idx + 1) % size for idx in range(size)}
+
+    # When the last vertex of the second part cannot be matched, the
+    # alternating path ends without augmenting the matching
+    adjacency[-2] = [size - 2]
+    assert len(maximum_bipartite_matching(adjacency, size)) == size - 1
+
+
+def test_maximum_bipartite_matching():
+    """Test that a maximum matching is found also when the greedy choice
+    must be undone."""
+    assert maximum_bipartite_matching([], 0) == {}
+    assert maximum_bipartite_matching([[0, 1], [0]], 2) == {0: 1, 1: 0}
+    assert len(maximum_bipartite_matching([[0], [0], [1, 2]], 3)) == 2
+
+
 @pytest.mark.parametrize('case', [
     'file:/data/local.xsd',
     'file://data/local.xsd',
@@ -228,3 +326,85 @@ def test_parse_uri_filepath_error():
     with pytest.raises(ValueError):
         parse_uri_filepath(uri_path='file:///does-not-exist.txt',
                            accepted_schemes=('http',))
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_ordered_map(workers):
+    """Test that results are yielded in the order of the items, even if
+    they are completed in another order.
+    """
+    thread_names = set()
+
+    def _function(item):
+        thread_names.add(threading.current_thread().name)
+        time.sleep(random.random() / 1000)
+        return item * 2
+
+    results = list(ordered_map(_function, iter(range(100)), workers))
+    assert results == [item * 2 for item in range(100)]
+    if workers == 1:
+        assert thread_names == {threading.current_thread().name}
+    else:
+        assert threading.current_thread().name not in thread_names
+
+
+def test_ordered_map_error():
+    """Test that exceptions raised by the function are propagated."""
+
+    def _function(item):
+        if item == 5:
+            raise ValueError('Failed')
+        return item
+
+    with pytest.raises(ValueError):
+        list(ordered_map(_function, range(10), workers=2))
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_sorted_map(workers):
+    """Test that items are processed in the order given by the key and the
+    results are yielded in the original order of the items."""
+    items = list(range(100))
+    random.shuffle(items)
+    processed = []
+
+    def _function(item):
+        processed.append(item)
+        return item * 2
+
+    results = list(sorted_map(_function, items, key=lambda item: item,
+                              workers=workers))
+    assert results == [item * 2 for item in items]
+    if workers == 1:
+        assert processed == sorted(items)
+
+
+@pytest.mark.parametrize('value', [
+    '16/9', '25/1', '1/0', '48000', '1.7777778', '0.005', '2.675', '-0',
+    '-.0', '5.', '+.5e-3', '1e3', ' 3 ', '1 / 2', '1_000', '\u0663',
+    '1' * 40, '', '.', 'AAC', 'Lavf56.40.101', '(:unav)', 'PT0.86S', 0, 1.5
+])
+@pytest.mark.parametrize('decimals', [0, 2])
+def test_handle_div(value, decimals):
+    """Test that the fast paths of handle_div give exactly the same results
+    as converting any value with Fraction."""
+    try:
+        expected = ('%.2f' % round(float(Fraction(value)), decimals)
+                    ).rstrip('0').rstrip('.')
+    except (ValueError, ZeroDivisionError):
+        expected = value
+    assert handle_div(value, decimals) == expected
+    # Cached result is the same
+    assert handle_div(value, decimals) == expected
+
+
+def test_configure_logging(capsys):
+    """Test that debug messages are written to standard error only if
+    verbose."""
+    logger = logging.getLogger('ipt.test')
+    configure_logging()
+    logger.debug('hidden')
+    logger.warning('shown')
+    configure_logging(verbose=True)
+    logger.debug('debug')
+    assert capsys.readouterr().err == 'WARNING: shown\nDEBUG: debug\n'
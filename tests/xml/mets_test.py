@@ -0,0 +1,113 @@
+"""Tests for ipt.xml.mets module."""
+
+import logging
+import os
+import subprocess
+import sys
+
+import lxml.etree as ET
+
+from ipt.xml.mets import MEMORY_BUDGET_PER_MB, parse_spec_version, read_mets
+from tests.testcommon.settings import PROJECTDIR, TESTDATADIR
+
+# Measure the growth of peak RSS caused by reading the METS document in a
+# separate process, so that memory used by the test session does not
+# interfere with the measurement.
+MEASURE_SCRIPT = """
+import sys
+from ipt.xml.mets import peak_rss, read_mets
+before = peak_rss()
+mets_tree = read_mets(sys.argv[1])
+print(peak_rss() - before)
+"""
+
+
+def write_mets(path, file_count):
+    """Write a METS document with a techMD and a file for each file."""
+    with open(path, 'w', encoding='utf-8') as outfile:
+        outfile.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<mets:mets xmlns:mets="http://www.loc.gov/METS/" '
+            'xmlns:xlink="http://www.w3.org/1999/xlink">\n'
+            '  <mets:amdSec>\n')
+        for index in range(file_count):
+            outfile.write(
+                f'    <mets:techMD ID="tech{index}">\n'
+                '      <mets:mdWrap MDTYPE="PREMIS:OBJECT">\n'
+                '        <mets:xmlData>\n'
+                '          <!-- Comment -->\n'
+                f'          <object>{index:032x}</object>\n'
+                '        </mets:xmlData>\n'
+                '      </mets:mdWrap>\n'
+                '    </mets:techMD>\n')
+        outfile.write('  </mets:amdSec>\n'
+                      '  <mets:fileSec>\n'
+                      '    <mets:fileGrp>\n')
+        for index in range(file_count):
+            outfile.write(
+                f'      <mets:file ID="file{index}" ADMID="tech{index}">\n'
+                '        <mets:FLocat LOCTYPE="URL" '
+                f'xlink:href="file://data/file_{index}.txt"/>\n'
+                '      </mets:file>\n')
+        outfile.write('    </mets:fileGrp>\n'
+                      '  </mets:fileSec>\n'
+                      '</mets:mets>\n')
+
+
+def test_read_mets(tmp_path):
+    """Test that comments, processing instructions and blank text are
+    dropped when METS is read.
+    """
+    mets_path = tmp_path / 'mets.xml'
+    mets_path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<!-- Comment -->\n'
+        '<mets:mets xmlns:mets="http://www.loc.gov/METS/">\n'
+        '  <?processing instruction?>\n'
+        '  <mets:metsHdr>\n'
+        '    <mets:agent/>\n'
+        '  </mets:metsHdr>\n'
+        '  <!-- Comment -->\n'
+        '</mets:mets>\n', encoding='utf-8')
+
+    mets_tree = read_mets(str(mets_path))
+
+    assert not mets_tree.xpath('//comment()')
+    assert not mets_tree.xpath('//processing-instruction()')
+    assert ET.tostring(mets_tree) == (
+        b'<mets:mets xmlns:mets="http://www.loc.gov/METS/">'
+        b'<mets:metsHdr><mets:agent/></mets:metsHdr></mets:mets>')
+
+
+def test_read_mets_spec_version():
+    """Test reading the specification version of a METS document."""
+    mets_tree = read_mets(os.path.join(TESTDATADIR, 'xml',
+                                       'valid_1.7.1_mets.xml'))
+    assert parse_spec_version(mets_tree.getroot()) == '1.7.1'
+
+
+def test_memory_budget(tmp_path):
+    """Test that reading a large METS document stays within the documented
+    memory budget.
+    """
+    mets_path = tmp_path / 'mets.xml'
+    write_mets(str(mets_path), 10000)
+    mets_size_kb = os.path.getsize(mets_path) / 1024
+
+    rss_growth_kb = int(subprocess.check_output(
+        [sys.executable, '-c', MEASURE_SCRIPT, str(mets_path)],
+        cwd=PROJECTDIR))
+
+    assert rss_growth_kb <= MEMORY_BUDGET_PER_MB * mets_size_kb
+
+
+def test_read_mets_logging(tmp_path, caplog):
+    """Test that peak memory use is logged at debug level."""
+    mets_path = tmp_path / 'mets.xml'
+    write_mets(str(mets_path), 1)
+    caplog.set_level(logging.DEBUG, logger='ipt.xml.mets')
+
+    read_mets(str(mets_path))
+
+    assert [record.levelno for record in caplog.records] == [logging.DEBUG]
+    assert 'peak RSS' in caplog.text